@@ -1,13 +1,27 @@
-from flask import Flask, render_template, request, flash, jsonify
+from flask import Flask, render_template, request, flash, jsonify, g, stream_with_context
 from flask_cors import CORS
 import requests
 import os
 from dotenv import load_dotenv
-from datetime import datetime, timedelta, timezone
-import json
-import time
+from datetime import datetime
 import hashlib
 import traceback
+import threading
+import time
+from collections import namedtuple
+from city_index import CityIndex
+from city_store import load_city_store
+from geo_index import NearestCity
+import metrics
+import upstream
+from weather_cache import WeatherCache, create_cache, location_key
+from single_flight import SingleFlight
+from cache_refresh import RefreshFailed, Revalidator
+from encoded_response import EncodedResponse, RawJSON, encode_json
+from forecast import (
+    FAVORITE_DAYS, FAVORITE_HOURS, convert_units, forecast_view, from_current_and_forecast, from_one_call
+)
+from forecast_batch import MIN_BATCH_ITEMS, from_one_call_batch
 
 # Load environment variables
 load_dotenv()
@@ -19,22 +33,124 @@ app.secret_key = os.getenv("SECRET_KEY", "your-secret-key-here")
 # Add CORS support
 CORS(app)
 
+# Reverse geocoding is answered from the local cities database unless the
+# nearest known city is further away than this
+REVERSE_GEOCODE_MAX_KM = float(os.getenv("REVERSE_GEOCODE_MAX_KM", "25"))
+
 # Cache configuration
+UNIT_SYSTEMS = ('metric', 'imperial')
 CACHE_DURATION = 600  # 10 minutes in seconds
-weather_cache = {}
-
-# Load cities from cities.json for search suggestion
-CITIES_DATA = []
-try:
-    cities_file_path = os.path.join('static', 'cities.json')
-    with open(cities_file_path, 'r', encoding='utf-8') as f:
-        CITIES_DATA = json.load(f)
-    print(f"Loaded {len(CITIES_DATA)} cities from local database")
-except FileNotFoundError:
-    print("Cities database not found. Using OpenWeatherMap geocoding as fallback.")
-except Exception as e:
-    print(f"Error loading cities database: {e}")
-    CITIES_DATA = []
+CACHE_MAX_ENTRIES = int(os.getenv("WEATHER_CACHE_MAX_ENTRIES", "5000"))
+CACHE_MAX_BYTES = int(os.getenv("WEATHER_CACHE_MAX_BYTES", "0")) or None  # 0 = no byte cap
+# 'memory' keeps a per-worker cache; 'sqlite' shares one on-disk cache between
+# all workers on the host (surviving restarts), fronted by an in-process L1
+# of WEATHER_CACHE_L1_ENTRIES entries (0 disables it)
+CACHE_BACKEND = os.getenv("WEATHER_CACHE_BACKEND", "memory")
+CACHE_PATH = os.getenv("WEATHER_CACHE_PATH")
+CACHE_L1_ENTRIES = int(os.getenv("WEATHER_CACHE_L1_ENTRIES", "500"))
+# Expired entries are still served for this many seconds while they are
+# refreshed in the background (stale-while-revalidate)
+CACHE_STALE_WINDOW = int(os.getenv("WEATHER_CACHE_STALE_WINDOW", "600"))
+weather_cache = create_cache(
+    CACHE_BACKEND, CACHE_DURATION, max_entries=CACHE_MAX_ENTRIES, max_bytes=CACHE_MAX_BYTES,
+    path=CACHE_PATH, l1_entries=CACHE_L1_ENTRIES, stale_window=CACHE_STALE_WINDOW
+)
+# Every HOT_REFRESH_INTERVAL seconds, the HOT_REFRESH_TOP_N most requested
+# locations are re-fetched if they expire within HOT_REFRESH_AHEAD seconds
+# (HOT_REFRESH_TOP_N=0 disables this)
+weather_revalidator = Revalidator(
+    weather_cache,
+    top_n=int(os.getenv("HOT_REFRESH_TOP_N", "20")),
+    refresh_ahead=float(os.getenv("HOT_REFRESH_AHEAD", "60")),
+    interval=float(os.getenv("HOT_REFRESH_INTERVAL", "30")),
+    executor=upstream.batch_executor
+)
+# Concurrent misses for one location share a single upstream fetch. Set
+# SINGLE_FLIGHT_LOCK_DIR to also coalesce across workers (useful with the
+# sqlite cache backend); SINGLE_FLIGHT=0 disables coalescing.
+weather_flights = SingleFlight(
+    timeout=float(os.getenv("SINGLE_FLIGHT_TIMEOUT", str(upstream.REQUEST_BUDGET))),
+    lock_dir=os.getenv("SINGLE_FLIGHT_LOCK_DIR"),
+    enabled=os.getenv("SINGLE_FLIGHT", "1") != "0"
+)
+# Encoded JSON bodies of cached entries, per worker, so hits skip serialization.
+# RESPONSE_COMPRESSION=0 serves them uncompressed even to clients accepting gzip.
+RESPONSE_CACHE_ENTRIES = int(os.getenv("RESPONSE_CACHE_ENTRIES", "1000"))
+RESPONSE_COMPRESSION = os.getenv("RESPONSE_COMPRESSION", "1") != "0"
+encoded_responses = WeatherCache(CACHE_DURATION, max_entries=RESPONSE_CACHE_ENTRIES, stale_window=CACHE_STALE_WINDOW)
+# Phases of each request are sent in a Server-Timing header, and request,
+# fetch and search metrics are served at /metrics (METRICS=0 disables both)
+request_seconds = metrics.REGISTRY.histogram(
+    'weather_request_seconds', 'Time to handle a request by endpoint and status', ('endpoint', 'status')
+)
+fetch_outcomes = metrics.REGISTRY.counter(
+    'weather_fetches_total', 'Weather fetches by data source (one_call or fallback) and outcome', ('source', 'outcome')
+)
+search_seconds = metrics.REGISTRY.histogram('weather_search_seconds', 'City search latency by source', ('source',))
+# How coordinates are snapped for cache keys: exact, grid, geohash or city
+# (nearest indexed city within CACHE_CITY_MAX_KM, else the grid)
+CACHE_KEY_MODE = os.getenv("CACHE_KEY_MODE", "grid")
+CACHE_GRID_DEGREES = float(os.getenv("CACHE_GRID_DEGREES", "0.01"))
+CACHE_GEOHASH_PRECISION = int(os.getenv("CACHE_GEOHASH_PRECISION", "6"))
+CACHE_CITY_MAX_KM = float(os.getenv("CACHE_CITY_MAX_KM", "10"))
+
+# Cities for search suggestions and reverse geocoding come from the
+# memory-mapped sidecar compiled from cities.json, so all workers share one
+# copy of the data. It is opened on first use rather than at import, keeping
+# it off the cold start of serverless instances (and requests) that never
+# need it.
+CITIES_PATH = os.path.join('static', 'cities.json')
+CityData = namedtuple('CityData', 'store index nearest')
+_city_data = None
+_city_data_lock = threading.Lock()
+
+def load_city_data():
+    """Open the cities database, or a CityData of Nones when it is unavailable"""
+    try:
+        store = load_city_store(CITIES_PATH)
+        data = CityData(store, CityIndex(store), NearestCity(store))
+        print(f"Loaded {len(store)} cities from local database")
+        return data
+    except FileNotFoundError:
+        print("Cities database not found. Using OpenWeatherMap geocoding as fallback.")
+    except Exception as e:
+        print(f"Error loading cities database: {e}")
+    return CityData(None, None, None)
+
+def city_data():
+    """The worker's CityData, loading it on the first call"""
+    global _city_data
+    if _city_data is None:
+        with _city_data_lock:
+            if _city_data is None:
+                _city_data = load_city_data()
+    return _city_data
+
+# City names typed into /api/compare, memoized per worker with what the
+# local index resolved them to (at most CITY_NAME_CACHE_ENTRIES names)
+CITY_NAME_CACHE_ENTRIES = int(os.getenv("CITY_NAME_CACHE_ENTRIES", "10000"))
+_city_places = {}
+_city_places_lock = threading.Lock()
+
+def resolve_city_name(name):
+    """Suggestion dict (name, country, lat, lon, ...) of the local city a
+    typed name ("Name" or "Name, CC") exactly matches, or None when there is
+    no such city or no local database"""
+    key = ' '.join(str(name).lower().split())
+    place = _city_places.get(key)
+    if place is not None:
+        return place
+    index = city_data().index
+    if index is None or len(index) == 0:
+        return None
+    place = index.resolve(key)
+    if place is not None:
+        with _city_places_lock:
+            if len(_city_places) >= CITY_NAME_CACHE_ENTRIES:
+                # Forget the oldest name
+                _city_places.pop(next(iter(_city_places)))
+            _city_places[key] = place
+    return place
 
 @app.errorhandler(404)
 def not_found_error(error):
@@ -48,44 +164,169 @@ def internal_error(error):
         return jsonify({'error': 'Internal server error'}), 500
     return render_template('500.html'), 500
 
-def get_cache_key(lat, lon, units):
-    """Generate a cache key for the location and units"""
-    return hashlib.md5(f"{lat}_{lon}_{units}".encode()).hexdigest()
+@app.before_request
+def start_request_timing():
+    g.request_start = time.perf_counter()
+    g.timing_token = metrics.start_request()
 
-def is_cache_valid(cache_entry):
-    """Check if cache entry is still valid"""
-    return time.time() - cache_entry['timestamp'] < CACHE_DURATION
+@app.after_request
+def add_server_timing(response):
+    """Record the request and send its phase timings as Server-Timing"""
+    if metrics.ENABLED and 'request_start' in g:
+        elapsed = time.perf_counter() - g.request_start
+        request_seconds.observe(elapsed, request.endpoint or 'unmatched', str(response.status_code))
+        response.headers['Server-Timing'] = metrics.server_timing(total=elapsed)
+        # Let cross-origin pages read the timings too (CORS allows any origin)
+        response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.teardown_request
+def end_request_timing(error=None):
+    metrics.end_request(g.pop('timing_token', None))
+
+def nearest_city_label(lat, lon):
+    """Nearest indexed city as (label, distance_km), for city-snapped cache keys"""
+    cities = city_data()
+    if cities.nearest is None:
+        return None
+    match = cities.nearest.nearest(lat, lon)
+    if match is None:
+        return None
+    city_id, distance = match
+    return f"{cities.store.lat[city_id]}_{cities.store.lon[city_id]}", distance
+
+def get_cache_key(lat, lon, units):
+    """Generate a cache key for the location and units, snapping the
+    coordinates so nearby requests share an entry"""
+    location = location_key(
+        lat, lon, mode=CACHE_KEY_MODE, grid_degrees=CACHE_GRID_DEGREES,
+        geohash_precision=CACHE_GEOHASH_PRECISION, nearest_city=nearest_city_label,
+        city_max_km=CACHE_CITY_MAX_KM
+    )
+    return hashlib.md5(f"{location}_{units}".encode()).hexdigest()
 
 def get_from_cache(lat, lon, units):
     """Get weather data from cache if valid"""
-    cache_key = get_cache_key(lat, lon, units)
-    if cache_key in weather_cache:
-        cache_entry = weather_cache[cache_key]
-        if is_cache_valid(cache_entry):
-            return cache_entry['data']
-    return None
+    return weather_cache.get(get_cache_key(lat, lon, units))
 
 def save_to_cache(lat, lon, units, data):
-    """Save weather data to cache"""
-    cache_key = get_cache_key(lat, lon, units)
-    weather_cache[cache_key] = {
-        'data': data,
-        'timestamp': time.time()
-    }
+    """Save weather data to cache together with its conversion to the other
+    unit system, so hits in either units need no conversion. Returns a
+    {units: data} dict of everything stored.
+
+    The entries are shared by every request snapped to the same key, so
+    responses overlay their own coordinates and name on them (located())."""
+    variants = {other: convert_units(data, units, other) for other in UNIT_SYSTEMS}
+    cache_variants(lat, lon, variants)
+    return variants
+
+def cache_variants(lat, lon, variants):
+    """Store a location's {units: data} renderings (see save_to_cache)"""
+    for variant_units, variant in variants.items():
+        weather_cache.put(get_cache_key(lat, lon, variant_units), variant)
+
+def get_with_revalidation(lat, lon, units='metric'):
+    """Cached (data, timestamp) for a location, serving an expired entry (and
+    refreshing it in the background) while it is inside the stale window.
+    Returns None on a miss."""
+    cache_key = get_cache_key(lat, lon, 'metric')
+
+    def refresh(seen):
+        def newer_entry():
+            # Only an entry newer than the one that was due (written by
+            # another worker to the shared cache) makes the fetch
+            # unnecessary: a refresh-ahead runs while the entry is still fresh
+            entry = weather_cache.get_entry(cache_key, allow_stale=True)
+            if entry is not None and (seen is None or entry[1] > seen):
+                return entry[0]
+            return None
+
+        # Background refreshes are the first to give way when the upstream
+        # budget runs low, leaving the stale entry in service
+        with upstream.priority(upstream.BACKGROUND):
+            response_data = weather_flights.do(cache_key, lambda: fetch_weather_data(lat, lon),
+                                               recheck=newer_entry)
+        # fetch_weather_data reports failures in its result, not by raising
+        if 'error' in response_data:
+            raise RefreshFailed(response_data['error'])
+        return response_data
+
+    # Popularity and refreshes are tracked on the metric entry, which is
+    # always written together with the imperial one
+    entry = weather_revalidator.get_entry(cache_key, refresh)
+    if entry is None:
+        return entry
+    return get_units_entry(lat, lon, units, entry)
+
+def located(data, lat, lon, city=''):
+    """data, a weather entry shared by every request snapped to its cache
+    key, as served to a request for lat, lon (and the city name it gave)"""
+    current = dict(data['current'], lat=lat, lon=lon)
+    if city:
+        current['city'] = city
+    return dict(data, current=current)
+
+def response_key(lat, lon, units, city=''):
+    """Key of the encoded response for a request: its cache key plus the
+    coordinates and name located() overlays on the shared entry"""
+    return f"{get_cache_key(lat, lon, units)}:{lat},{lon},{city}"
+
+def get_units_entry(lat, lon, units, metric_entry):
+    """(data, timestamp) in units for a location's cached metric_entry: the
+    stored rendering in those units (stale or not), or metric_entry converted"""
+    if units == 'metric':
+        return metric_entry
+    variant = weather_cache.get_entry(get_cache_key(lat, lon, units), allow_stale=True)
+    return variant or (convert_units(metric_entry[0], 'metric', units), metric_entry[1])
+
+def get_filled_entry(lat, lon, units, metric_data):
+    """(data, timestamp) in units for a location just filled with
+    metric_data: the stored rendering, or metric_data converted (with a None
+    timestamp) if the cache no longer holds it"""
+    entry = weather_cache.get_entry(get_cache_key(lat, lon, units))
+    return entry or (convert_units(metric_data, 'metric', units), None)
+
+def dump_json(value):
+    """Compact JSON text for value, as jsonify would encode it"""
+    return app.json.dumps(value, separators=(',', ':'))
 
-def cleanup_cache():
-    """Remove expired cache entries"""
-    current_time = time.time()
-    expired_keys = [
-        key for key, entry in weather_cache.items()
-        if current_time - entry['timestamp'] >= CACHE_DURATION
-    ]
-    for key in expired_keys:
-        del weather_cache[key]
-
-def get_current_weather(city, units='metric'):
+def get_encoded_response(cache_key, data, timestamp):
+    """EncodedResponse for the cache entry stored under cache_key at
+    timestamp, encoding it on first use"""
+    entry = encoded_responses.get_entry(cache_key, allow_stale=True)
+    if entry is not None and entry[1] == timestamp:
+        return entry[0]
+    encoded = EncodedResponse(f"{dump_json(data)}\n".encode())
+    encoded_responses.put(cache_key, encoded, timestamp=timestamp)
+    return encoded
+
+def cached_weather_response(lat, lon, city, units, entry):
+    """/api/weather response for a location's cached (data, timestamp) entry
+    in units, encoded once per requested coordinates and name"""
+    data, timestamp = entry
+    return encoded_json_response(
+        get_encoded_response(response_key(lat, lon, units, city), located(data, lat, lon, city), timestamp))
+
+def encoded_json_response(encoded, compress=RESPONSE_COMPRESSION):
+    """Response for an EncodedResponse with the strong ETag of the coding
+    sent, or a 304 when the client's If-None-Match already has that
+    representation (the weather POSTs are reads)"""
+    accepted = {coding for coding, quality in request.accept_encodings if quality > 0} if compress else ()
+    coding = encoded.coding(accepted)
+    etag = encoded.coded_etag(coding)
+    if request.if_none_match.contains_weak(etag):
+        response = app.response_class(status=304)
+    else:
+        body, content_encoding = encoded.encoded_body(accepted)
+        response = app.response_class(body, mimetype='application/json')
+        if content_encoding:
+            response.headers['Content-Encoding'] = content_encoding
+    response.set_etag(etag)
+    response.vary.add('Accept-Encoding')
+    return response
+
+def get_current_weather(city, units='metric', timeout=None):
     """Fetch current weather data for a city"""
-    url = "http://api.openweathermap.org/data/2.5/weather"
     params = {
         'q': city,
         'appid': API_KEY,
@@ -93,7 +334,7 @@ def get_current_weather(city, units='metric'):
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get('data/2.5/weather', params=params, timeout=timeout)
         if response.status_code == 200:
             return response.json()
         elif response.status_code == 404:
@@ -103,9 +344,8 @@ def get_current_weather(city, units='metric'):
     except requests.exceptions.RequestException as e:
         return {'error': f'Network error: {str(e)}'}
 
-def get_weather_by_coords(lat, lon, units='metric'):
+def get_weather_by_coords(lat, lon, units='metric', timeout=None, deadline=None):
     """Fetch weather data by coordinates"""
-    url = "http://api.openweathermap.org/data/2.5/weather"
     params = {
         'lat': lat,
         'lon': lon,
@@ -114,7 +354,7 @@ def get_weather_by_coords(lat, lon, units='metric'):
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get('data/2.5/weather', params=params, timeout=timeout, deadline=deadline)
         if response.status_code == 200:
             return response.json()
         else:
@@ -122,9 +362,8 @@ def get_weather_by_coords(lat, lon, units='metric'):
     except requests.exceptions.RequestException as e:
         return {'error': f'Network error: {str(e)}'}
 
-def get_one_call_data(lat, lon, units='metric'):
+def get_one_call_data(lat, lon, units='metric', timeout=None, deadline=None):
     """Fetch comprehensive weather data using One Call API 3.0"""
-    url = "https://api.openweathermap.org/data/3.0/onecall"
     params = {
         'lat': lat,
         'lon': lon,
@@ -134,18 +373,25 @@ def get_one_call_data(lat, lon, units='metric'):
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get('data/3.0/onecall', params=params, timeout=timeout, deadline=deadline)
         if response.status_code == 200:
             return response.json()
+        elif response.status_code == 429:
+            return {'error': 'One Call API rate limit exceeded', 'rate_limited': True}
         else:
             # Return error but don't crash, so fallback can be used
             return {'error': f'One Call API error: {response.status_code}'}
+    except upstream.RateLimited as e:
+        return {'error': str(e), 'rate_limited': True}
+    except upstream.CircuitOpen:
+        # Known to be down: go straight to the fallback
+        return {'error': 'One Call API unavailable'}
     except requests.exceptions.RequestException as e:
         return {'error': f'Network error: {str(e)}'}
 
-def get_air_quality(lat, lon):
-    """Fetch air quality data"""
-    url = "http://api.openweathermap.org/data/2.5/air_pollution"
+def get_air_quality(lat, lon, timeout=None, deadline=None):
+    """Fetch air quality data (optional: dropped first when the upstream
+    budget runs low)"""
     params = {
         'lat': lat,
         'lon': lon,
@@ -153,7 +399,7 @@ def get_air_quality(lat, lon):
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get('data/2.5/air_pollution', params=params, timeout=timeout, deadline=deadline, optional=True)
         if response.status_code == 200:
             return response.json()
         else:
@@ -161,9 +407,8 @@ def get_air_quality(lat, lon):
     except requests.exceptions.RequestException as e:
         return {'error': f'Network error: {str(e)}'}
 
-def get_forecast(city, units='metric'):
+def get_forecast(city, units='metric', timeout=None):
     """Fetch 5-day forecast data for a city"""
-    url = "http://api.openweathermap.org/data/2.5/forecast"
     params = {
         'q': city,
         'appid': API_KEY,
@@ -171,7 +416,7 @@ def get_forecast(city, units='metric'):
     }
     
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get('data/2.5/forecast', params=params, timeout=timeout)
         if response.status_code == 200:
             return response.json()
         else:
@@ -179,9 +424,8 @@ def get_forecast(city, units='metric'):
     except requests.exceptions.RequestException as e:
         return {'error': f'Network error: {str(e)}'}
 
-def get_forecast_by_coords(lat, lon, units='metric'):
+def get_forecast_by_coords(lat, lon, units='metric', timeout=None, deadline=None):
     """Fetch forecast data by coordinates"""
-    url = "http://api.openweathermap.org/data/2.5/forecast"
     params = {
         'lat': lat,
         'lon': lon,
@@ -189,7 +433,7 @@ def get_forecast_by_coords(lat, lon, units='metric'):
         'units': units
     }
     try:
-        response = requests.get(url, params=params, timeout=10)
+        response = upstream.get('data/2.5/forecast', params=params, timeout=timeout, deadline=deadline)
         if response.status_code == 200:
             return response.json()
         else:
@@ -197,74 +441,6 @@ def get_forecast_by_coords(lat, lon, units='metric'):
     except requests.exceptions.RequestException as e:
         return {'error': f'Network error: {str(e)}'}
     
-def convert_units(data, from_units, to_units):
-    """Convert weather data between metric and imperial units"""
-    if from_units == to_units:
-        return data
-    
-    # Use json loads/dumps for a deep copy to prevent cache mutation
-    converted_data = json.loads(json.dumps(data))
-    
-    if from_units == 'metric' and to_units == 'imperial':
-        # Convert temperatures from Celsius to Fahrenheit
-        converted_data['current']['temp'] = round((data['current']['temp'] * 9/5) + 32)
-        converted_data['current']['feels_like'] = round((data['current']['feels_like'] * 9/5) + 32)
-        
-        # Convert wind speed from km/h to mph
-        converted_data['current']['wind_speed'] = round(data['current']['wind_speed'] * 0.621371, 1)
-        converted_data['current']['speed_unit'] = 'mph'
-        converted_data['current']['temp_unit'] = '°F'
-        
-        # Convert visibility from km/h to mph
-        if 'visibility' in data['current'] and data['current']['visibility'] != 'N/A':
-            # Convert base unit (km) to miles
-            converted_data['current']['visibility'] = round(data['current']['visibility'] * 0.621371)
-        converted_data['current']['visibility_unit'] = 'miles'
-        
-        converted_data['current']['speed_unit'] = 'mph'
-        
-        # Convert hourly forecast
-        for hour in converted_data.get('hourly', []):
-            hour['temp'] = round((hour['temp'] * 9/5) + 32)
-            hour['wind_speed'] = round(hour['wind_speed'] * 0.621371, 1)
-        
-        # Convert daily forecast
-        for day in converted_data.get('daily', []):
-            day['temp_max'] = round((day['temp_max'] * 9/5) + 32)
-            day['temp_min'] = round((day['temp_min'] * 9/5) + 32)
-            day['wind_speed'] = round(day['wind_speed'] * 0.621371, 1)
-    
-    elif from_units == 'imperial' and to_units == 'metric':
-        # Convert temperatures from Fahrenheit to Celsius
-        converted_data['current']['temp'] = round((data['current']['temp'] - 32) * 5/9)
-        converted_data['current']['feels_like'] = round((data['current']['feels_like'] - 32) * 5/9)
-        
-        # Convert wind speed from mph to km/h
-        converted_data['current']['wind_speed'] = round(data['current']['wind_speed'] * 1.60934, 1)
-        converted_data['current']['speed_unit'] = 'km/h'
-        converted_data['current']['temp_unit'] = '°C'
-        
-        # Convert visibility from mph to km/h
-        if 'visibility' in data['current'] and data['current']['visibility'] != 'N/A':
-            # Convert miles back to km
-            converted_data['current']['visibility'] = round(data['current']['visibility'] / 0.621371)
-        converted_data['current']['visibility_unit'] = 'km'
-
-        converted_data['current']['speed_unit'] = 'km/h'
-        
-        # Convert hourly forecast
-        for hour in converted_data.get('hourly', []):
-            hour['temp'] = round((hour['temp'] - 32) * 5/9)
-            hour['wind_speed'] = round(hour['wind_speed'] * 1.60934, 1)
-        
-        # Convert daily forecast
-        for day in converted_data.get('daily', []):
-            day['temp_max'] = round((day['temp_max'] - 32) * 5/9)
-            day['temp_min'] = round((day['temp_min'] - 32) * 5/9)
-            day['wind_speed'] = round(day['wind_speed'] * 1.60934, 1)
-    
-    return converted_data
-
 
 def search_cities(query):
     """Search for cities using local database with fuzzy matching"""
@@ -272,70 +448,10 @@ def search_cities(query):
         if not query or len(query) < 2:
             return []
         
-        query_lower = query.lower().strip()
-        matches = []
-        
         # If local database is available, use it
-        if CITIES_DATA and len(CITIES_DATA) > 0:
-            for city in CITIES_DATA:
-                try:
-                    city_name = city.get('name', '').lower()
-                    country = city.get('country', '').lower()
-                    admin1 = city.get('adminCode', '') or city.get('admin1', '') or ''
-                    
-                    # Handle both 'lng' and 'lon' for longitude
-                    longitude = city.get('lng') or city.get('lon')
-                    latitude = city.get('lat')
-                    
-                    if not longitude or not latitude:
-                        continue  # Skip cities without valid coordinates
-                    
-                    # Check if query matches the beginning of city name (prioritized)
-                    if city_name.startswith(query_lower):
-                        matches.append({
-                            'name': city['name'],
-                            'country': city['country'],
-                            'state': admin1,
-                            'lat': float(latitude),
-                            'lon': float(longitude),  # Use the extracted longitude
-                            'display': f"{city['name']}, {city['country']}" + (f" ({admin1})" if admin1 else ""),
-                            'population': city.get('population', 0),
-                            'priority': 1  # Highest priority for starts-with matches
-                        })
-                    # Check if query is contained in city name (lower priority)
-                    elif query_lower in city_name:
-                        matches.append({
-                            'name': city['name'],
-                            'country': city['country'], 
-                            'state': admin1,
-                            'lat': float(latitude),
-                            'lon': float(longitude),  # Use the extracted longitude
-                            'display': f"{city['name']}, {city['country']}" + (f" ({admin1})" if admin1 else ""),
-                            'population': city.get('population', 0),
-                            'priority': 2  # Lower priority for contains matches
-                        })
-                except (KeyError, ValueError, TypeError) as e:
-                    # Skip this city if there's an issue with its data
-                    print(f"Skipping city due to data error: {e}")
-                    continue
-            
-            # Sort by priority (starts-with first), then by population (descending)
-            matches.sort(key=lambda x: (x['priority'], -x.get('population', 0), x['name']))
-            
-            # Remove duplicates while preserving order
-            seen = set()
-            unique_matches = []
-            for match in matches:
-                key = (match['name'], match['country'], match['lat'], match['lon'])
-                if key not in seen:
-                    seen.add(key)
-                    # Remove the priority field before adding to results since it's only needed for sorting
-                    match_copy = {k: v for k, v in match.items() if k != 'priority'}
-                    unique_matches.append(match_copy)
-                    if len(unique_matches) >= 10:  # Limit to top 10 results
-                        break
-            
-            return unique_matches
+        index = city_data().index
+        if index is not None and len(index) > 0:
+            return index.search(query)
         
         # Fallback to OpenWeatherMap geocoding API if local database not available
         else:
@@ -343,7 +459,6 @@ def search_cities(query):
                 print("No API key available for geocoding fallback")
                 return []
                 
-            url = "http://api.openweathermap.org/geo/1.0/direct"
             params = {
                 'q': query,
                 'limit': 5,
@@ -351,7 +466,7 @@ def search_cities(query):
             }
             
             try:
-                response = requests.get(url, params=params, timeout=5)
+                response = upstream.get('geo/1.0/direct', params=params, timeout=5)
                 if response.status_code == 200:
                     api_results = response.json()
                     return [{
@@ -372,46 +487,39 @@ def search_cities(query):
         traceback.print_exc()
         return []
 
-def get_uv_category(uv_index):
-    """Get UV index category and recommendations"""
-    if uv_index <= 2:
-        return {'level': 'Low', 'color': '#289500', 'recommendation': 'No protection needed'}
-    elif uv_index <= 5:
-        return {'level': 'Moderate', 'color': '#F7D708', 'recommendation': 'Some protection required'}
-    elif uv_index <= 7:
-        return {'level': 'High', 'color': '#F85900', 'recommendation': 'Protection essential'}
-    elif uv_index <= 10:
-        return {'level': 'Very High', 'color': '#D8001C', 'recommendation': 'Extra protection needed'}
-    else:
-        return {'level': 'Extreme', 'color': '#6B49C8', 'recommendation': 'Avoid sun exposure'}
-
-def get_aqi_category(aqi):
-    """Get AQI category and color"""
-    categories = {
-        1: {'level': 'Good', 'color': '#00E400', 'description': 'Air quality is satisfactory'},
-        2: {'level': 'Fair', 'color': '#FFFF00', 'description': 'Air quality is acceptable'},
-        3: {'level': 'Moderate', 'color': '#FF7E00', 'description': 'Members of sensitive groups may experience health effects'},
-        4: {'level': 'Poor', 'color': '#FF0000', 'description': 'Health effects may be experienced by everyone'},
-        5: {'level': 'Very Poor', 'color': '#8F3F97', 'description': 'Health effects will be experienced by everyone'}
-    }
-    return categories.get(aqi, categories[1])
-
-def get_local_time(timezone_offset):
-    """Get local time for the location"""
-    utc_time = datetime.utcnow()
-    local_time = utc_time + timedelta(seconds=timezone_offset)
-    return local_time
-
-def format_time_with_offset(unix_timestamp, offset_seconds):
-    """Converts a UTC timestamp to a formatted time string in the target timezone."""
-    if not unix_timestamp or not isinstance(offset_seconds, (int, float)):
-        return "N/A"
+def nearby_place(lat, lon):
+    """The nearest city in the local database as a place dict, if one is
+    within REVERSE_GEOCODE_MAX_KM"""
+    cities = city_data()
+    if cities.nearest is None:
+        return None
     try:
-        tz = timezone(timedelta(seconds=offset_seconds))
-        local_time = datetime.fromtimestamp(unix_timestamp, tz)
-        return local_time.strftime('%I:%M %p')
-    except (ValueError, TypeError):
-        return "N/A"
+        match = cities.nearest.nearest(float(lat), float(lon))
+    except (TypeError, ValueError):
+        match = None
+    if match and match[1] <= REVERSE_GEOCODE_MAX_KM:
+        city_id = match[0]
+        return {
+            'name': cities.store.names[city_id],
+            'lat': cities.store.lat[city_id],
+            'lon': cities.store.lon[city_id],
+            'country': cities.store.country(city_id),
+            'state': cities.store.admin(city_id)
+        }
+    return None
+
+def reverse_geocode(lat, lon, timeout=5, deadline=None):
+    """Resolve coordinates to a place name, preferring the nearest city in the
+    local database and only calling the geocoding API when none is close enough"""
+    place = nearby_place(lat, lon)
+    if place:
+        return place
+
+    params = {'lat': lat, 'lon': lon, 'limit': 1, 'appid': API_KEY}
+    response = upstream.get('geo/1.0/reverse', params=params, timeout=timeout, deadline=deadline)
+    if response.status_code == 200 and response.json():
+        return response.json()[0]
+    return None
 
 @app.template_filter('timestamp_to_time')
 def timestamp_to_time(unix_timestamp):
@@ -431,231 +539,144 @@ def timestamp_to_hour(unix_timestamp):
 def index():
     return render_template('index.html')
 
-@app.route('/api/weather', methods=['POST'])
-def get_weather():
-    """API endpoint for getting comprehensive weather data"""
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'Invalid JSON data'}), 400
-        
-        city = data.get('city', '').strip()
-        lat = data.get('lat')
-        lon = data.get('lon')
-        units = data.get('units', 'metric')
-        
-        if not API_KEY:
-            return jsonify({'error': 'API key not configured'}), 400
+# from_one_call() arguments of a location whose One Call request succeeded
+OneCallPayloads = namedtuple('OneCallPayloads', 'one_call air_quality city lat lon')
+
+def fetch_weather_data(lat, lon):
+    """Fetch, normalize and cache metric weather for a location. Returns the
+    response dict, or {'error': ...} when both One Call and the 2.5 fallback fail"""
+    fetched = fetch_weather_payloads(lat, lon)
+    if isinstance(fetched, OneCallPayloads):
+        # Save metric data (and its imperial rendering) to cache
+        fetched = save_to_cache(lat, lon, 'metric', from_one_call(*fetched).to_dict())['metric']
+        fetch_outcomes.inc('one_call', 'ok')
+    return fetched
+
+def fetch_weather_payloads(lat, lon):
+    """The upstream part of fetch_weather_data(): OneCallPayloads still to
+    normalize and cache when One Call answered, otherwise its result (the
+    2.5 fallback, normalized and cached, or an error)"""
+    # Issue the independent upstream calls concurrently, all bounded
+    # by one request budget. Always fetch in metric to have
+    # consistent base data.
+    deadline = upstream.Deadline()
+    timed_out = {'error': 'Upstream request timed out'}
+    one_call_future = upstream.submit(get_one_call_data, lat, lon, 'metric', deadline=deadline)
+    air_quality_future = upstream.submit(get_air_quality, lat, lon, deadline=deadline)
+    place_future = upstream.submit(reverse_geocode, lat, lon, deadline=deadline)
+    one_call_data = upstream.wait(one_call_future, deadline, timed_out)
+    
+    # --- Primary Path: One Call API Success ---
+    if 'error' not in one_call_data:
+        air_quality_data = upstream.wait(air_quality_future, deadline, timed_out)
         
-        # Get coordinates first
-        if not lat or not lon:
-            if city:
-                geo_data = search_cities(city)
-                if not geo_data:
-                    return jsonify({'error': 'City not found'}), 404
-                lat = geo_data[0]['lat']
-                lon = geo_data[0]['lon']
-            else:
-                return jsonify({'error': 'City name or coordinates required'}), 400
+        # The cached entry is shared by every request snapped to this
+        # location, named or not, so it is always named for the place at the
+        # coordinates: responses to named requests overlay their own name
+        place = None
+        try:
+            place = upstream.wait(place_future, deadline)
+        except requests.exceptions.RequestException as e:
+            print(f"Reverse geocoding error: {e}")
+
+        return OneCallPayloads(one_call_data, air_quality_data, place['name'] if place else '', lat, lon)
 
-        # Clean up expired cache entries periodically
-        cleanup_cache()
+    # Out of upstream budget: the fallback would spend more of it
+    elif one_call_data.get('rate_limited'):
+        fetch_outcomes.inc('one_call', 'rate_limited')
+        return one_call_data
+
+    # --- Fallback Path: One Call API Failed ---
+    else:
+        weather_future = upstream.submit(get_weather_by_coords, lat, lon, 'metric', deadline=deadline)
+        forecast_future = upstream.submit(get_forecast_by_coords, lat, lon, 'metric', deadline=deadline)
+        weather_data = upstream.wait(weather_future, deadline, timed_out)
+        forecast_data = upstream.wait(forecast_future, deadline, timed_out)
+
+        if 'error' in weather_data or 'error' in forecast_data:
+            fetch_outcomes.inc('fallback', 'error')
+            return {'error': weather_data.get('error') or forecast_data.get('error')}
+
+        air_quality_data = upstream.wait(air_quality_future, deadline, timed_out)
+        response_data = from_current_and_forecast(weather_data, forecast_data, air_quality_data, lat, lon).to_dict()
         
-        # Check cache for both metric and imperial (we'll convert if needed)
-        cached_data = get_from_cache(lat, lon, 'metric')
-        if cached_data:
-            if units == 'imperial':
-                converted_data = convert_units(cached_data, 'metric', 'imperial')
-                return jsonify(converted_data)
-            return jsonify(cached_data)
+        # Save metric data to cache
+        save_to_cache(lat, lon, 'metric', response_data)
+        fetch_outcomes.inc('fallback', 'ok')
         
-        # Also check imperial cache if that's what we have
-        cached_data = get_from_cache(lat, lon, 'imperial')
-        if cached_data:
-            if units == 'metric':
-                converted_data = convert_units(cached_data, 'imperial', 'metric')
-                return jsonify(converted_data)
-            return jsonify(cached_data)
+        return response_data
 
-        try:
-            # Always fetch in metric to have consistent base data
-            one_call_data = get_one_call_data(lat, lon, 'metric')
-            
-            # --- Primary Path: One Call API Success ---
-            if 'error' not in one_call_data:
-                air_quality_data = get_air_quality(lat, lon)
-                
-                temp_unit = '°C'
-                speed_unit = 'km/h'
-                
-                # Determine if it's day or night
-                is_day = one_call_data['current']['dt'] > one_call_data['current'].get('sunrise', 0) and one_call_data['current']['dt'] < one_call_data['current'].get('sunset', 0)
-                timezone_offset = one_call_data.get('timezone_offset', 0)
-                
-                # Use reverse geocoding to get city name if not provided
-                if not city:
-                    reverse_geo_url = f"http://api.openweathermap.org/geo/1.0/reverse"
-                    reverse_params = {'lat': lat, 'lon': lon, 'limit': 1, 'appid': API_KEY}
-                    reverse_response = requests.get(reverse_geo_url, params=reverse_params)
-                    if reverse_response.status_code == 200 and reverse_response.json():
-                        city = reverse_response.json()[0]['name']
-
-                current_data = {
-                    'city': city or 'Unknown Location',
-                    'country': '',
-                    'temp': round(one_call_data['current']['temp']),
-                    'feels_like': round(one_call_data['current']['feels_like']),
-                    'humidity': one_call_data['current']['humidity'],
-                    'pressure': one_call_data['current']['pressure'],
-                    'wind_speed': round(one_call_data['current']['wind_speed'] * 3.6, 1),  # Convert m/s to km/h
-                    'description': one_call_data['current']['weather'][0]['description'].title(),
-                    'icon': one_call_data['current']['weather'][0]['icon'],
-                    'visibility': round(one_call_data['current'].get('visibility', 0) / 1000) if one_call_data['current'].get('visibility') is not None else 'N/A',
-                    'visibility_unit': 'km',
-                    'sunrise': format_time_with_offset(one_call_data['current'].get('sunrise'), timezone_offset),
-                    'sunset': format_time_with_offset(one_call_data['current'].get('sunset'), timezone_offset),
-                    'timezone': timezone_offset,
-                    'temp_unit': temp_unit,
-                    'speed_unit': speed_unit,
-                    'weather_main': one_call_data['current']['weather'][0]['main'],
-                    'is_day': is_day,
-                    'uv_index': one_call_data['current'].get('uvi', 0),
-                    'uv_info': get_uv_category(one_call_data['current'].get('uvi', 0)),
-                    'local_time': get_local_time(timezone_offset).strftime('%Y-%m-%d %H:%M:%S'),
-                    'lat': lat,
-                    'lon': lon
-                }
-                
-                air_quality = None
-                if 'error' not in air_quality_data:
-                    aqi = air_quality_data['list'][0]['main']['aqi']
-                    components = air_quality_data['list'][0]['components']
-                    aqi_info = get_aqi_category(aqi)
-                    air_quality = {
-                        'aqi': aqi, 'level': aqi_info['level'], 'color': aqi_info['color'],
-                        'description': aqi_info['description'], 'components': components
-                    }
-                
-                hourly_forecast = []
-                for hour in one_call_data.get('hourly', [])[:24]:
-                    hourly_forecast.append({
-                        'dt': hour['dt'], 'temp': round(hour['temp']),
-                        'description': hour['weather'][0]['description'].title(),
-                        'icon': hour['weather'][0]['icon'], 'pop': round(hour.get('pop', 0) * 100),
-                        'humidity': hour['humidity'], 'wind_speed': round(hour['wind_speed'] * 3.6, 1)  # Convert m/s to km/h
-                    })
-                
-                daily_forecast = []
-                for day in one_call_data.get('daily', [])[:7]:
-                    daily_forecast.append({
-                        'dt': day['dt'], 'temp_max': round(day['temp']['max']), 'temp_min': round(day['temp']['min']),
-                        'description': day['weather'][0]['description'].title(), 'icon': day['weather'][0]['icon'],
-                        'pop': round(day.get('pop', 0) * 100), 'humidity': day['humidity'],
-                        'wind_speed': round(day['wind_speed'] * 3.6, 1), 'uvi': day.get('uvi', 0)  # Convert m/s to km/h
-                    })
-                
-                alerts = []
-                if 'alerts' in one_call_data:
-                    for alert in one_call_data['alerts']:
-                        alerts.append({
-                            'event': alert.get('event', 'Weather Alert'), 'description': alert.get('description', ''),
-                            'start': alert.get('start', 0), 'end': alert.get('end', 0), 'severity': 'moderate'
-                        })
-                
-                response_data = {
-                    'current': current_data, 'hourly': hourly_forecast, 'daily': daily_forecast,
-                    'air_quality': air_quality, 'alerts': alerts
-                }
-                
-                # Save metric data to cache
-                save_to_cache(lat, lon, 'metric', response_data)
-                
-                # Convert to imperial if requested
-                if units == 'imperial':
-                    response_data = convert_units(response_data, 'metric', 'imperial')
-                
-                return jsonify(response_data)
+def weather_request():
+    """((lat, lon, city, units), None) for the location a /api/weather body
+    asks for, or (None, error response) if it cannot be served"""
+    data = request.get_json()
+    if not data:
+        return None, (jsonify({'error': 'Invalid JSON data'}), 400)
+    
+    city = data.get('city', '').strip()
+    lat = data.get('lat')
+    lon = data.get('lon')
+    units = data.get('units', 'metric')
+    
+    if not API_KEY:
+        return None, (jsonify({'error': 'API key not configured'}), 400)
+    
+    # Get coordinates first
+    if not lat or not lon:
+        if city:
+            geo_data = search_cities(city)
+            if not geo_data:
+                return None, (jsonify({'error': 'City not found'}), 404)
+            lat = geo_data[0]['lat']
+            lon = geo_data[0]['lon']
+        else:
+            return None, (jsonify({'error': 'City name or coordinates required'}), 400)
+    return (lat, lon, city, units), None
 
-            # --- Fallback Path: One Call API Failed ---
-            else:
-                weather_data = get_weather_by_coords(lat, lon, 'metric')
-                forecast_data = get_forecast_by_coords(lat, lon, 'metric')
+def filled_weather_response(lat, lon, city, units, response_data):
+    """/api/weather response for a location whose fetch returned response_data"""
+    if response_data.get('rate_limited'):
+        response = jsonify({'error': 'Weather service is busy, please try again shortly'})
+        response.headers['Retry-After'] = str(max(1, round(upstream.limiter.retry_after())))
+        return response, 503
+    if 'error' in response_data:
+        return jsonify({'error': response_data['error']}), 400
+    
+    # Serve the rendering for the requested units stored by the fill,
+    # encoding it once for this and later hits
+    entry = get_filled_entry(lat, lon, units, response_data)
+    if entry[1] is not None:
+        return cached_weather_response(lat, lon, city, units, entry)
+    
+    return jsonify(located(entry[0], lat, lon, city))
 
-                if 'error' in weather_data or 'error' in forecast_data:
-                    return jsonify({'error': weather_data.get('error') or forecast_data.get('error')}), 400
+@app.route('/api/weather', methods=['POST'])
+def get_weather():
+    """API endpoint for getting comprehensive weather data"""
+    try:
+        target, error = weather_request()
+        if error:
+            return error
+        lat, lon, city, units = target
 
-                temp_unit = '°C'
-                speed_unit = 'km/h'
-                
-                is_day = weather_data['sys']['sunrise'] <= weather_data['dt'] <= weather_data['sys']['sunset']
-
-                current_data = {
-                    'city': weather_data['name'], 'country': weather_data['sys']['country'],
-                    'temp': round(weather_data['main']['temp']), 'feels_like': round(weather_data['main']['feels_like']),
-                    'humidity': weather_data['main']['humidity'], 'pressure': weather_data['main']['pressure'],
-                    'wind_speed': round(weather_data['wind']['speed'] * 3.6, 1),  # Convert m/s to km/h
-                    'description': weather_data['weather'][0]['description'].title(),
-                    'icon': weather_data['weather'][0]['icon'],
-                    'visibility': round(weather_data.get('visibility', 0) / 1000) if weather_data.get('visibility') is not None else 'N/A',
-                    'visibility_unit': 'km',
-                    'sunrise': format_time_with_offset(weather_data['sys'].get('sunrise'), weather_data['timezone']),
-                    'sunset': format_time_with_offset(weather_data['sys'].get('sunset'), weather_data['timezone']),
-                    'timezone': weather_data['timezone'], 'temp_unit': temp_unit, 'speed_unit': speed_unit,
-                    'weather_main': weather_data['weather'][0]['main'],
-                    'is_day': is_day,
-                    'uv_index': 0, 'uv_info': get_uv_category(0),
-                    'local_time': get_local_time(weather_data['timezone']).strftime('%Y-%m-%d %H:%M:%S'),
-                    'lat': lat,
-                    'lon': lon
-                }
-
-                hourly_forecast = []
-                for entry in forecast_data.get('list', [])[:8]:
-                    hourly_forecast.append({
-                        'dt': entry['dt'], 'temp': round(entry['main']['temp']),
-                        'description': entry['weather'][0]['description'].title(),
-                        'icon': entry['weather'][0]['icon'], 'pop': round(entry.get('pop', 0) * 100),
-                        'humidity': entry['main']['humidity'], 'wind_speed': round(entry['wind']['speed'] * 3.6, 1)  # Convert m/s to km/h
-                    })
-
-                daily_forecast = []
-                processed_dates = set()
-                for entry in forecast_data.get('list', []):
-                    entry_date = datetime.fromtimestamp(entry['dt']).date()
-                    if entry_date not in processed_dates and len(daily_forecast) < 7:
-                        temps_for_day = [e['main']['temp'] for e in forecast_data['list'] if datetime.fromtimestamp(e['dt']).date() == entry_date]
-                        wind_speeds_for_day = [e['wind']['speed'] for e in forecast_data['list'] if datetime.fromtimestamp(e['dt']).date() == entry_date]
-                        daily_forecast.append({
-                            'dt': entry['dt'], 'temp_max': round(max(temps_for_day)), 'temp_min': round(min(temps_for_day)),
-                            'description': entry['weather'][0]['description'].title(),
-                            'icon': entry['weather'][0]['icon'], 'pop': round(entry.get('pop', 0) * 100),
-                            'humidity': entry['main']['humidity'], 'wind_speed': round(sum(wind_speeds_for_day)/len(wind_speeds_for_day) * 3.6, 1), 'uvi': 0  # Convert m/s to km/h
-                        })
-                        processed_dates.add(entry_date)
-                
-                air_quality_data = get_air_quality(lat, lon)
-                air_quality = None
-                if 'error' not in air_quality_data:
-                    aqi = air_quality_data['list'][0]['main']['aqi']
-                    aqi_info = get_aqi_category(aqi)
-                    air_quality = {
-                        'aqi': aqi, 'level': aqi_info['level'], 'color': aqi_info['color'],
-                        'description': aqi_info['description'], 'components': air_quality_data['list'][0]['components']
-                    }
-
-                response_data = {
-                    'current': current_data, 'hourly': hourly_forecast, 'daily': daily_forecast,
-                    'air_quality': air_quality, 'alerts': []
-                }
-                
-                # Save metric data to cache
-                save_to_cache(lat, lon, 'metric', response_data)
-                
-                # Convert to imperial if requested
-                if units == 'imperial':
-                    response_data = convert_units(response_data, 'metric', 'imperial')
-                
-                return jsonify(response_data)
+        # Both unit systems are cached on every fill, so hits need no
+        # conversion, and their encoded bytes are kept for the next hit
+        with metrics.phase('cache'):
+            cached = get_with_revalidation(lat, lon, units)
+        if cached:
+            with metrics.phase('serialize'):
+                return cached_weather_response(lat, lon, city, units, cached)
+
+        try:
+            # Concurrent requests for the same location share one fetch
+            with metrics.phase('fetch'):
+                response_data = weather_flights.do(
+                    get_cache_key(lat, lon, 'metric'),
+                    lambda: fetch_weather_data(lat, lon),
+                    recheck=lambda: get_from_cache(lat, lon, 'metric')
+                )
+            with metrics.phase('serialize'):
+                return filled_weather_response(lat, lon, city, units, response_data)
 
         except Exception as e:
             return jsonify({'error': f'Error processing weather data: {str(e)}'}), 500
@@ -671,7 +692,9 @@ def search_cities_api():
     if len(query) < 2:
         return jsonify([])
     
-    cities = search_cities(query)
+    source = 'local' if city_data().index else 'geocoding'
+    with metrics.phase('search', search_seconds, source):
+        cities = search_cities(query)
     suggestions = []
     
     for city in cities:
@@ -698,81 +721,196 @@ def geolocation():
     if not lat or not lon:
         return jsonify({'error': 'Coordinates required'}), 400
     
-    url = f"http://api.openweathermap.org/geo/1.0/reverse"
-    params = {'lat': lat, 'lon': lon, 'limit': 1, 'appid': API_KEY}
-    
     try:
-        response = requests.get(url, params=params, timeout=5)
-        if response.status_code == 200 and response.json():
-            return jsonify(response.json()[0])
+        place = reverse_geocode(lat, lon)
+        if place:
+            return jsonify(place)
         return jsonify({'error': 'Location not found'}), 404
     except requests.exceptions.RequestException:
         return jsonify({'error': 'Geocoding service unavailable'}), 500
 
-@app.route('/api/compare', methods=['POST'])
-def compare_weather():
-    """API endpoint for comparing weather between cities"""
+def compare_request():
+    """((cities, units), None) for a /api/compare body, or (None, error response)"""
     data = request.get_json()
     cities = data.get('cities', [])
     units = data.get('units', 'metric')
     
     if len(cities) < 2:
-        return jsonify({'error': 'At least 2 cities required for comparison'}), 400
+        return None, (jsonify({'error': 'At least 2 cities required for comparison'}), 400)
+    # At most 4 cities are compared
+    return (cities[:4], units), None
+
+def comparison_entry(weather_data, units):
+    """/api/compare row for a metric current weather payload, or None if its
+    call failed"""
+    if not weather_data or 'error' in weather_data:
+        return None
+    temp = round(weather_data['main']['temp'])
+    feels_like = round(weather_data['main']['feels_like'])
+    wind_speed = round(weather_data['wind']['speed'] * 3.6, 1)  # Convert m/s to km/h
     
-    comparison_data = []
+    temp_unit = '°C'
+    speed_unit = 'km/h'
     
-    for city in cities[:4]:
-        # Always fetch in metric then convert
-        weather_data = get_current_weather(city, 'metric')
-        if 'error' not in weather_data:
-            temp = round(weather_data['main']['temp'])
-            feels_like = round(weather_data['main']['feels_like'])
-            wind_speed = round(weather_data['wind']['speed'] * 3.6, 1)  # Convert m/s to km/h
-            
-            temp_unit = '°C'
-            speed_unit = 'km/h'
-            
-            # Convert to imperial if requested
-            if units == 'imperial':
-                temp = round((temp * 9/5) + 32)
-                feels_like = round((feels_like * 9/5) + 32)
-                wind_speed = round(wind_speed * 0.621371, 1)  # Convert km/h to mph
-                temp_unit = '°F'
-                speed_unit = 'mph'
-            
-            comparison_data.append({
-                'city': weather_data['name'], 'country': weather_data['sys']['country'],
-                'temp': temp, 'feels_like': feels_like,
-                'humidity': weather_data['main']['humidity'], 'wind_speed': wind_speed,
-                'description': weather_data['weather'][0]['description'].title(),
-                'icon': weather_data['weather'][0]['icon'],
-                'temp_unit': temp_unit, 'speed_unit': speed_unit
-            })
+    # Convert to imperial if requested
+    if units == 'imperial':
+        temp = round((temp * 9/5) + 32)
+        feels_like = round((feels_like * 9/5) + 32)
+        wind_speed = round(wind_speed * 0.621371, 1)  # Convert km/h to mph
+        temp_unit = '°F'
+        speed_unit = 'mph'
     
-    return jsonify(comparison_data)
+    return {
+        'city': weather_data['name'], 'country': weather_data['sys']['country'],
+        'temp': temp, 'feels_like': feels_like,
+        'humidity': weather_data['main']['humidity'], 'wind_speed': wind_speed,
+        'description': weather_data['weather'][0]['description'].title(),
+        'icon': weather_data['weather'][0]['icon'],
+        'temp_unit': temp_unit, 'speed_unit': speed_unit,
+        'cached': False
+    }
 
-@app.route('/api/favorites/bulk', methods=['POST'])
-def get_bulk_favorites():
-    """API endpoint for getting weather data for multiple favorite cities"""
+def comparison_row(place, data, cached):
+    """/api/compare row for a resolved city from its weather entry (as
+    /api/weather serves it) in the requested units"""
+    current = data['current']
+    return {
+        'city': place['name'], 'country': place['country'],
+        'temp': current['temp'], 'feels_like': current['feels_like'],
+        'humidity': current['humidity'], 'wind_speed': current['wind_speed'],
+        'description': current['description'], 'icon': current['icon'],
+        'temp_unit': current['temp_unit'], 'speed_unit': current['speed_unit'],
+        'cached': cached
+    }
+
+def collect_cached_comparisons(cities, units):
+    """/api/compare rows for cities, in order, with None for the ones still
+    to fetch, and the (name, place) of those: place is the resolved city,
+    or None for names the local index does not know"""
+    rows = []
+    misses = []
+    for name in cities:
+        place = resolve_city_name(name)
+        # Resolved cities share the entries /api/weather fills
+        cached = place and get_with_revalidation(place['lat'], place['lon'], units)
+        if cached:
+            rows.append(comparison_row(place, cached[0], True))
+        else:
+            rows.append(None)
+            misses.append((name, place))
+    return rows, misses
+
+def filled_comparison_row(place, units, response_data):
+    """/api/compare row for a resolved city just fetched as response_data,
+    or None if its upstream calls failed"""
+    if 'error' in response_data:
+        return None
+    data, _ = get_filled_entry(place['lat'], place['lon'], units, response_data)
+    return comparison_row(place, data, False)
+
+def fetch_comparison(miss, units):
+    """/api/compare row for an uncached city, or None if it could not be
+    fetched"""
+    name, place = miss
+    if place is None:
+        # Unknown locally: look the name up with the current weather API
+        return comparison_entry(get_current_weather(name, 'metric'), units)
+    lat, lon = place['lat'], place['lon']
+    with metrics.phase('fetch'):
+        response_data = weather_flights.do(
+            get_cache_key(lat, lon, 'metric'),
+            lambda: fetch_weather_data(lat, lon),
+            recheck=lambda: get_from_cache(lat, lon, 'metric')
+        )
+    return filled_comparison_row(place, units, response_data)
+
+def comparison_response(rows, fetched):
+    """/api/compare response from the cached rows and the BatchResults of
+    fetch_comparison for the missing ones, in order"""
+    fetched = iter(fetched)
+    rows = [row if row is not None else next(fetched).value for row in rows]
+    return jsonify([row for row in rows if row])
+
+@app.route('/api/compare', methods=['POST'])
+def compare_weather():
+    """API endpoint for comparing weather between cities"""
+    target, error = compare_request()
+    if error:
+        return error
+    cities, units = target
+    
+    # Names resolve through the local city index to coordinates, so cities
+    # viewed recently are served from the weather cache
+    with metrics.phase('cache'):
+        rows, misses = collect_cached_comparisons(cities, units)
+    
+    # The rest are fetched concurrently, below interactive requests in the
+    # upstream budget
+    with upstream.priority(upstream.BULK):
+        fetched = upstream.batch(lambda miss: fetch_comparison(miss, units), misses)
+    return comparison_response(rows, fetched)
+
+def favorite_result(favorite, units, response_data):
+    """Bulk result entry for a favorite just fetched as response_data, or
+    None if its upstream calls failed"""
+    name = favorite.get('name', 'Unknown')
+    if 'error' in response_data:
+        print(f"Error fetching weather for {name}: {response_data['error']}")
+        return None
+    data, _ = get_filled_entry(favorite.get('lat'), favorite.get('lon'), units, response_data)
+    data = located(data, favorite.get('lat'), favorite.get('lon'), name)
+    return {
+        'name': name,
+        'lat': favorite.get('lat'),
+        'lon': favorite.get('lon'),
+        'data': forecast_view(data, FAVORITE_HOURS, FAVORITE_DAYS),
+        'cached': False
+    }
+
+def fetch_favorite_weather(favorite, units='metric'):
+    """Fetch and cache weather for one uncached favorite, returning its bulk
+    result entry or None if the upstream calls failed"""
+    lat = favorite.get('lat')
+    lon = favorite.get('lon')
+    name = favorite.get('name', 'Unknown')
+    
+    try:
+        # The same full entry /api/weather uses, shared through the cache
+        with metrics.phase('fetch'):
+            response_data = weather_flights.do(
+                get_cache_key(lat, lon, 'metric'),
+                lambda: fetch_weather_data(lat, lon),
+                recheck=lambda: get_from_cache(lat, lon, 'metric')
+            )
+        return favorite_result(favorite, units, response_data)
+    
+    except Exception as e:
+        # Log error but continue with other favorites
+        print(f"Error fetching weather for {name}: {str(e)}")
+    return None
+
+def bulk_request():
+    """((favorites, units), None) for a /api/favorites/bulk body, or (None,
+    error response)"""
     data = request.get_json()
     favorites = data.get('favorites', [])
     units = data.get('units', 'metric')
     
     if not favorites:
-        return jsonify({'error': 'No favorites provided'}), 400
+        return None, (jsonify({'error': 'No favorites provided'}), 400)
     
     if not API_KEY:
-        return jsonify({'error': 'API key not configured'}), 400
-    
-    # Clean up expired cache entries
-    cleanup_cache()
-    
+        return None, (jsonify({'error': 'API key not configured'}), 400)
+    # Limit to 10 favorites to avoid too many API calls
+    return (favorites[:10], units), None
+
+def collect_cached_favorites(favorites, units):
+    """Bulk results for the cached favorites, and the favorites that need
+    fetching"""
     results = []
-    cached_count = 0
     api_calls_needed = []
     
-    # First, check what we have in cache
-    for favorite in favorites[:10]:  # Limit to 10 favorites to avoid too many API calls
+    for favorite in favorites:
         lat = favorite.get('lat')
         lon = favorite.get('lon')
         name = favorite.get('name', 'Unknown')
@@ -780,234 +918,412 @@ def get_bulk_favorites():
         if not lat or not lon:
             continue
             
-        # Check cache first
-        cached_data = get_from_cache(lat, lon, 'metric')
-        if cached_data:
-            # Convert if needed and add to results
-            if units == 'imperial':
-                cached_data = convert_units(cached_data, 'metric', 'imperial')
+        # Check cache first (entries are shared with /api/weather), reusing
+        # the favorites view's encoded bytes (minus the trailing newline)
+        # inside the bulk response
+        cached = get_with_revalidation(lat, lon, units)
+        if cached:
+            data, timestamp = cached
+            encoded = get_encoded_response(f"{response_key(lat, lon, units, name)}:favorite",
+                                           forecast_view(located(data, lat, lon, name), FAVORITE_HOURS, FAVORITE_DAYS),
+                                           timestamp)
             results.append({
                 'name': name,
                 'lat': lat,
                 'lon': lon,
-                'data': cached_data,
+                'data': RawJSON(memoryview(encoded.body)[:-1]),
                 'cached': True
             })
-            cached_count += 1
         else:
             api_calls_needed.append(favorite)
+    return results, api_calls_needed
+
+def fetched_favorite_entry(result):
+    """Bulk result entry for a BatchResult of fetch_favorite_weather, or None
+    if the favorite could not be fetched"""
+    if not result.value:
+        return None
+    result.value['fetch_ms'] = round(result.elapsed * 1000)
+    result.value['data'] = RawJSON(dump_json(result.value['data']).encode())
+    return result.value
+
+def bulk_favorites_response(results, api_calls_needed, fetched):
+    """/api/favorites/bulk response from the cached results and the
+    BatchResults of fetch_favorite_weather for api_calls_needed"""
+    cached_count = len(results)
+    for result in fetched:
+        entry = fetched_favorite_entry(result)
+        if entry:
+            results.append(entry)
     
-    # Now make API calls for non-cached favorites
-    for favorite in api_calls_needed:
-        lat = favorite.get('lat')
-        lon = favorite.get('lon')
-        name = favorite.get('name', 'Unknown')
-        
-        try:
-            # Use One Call API for comprehensive data
-            one_call_data = get_one_call_data(lat, lon, 'metric')
-            
-            if 'error' not in one_call_data:
-                # Build response data (similar to main weather endpoint but simplified)
-                temp_unit = '°C'
-                speed_unit = 'km/h'
-                
-                is_day = one_call_data['current']['dt'] > one_call_data['current'].get('sunrise', 0) and one_call_data['current']['dt'] < one_call_data['current'].get('sunset', 0)
-                timezone_offset = one_call_data.get('timezone_offset', 0)
-                
-                current_data = {
-                    'city': name,
-                    'country': '',
-                    'temp': round(one_call_data['current']['temp']),
-                    'feels_like': round(one_call_data['current']['feels_like']),
-                    'humidity': one_call_data['current']['humidity'],
-                    'pressure': one_call_data['current']['pressure'],
-                    'wind_speed': round(one_call_data['current']['wind_speed'] * 3.6, 1),
-                    'description': one_call_data['current']['weather'][0]['description'].title(),
-                    'icon': one_call_data['current']['weather'][0]['icon'],
-                    'visibility': round(one_call_data['current'].get('visibility', 0) / 1000) if one_call_data['current'].get('visibility') is not None else 'N/A',
-                    'visibility_unit': 'km',
-                    'sunrise': format_time_with_offset(one_call_data['current'].get('sunrise'), timezone_offset),
-                    'sunset': format_time_with_offset(one_call_data['current'].get('sunset'), timezone_offset),
-                    'timezone': timezone_offset,
-                    'temp_unit': temp_unit,
-                    'speed_unit': speed_unit,
-                    'weather_main': one_call_data['current']['weather'][0]['main'],
-                    'is_day': is_day,
-                    'uv_index': one_call_data['current'].get('uvi', 0),
-                    'uv_info': get_uv_category(one_call_data['current'].get('uvi', 0)),
-                    'local_time': get_local_time(timezone_offset).strftime('%Y-%m-%d %H:%M:%S'),
-                    'lat': lat,
-                    'lon': lon
-                }
-                
-                # Get air quality data
-                air_quality_data = get_air_quality(lat, lon)
-                air_quality = None
-                if 'error' not in air_quality_data:
-                    aqi = air_quality_data['list'][0]['main']['aqi']
-                    components = air_quality_data['list'][0]['components']
-                    aqi_info = get_aqi_category(aqi)
-                    air_quality = {
-                        'aqi': aqi, 'level': aqi_info['level'], 'color': aqi_info['color'],
-                        'description': aqi_info['description'], 'components': components
-                    }
-                
-                # Build simplified hourly forecast (just next 6 hours for favorites)
-                hourly_forecast = []
-                for hour in one_call_data.get('hourly', [])[:6]:
-                    hourly_forecast.append({
-                        'dt': hour['dt'], 'temp': round(hour['temp']),
-                        'description': hour['weather'][0]['description'].title(),
-                        'icon': hour['weather'][0]['icon'], 'pop': round(hour.get('pop', 0) * 100),
-                        'humidity': hour['humidity'], 'wind_speed': round(hour['wind_speed'] * 3.6, 1)
-                    })
-                
-                # Build simplified daily forecast (just next 3 days for favorites)
-                daily_forecast = []
-                for day in one_call_data.get('daily', [])[:3]:
-                    daily_forecast.append({
-                        'dt': day['dt'], 'temp_max': round(day['temp']['max']), 'temp_min': round(day['temp']['min']),
-                        'description': day['weather'][0]['description'].title(), 'icon': day['weather'][0]['icon'],
-                        'pop': round(day.get('pop', 0) * 100), 'humidity': day['humidity'],
-                        'wind_speed': round(day['wind_speed'] * 3.6, 1), 'uvi': day.get('uvi', 0)
-                    })
-                
-                response_data = {
-                    'current': current_data, 'hourly': hourly_forecast, 'daily': daily_forecast,
-                    'air_quality': air_quality, 'alerts': []
-                }
-                
-                # Save to cache
-                save_to_cache(lat, lon, 'metric', response_data)
-                
-                # Convert to imperial if requested
-                if units == 'imperial':
-                    response_data = convert_units(response_data, 'metric', 'imperial')
-                
-                results.append({
-                    'name': name,
-                    'lat': lat,
-                    'lon': lon,
-                    'data': response_data,
-                    'cached': False
-                })
-                
-            else:
-                # If One Call API fails, try basic current weather
-                weather_data = get_weather_by_coords(lat, lon, 'metric')
-                if 'error' not in weather_data:
-                    forecast_data = get_forecast_by_coords(lat, lon, 'metric') # Add this line
-                    
-                    temp = round(weather_data['main']['temp'])
-                    feels_like = round(weather_data['main']['feels_like'])
-                    wind_speed = round(weather_data['wind']['speed'] * 3.6, 1)
-                    
-                    # Convert to imperial if requested
-                    if units == 'imperial':
-                        temp = round((temp * 9/5) + 32)
-                        feels_like = round((feels_like * 9/5) + 32)
-                        wind_speed = round(wind_speed * 0.621371, 1)
-                    
-                    temp_unit = '°F' if units == 'imperial' else '°C'
-                    speed_unit = 'mph' if units == 'imperial' else 'km/h'
-                    
-                    # Fetch air quality data for the fallback
-                    air_quality_data = get_air_quality(lat, lon)
-                    air_quality = None
-                    if 'error' not in air_quality_data:
-                        aqi = air_quality_data['list'][0]['main']['aqi']
-                        components = air_quality_data['list'][0]['components']
-                        aqi_info = get_aqi_category(aqi)
-                        air_quality = {
-                            'aqi': aqi, 'level': aqi_info['level'], 'color': aqi_info['color'],
-                            'description': aqi_info['description'], 'components': components
-                        }
-                    
-                    # Build simplified hourly forecast from fallback data
-                    hourly_forecast = []
-                    if 'error' not in forecast_data:
-                        for entry in forecast_data.get('list', [])[:8]: # Next 6 hours
-                            hourly_forecast.append({
-                                'dt': entry['dt'], 'temp': round(entry['main']['temp']),
-                                'description': entry['weather'][0]['description'].title(),
-                                'icon': entry['weather'][0]['icon'], 'pop': round(entry.get('pop', 0) * 100),
-                                'humidity': entry['main']['humidity'], 'wind_speed': round(entry['wind']['speed'] * 3.6, 1)
-                            })
-                    
-                    # Build simplified daily forecast from fallback data
-                    daily_forecast = []
-                    if 'error' not in forecast_data:
-                        processed_dates = set()
-                        for entry in forecast_data.get('list', []):
-                            entry_date = datetime.fromtimestamp(entry['dt']).date()
-                            if entry_date not in processed_dates and len(daily_forecast) < 5: # Next 3 days
-                                temps_for_day = [e['main']['temp'] for e in forecast_data['list'] if datetime.fromtimestamp(e['dt']).date() == entry_date]
-                                wind_speeds_for_day = [e['wind']['speed'] for e in forecast_data['list'] if datetime.fromtimestamp(e['dt']).date() == entry_date]
-                                daily_forecast.append({
-                                    'dt': entry['dt'], 'temp_max': round(max(temps_for_day)), 'temp_min': round(min(temps_for_day)),
-                                    'description': entry['weather'][0]['description'].title(),
-                                    'icon': entry['weather'][0]['icon'], 'pop': round(entry.get('pop', 0) * 100),
-                                    'humidity': entry['main']['humidity'], 'wind_speed': round(sum(wind_speeds_for_day)/len(wind_speeds_for_day) * 3.6, 1), 'uvi': 0
-                                })
-                                processed_dates.add(entry_date)
-                    
-                    timezone_offset = weather_data.get('timezone', 0)
-                    is_day = weather_data['dt'] > weather_data['sys'].get('sunrise', 0) and weather_data['dt'] < weather_data['sys'].get('sunset', 0)
-                    
-                    # Simplified data for failed One Call API
-                    simplified_data = {
-                        'current': {
-                            'city': name,
-                            'country': weather_data['sys']['country'],
-                            'temp': temp,
-                            'feels_like': feels_like,
-                            'humidity': weather_data['main']['humidity'],
-                            'pressure': weather_data['main']['pressure'],
-                            'wind_speed': wind_speed,
-                            'description': weather_data['weather'][0]['description'].title(),
-                            'icon': weather_data['weather'][0]['icon'],
-                            'visibility': round(weather_data.get('visibility', 0) / 1000) if weather_data.get('visibility') is not None else 'N/A',
-                            'visibility_unit': 'km',
-                            'sunrise': format_time_with_offset(weather_data['sys'].get('sunrise'), weather_data.get('timezone', 0)),
-                            'sunset': format_time_with_offset(weather_data['sys'].get('sunset'), weather_data.get('timezone', 0)),
-                            'timezone': weather_data.get('timezone', 0),
-                            'local_time': get_local_time(weather_data.get('timezone', 0)).strftime('%Y-%m-%d %H:%M:%S'),
-                            'temp_unit': temp_unit,
-                            'speed_unit': speed_unit,
-                            'weather_main': weather_data['weather'][0]['main'],
-                            'lat': lat,
-                            'lon': lon,
-                            'is_day': is_day,
-                            'uv_index': 0,
-                            'uv_info': get_uv_category(0)
-                        },
-                        'hourly': hourly_forecast,
-                        'daily': daily_forecast,
-                        'air_quality': air_quality,
-                        'alerts': []
-                    }
-                    
-                    results.append({
-                        'name': name,
-                        'lat': lat,
-                        'lon': lon,
-                        'data': simplified_data,
-                        'cached': False
-                    })
-        
-        except Exception as e:
-            # Log error but continue with other favorites
-            print(f"Error fetching weather for {name}: {str(e)}")
-            continue
-    
-    return jsonify({
+    body = encode_json({
         'results': results,
         'cached_count': cached_count,
         'total_count': len(results),
         'api_calls_made': len(api_calls_needed) - (len(api_calls_needed) - len([r for r in results if not r.get('cached', True)]))
+    }, dump_json)
+    return encoded_json_response(EncodedResponse(body + b'\n'), compress=False)
+
+# Streamed /api/favorites/bulk formats, chosen with ?stream= or Accept
+BULK_STREAM_TYPES = {'ndjson': 'application/x-ndjson', 'sse': 'text/event-stream'}
+
+def bulk_stream_format():
+    """'ndjson' or 'sse' when the client asked for a streamed bulk response,
+    else None (one JSON document, for older clients)"""
+    requested = request.args.get('stream')
+    if requested in BULK_STREAM_TYPES:
+        return requested
+    # Only an explicit Accept entry counts, not */*
+    for mimetype, quality in request.accept_mimetypes:
+        for stream_format, stream_type in BULK_STREAM_TYPES.items():
+            if mimetype == stream_type and quality > 0:
+                return stream_format
+    return None
+
+def bulk_stream_record(kind, value, stream_format):
+    """One streamed record: a 'result' entry or the final 'summary'. NDJSON
+    lines are {kind: value}; SSE events are named kind with value as data."""
+    body = encode_json(value, dump_json)
+    if stream_format == 'sse':
+        return b'event: ' + kind.encode() + b'\ndata: ' + body + b'\n\n'
+    return encode_json({kind: RawJSON(body)}, dump_json) + b'\n'
+
+def bulk_stream_summary(cached_count, fetched_count):
+    return {'cached_count': cached_count, 'total_count': cached_count + fetched_count, 'api_calls_made': fetched_count}
+
+def bulk_stream_response(records, stream_format):
+    """Streamed response for an iterable (or async iterable) of records"""
+    response = app.response_class(records, mimetype=BULK_STREAM_TYPES[stream_format])
+    response.headers['Cache-Control'] = 'no-cache'
+    # Don't let a buffering proxy hold the records back
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+def stream_bulk_favorites(results, api_calls_needed, units, stream_format):
+    """Yield the cached favorites' records straight away, then each fetched
+    favorite's as soon as its fetch completes, then the summary"""
+    for entry in results:
+        yield bulk_stream_record('result', entry, stream_format)
+    fetched_count = 0
+    with upstream.priority(upstream.BULK):
+        fetches = upstream.batch_iter(lambda favorite: fetch_favorite_weather(favorite, units), api_calls_needed)
+        for _, result in fetches:
+            entry = fetched_favorite_entry(result)
+            if entry:
+                fetched_count += 1
+                yield bulk_stream_record('result', entry, stream_format)
+    yield bulk_stream_record('summary', bulk_stream_summary(len(results), fetched_count), stream_format)
+
+@app.route('/api/favorites/bulk', methods=['POST'])
+def get_bulk_favorites():
+    """API endpoint for getting weather data for multiple favorite cities"""
+    target, error = bulk_request()
+    if error:
+        return error
+    favorites, units = target
+    
+    # First, check what we have in cache
+    with metrics.phase('cache'):
+        results, api_calls_needed = collect_cached_favorites(favorites, units)
+    
+    stream_format = bulk_stream_format()
+    if stream_format:
+        return bulk_stream_response(
+            stream_with_context(stream_bulk_favorites(results, api_calls_needed, units, stream_format)), stream_format)
+    
+    # Now make API calls for non-cached favorites, several at a time and
+    # below interactive requests in the upstream budget
+    with upstream.priority(upstream.BULK):
+        fetched = upstream.batch(lambda favorite: fetch_favorite_weather(favorite, units), api_calls_needed)
+    with metrics.phase('serialize'):
+        return bulk_favorites_response(results, api_calls_needed, fetched)
+
+# /api/weather/batch takes at most WEATHER_BATCH_MAX_LOCATIONS locations,
+# fetching at most WEATHER_BATCH_CONCURRENCY of the uncached ones at a time
+WEATHER_BATCH_MAX_LOCATIONS = int(os.getenv("WEATHER_BATCH_MAX_LOCATIONS", "500"))
+WEATHER_BATCH_CONCURRENCY = int(os.getenv("WEATHER_BATCH_CONCURRENCY", str(upstream.BATCH_CONCURRENCY)))
+# Views a batch item can ask for: the full /api/weather entry, or the
+# favorites' (hours, days) summary
+BATCH_VIEWS = {'full': None, 'summary': (FAVORITE_HOURS, FAVORITE_DAYS)}
+
+BatchItem = namedtuple('BatchItem', 'index id lat lon name units view key')
+
+def batch_item(index, location, units, view):
+    """BatchItem for one entry of a /api/weather/batch body, or an error
+    message if it cannot be served"""
+    if not isinstance(location, dict):
+        return 'Location must be an object'
+    try:
+        lat = float(location['lat'])
+        lon = float(location['lon'])
+    except (KeyError, TypeError, ValueError):
+        return 'Coordinates required'
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return 'Coordinates out of range'
+    # Either may come from the body as any JSON value, lists included
+    units = location.get('units', units)
+    if not isinstance(units, str) or units not in UNIT_SYSTEMS:
+        return f"Unknown units: {units}"
+    view = location.get('view', view)
+    if not isinstance(view, str) or view not in BATCH_VIEWS:
+        return f"Unknown view: {view}"
+    # Locations sharing a metric cache key are looked up and fetched once
+    return BatchItem(index, location.get('id'), lat, lon, location.get('name', ''), units, view,
+                     get_cache_key(lat, lon, 'metric'))
+
+def weather_batch_request():
+    """(items, None) for a /api/weather/batch body, with a BatchItem or an
+    error message per location, or (None, error response)"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return None, (jsonify({'error': 'Invalid JSON data'}), 400)
+    locations = data.get('locations')
+    if not isinstance(locations, list) or not locations:
+        return None, (jsonify({'error': 'No locations provided'}), 400)
+    if len(locations) > WEATHER_BATCH_MAX_LOCATIONS:
+        return None, (jsonify({'error': f'At most {WEATHER_BATCH_MAX_LOCATIONS} locations per request'}), 400)
+    if not API_KEY:
+        return None, (jsonify({'error': 'API key not configured'}), 400)
+
+    units = data.get('units', 'metric')
+    view = data.get('view', 'full')
+    return [batch_item(index, location, units, view) for index, location in enumerate(locations)], None
+
+def batch_locations(items):
+    """{metric cache key: first BatchItem with it}: the distinct locations of
+    a batch"""
+    locations = {}
+    for item in items:
+        if isinstance(item, BatchItem):
+            locations.setdefault(item.key, item)
+    return locations
+
+def collect_cached_locations(locations):
+    """{key: cached metric (data, timestamp)} for the batch locations in the
+    cache (entries are shared with /api/weather), and the BatchItems of the
+    ones that need fetching"""
+    cached = {}
+    misses = []
+    for key, item in locations.items():
+        entry = get_with_revalidation(item.lat, item.lon)
+        if entry:
+            cached[key] = entry
+        else:
+            misses.append(item)
+    return cached, misses
+
+def fetch_batch_location(item):
+    """fetch_weather_data() for an uncached batch location, shared with
+    concurrent requests for it"""
+    with metrics.phase('fetch'):
+        return weather_flights.do(
+            item.key,
+            lambda: fetch_weather_data(item.lat, item.lon),
+            recheck=lambda: get_from_cache(item.lat, item.lon, 'metric')
+        )
+
+def fetch_claimed_location(item):
+    """The cached metric data of a batch location whose flight this request
+    claimed, or fetch_weather_payloads() for it"""
+    with metrics.phase('fetch'):
+        cached = get_from_cache(item.lat, item.lon, 'metric')
+        if cached is not None:
+            return cached
+        return fetch_weather_payloads(item.lat, item.lon)
+
+def normalize_claimed_locations(claimed, fetched):
+    """Normalize and cache the One Call payloads among the BatchResults of
+    fetch_claimed_location for the claimed BatchItems, all in one
+    from_one_call_batch() pass.  Returns the BatchResults with their
+    normalized metric data."""
+    pending = [index for index, result in enumerate(fetched) if isinstance(result.value, OneCallPayloads)]
+    try:
+        normalized = from_one_call_batch([fetched[index].value for index in pending])
+    except Exception:
+        # A malformed payload fails its own location only, as it would alone
+        normalized = [None] * len(pending)
+    fetched = list(fetched)
+    for index, variants in zip(pending, normalized):
+        item, result = claimed[index], fetched[index]
+        try:
+            if variants is None:
+                data = from_one_call(*result.value).to_dict()
+                variants = {units: convert_units(data, 'metric', units) for units in UNIT_SYSTEMS}
+            cache_variants(item.lat, item.lon, variants)
+            fetched[index] = result._replace(value=variants['metric'])
+            fetch_outcomes.inc('one_call', 'ok')
+        except Exception as e:
+            fetched[index] = result._replace(value=None, error=e)
+    return fetched
+
+def fetch_batch_misses(misses):
+    """BatchResults of fetching the uncached batch locations, in order.
+
+    Misses whose flights this request can claim (no other request is
+    fetching them) have their upstream calls made concurrently, then their
+    One Call payloads normalized together: from_one_call_batch() does the
+    per-row rounding and conversions once per field for the whole batch.
+    Requests for those locations that arrive meanwhile wait for the claimed
+    flights.  Only once they are settled does this request join the flights
+    of the other misses (through fetch_batch_location()), so two batches
+    never wait on each other's claims."""
+    claimed = []
+    if len(misses) >= MIN_BATCH_ITEMS:
+        claimed = [item for item in misses if weather_flights.claim(item.key)]
+    fetched = {}
+    try:
+        results = upstream.batch(fetch_claimed_location, claimed, max_concurrency=WEATHER_BATCH_CONCURRENCY)
+        fetched.update(zip((item.key for item in claimed), normalize_claimed_locations(claimed, results)))
+    finally:
+        for item in claimed:
+            result = fetched.get(item.key)
+            if result is None:
+                weather_flights.settle(item.key, error=RuntimeError('Batch fetch failed'))
+            else:
+                weather_flights.settle(item.key, result.value, result.error)
+
+    rest = [item for item in misses if item.key not in fetched]
+    results = upstream.batch(fetch_batch_location, rest, max_concurrency=WEATHER_BATCH_CONCURRENCY)
+    fetched.update(zip((item.key for item in rest), results))
+    return [fetched[item.key] for item in misses]
+
+def batch_view_json(item, entry):
+    """RawJSON of the view item asks for of its (data, timestamp) entry in
+    its units. Cache entries reuse (and fill) the encoded responses of
+    /api/weather and the favorites, minus the trailing newline."""
+    data, timestamp = entry
+    data = located(data, item.lat, item.lon, item.name)
+    cache_key = response_key(item.lat, item.lon, item.units, item.name)
+    window = BATCH_VIEWS[item.view]
+    if window is not None:
+        data = forecast_view(data, *window)
+        cache_key = f"{cache_key}:favorite"
+    if timestamp is None:
+        return RawJSON(dump_json(data).encode())
+    return RawJSON(memoryview(get_encoded_response(cache_key, data, timestamp).body)[:-1])
+
+def batch_result(item, cached, fetched, rendered):
+    """Result entry for one batch item, given the cached metric entries and
+    BatchResults of fetch_batch_location by key, and the views already
+    rendered for this response"""
+    if not isinstance(item, BatchItem):
+        return {'status': 'invalid', 'error': item}
+    result = {'id': item.id, 'lat': item.lat, 'lon': item.lon, 'units': item.units, 'view': item.view}
+    if item.key in cached:
+        result.update(status='ok', cached=True)
+    else:
+        fetch = fetched[item.key]
+        response_data = fetch.value if fetch.error is None else {'error': f'Error processing weather data: {fetch.error}'}
+        if response_data.get('rate_limited'):
+            result.update(status='rate_limited', error='Weather service is busy, please try again shortly')
+            return result
+        if 'error' in response_data:
+            result.update(status='error', error=response_data['error'])
+            return result
+        result.update(status='ok', cached=False, fetch_ms=round(fetch.elapsed * 1000))
+
+    # Duplicates of a location, name, units and view share one rendering
+    render_key = (item.key, item.lat, item.lon, item.name, item.units, item.view)
+    if render_key not in rendered:
+        if item.key in cached:
+            entry = get_units_entry(item.lat, item.lon, item.units, cached[item.key])
+        else:
+            entry = get_filled_entry(item.lat, item.lon, item.units, fetched[item.key].value)
+        rendered[render_key] = batch_view_json(item, entry)
+    result['data'] = rendered[render_key]
+    return result
+
+def weather_batch_response(items, locations, cached, fetched):
+    """/api/weather/batch response: a result per item, in request order, and
+    the batch counts"""
+    rendered = {}
+    results = []
+    for index, item in enumerate(items):
+        result = {'index': index}
+        result.update(batch_result(item, cached, fetched, rendered))
+        results.append(result)
+    body = encode_json({
+        'results': results,
+        'requested': len(items),
+        'unique_locations': len(locations),
+        'cached': len(cached),
+        'fetched': sum(1 for result in fetched.values() if result.error is None and 'error' not in result.value),
+        'failed': sum(1 for result in results if result['status'] != 'ok')
+    }, dump_json)
+    return encoded_json_response(EncodedResponse(body + b'\n'))
+
+@app.route('/api/weather/batch', methods=['POST'])
+def get_weather_batch():
+    """API endpoint for weather at up to WEATHER_BATCH_MAX_LOCATIONS locations
+    in one round trip, each with its own units and view"""
+    items, error = weather_batch_request()
+    if error:
+        return error
+    locations = batch_locations(items)
+
+    with metrics.phase('cache'):
+        cached, misses = collect_cached_locations(locations)
+
+    # Each distinct uncached location is fetched once, a bounded number at a
+    # time and below interactive requests in the upstream budget
+    with upstream.priority(upstream.BULK):
+        fetched = fetch_batch_misses(misses)
+    with metrics.phase('serialize'):
+        return weather_batch_response(items, locations, cached,
+                                      {item.key: result for item, result in zip(misses, fetched)})
+
+@app.route('/api/status', methods=['GET'])
+def status():
+    """API endpoint reporting upstream client and cache metrics for this worker"""
+    return jsonify({
+        'upstream': upstream.stats(),
+        'cache': weather_cache.stats(),
+        'single_flight': weather_flights.stats(),
+        'revalidation': weather_revalidator.stats(),
+        'encoded_responses': encoded_responses.stats()
     })
 
+def cache_tiers(name, stats):
+    """(labels, stats) for each tier of a cache's stats()"""
+    if stats['backend'] == 'tiered':
+        return [({'cache': name, 'tier': tier}, stats[tier]) for tier in ('l1', 'l2')]
+    return [({'cache': name, 'tier': stats['backend']}, stats)]
+
+@metrics.REGISTRY.collector
+def stats_metrics():
+    """Metrics read from the stats() of the caches, single flight, upstream
+    budget and circuit breakers when /metrics is scraped"""
+    tiers = cache_tiers('weather', weather_cache.stats()) + cache_tiers('encoded_responses', encoded_responses.stats())
+    flights = weather_flights.stats()
+    revalidation = weather_revalidator.stats()
+    budget = upstream.limiter.stats()
+    breakers = {path: breaker.stats() for path, breaker in upstream.breakers.items()}
+    yield 'weather_cache_entries', 'gauge', 'Entries in the cache', [(labels, s['entries']) for labels, s in tiers]
+    yield 'weather_cache_bytes', 'gauge', 'Approximate size of the cache', [(labels, s.get('bytes')) for labels, s in tiers]
+    for counter in ('hits', 'stale_hits', 'misses', 'evictions', 'expirations'):
+        yield (f'weather_cache_{counter}_total', 'counter', f"Cache {counter.replace('_', ' ')}",
+               [(labels, s[counter]) for labels, s in tiers])
+    yield 'weather_single_flight_in_flight', 'gauge', 'Fetches in flight', [({}, flights['in_flight'])]
+    for counter in ('leaders', 'coalesced', 'timeouts'):
+        yield f'weather_single_flight_{counter}_total', 'counter', f"Single-flight {counter}", [({}, flights[counter])]
+    for counter in ('stale_served', 'revalidations', 'hot_refreshes', 'failures'):
+        yield (f'weather_revalidation_{counter}_total', 'counter', f"Revalidation {counter.replace('_', ' ')}",
+               [({}, revalidation[counter])])
+    yield 'weather_upstream_budget_tokens', 'gauge', 'Upstream call tokens available', [({}, budget['tokens'])]
+    for counter in ('granted', 'refused'):
+        yield (f'weather_upstream_budget_{counter}_total', 'counter', f"Upstream call tokens {counter} by priority",
+               [({'priority': priority}, count) for priority, count in budget[counter].items()])
+    yield ('weather_circuit_breaker_state', 'gauge', 'Circuit breaker state (1 for the current one)',
+           [({'endpoint': path, 'state': state}, int(s['state'] == state))
+            for path, s in breakers.items() for state in ('closed', 'half-open', 'open')])
+    yield ('weather_circuit_breaker_rejected_total', 'counter', 'Calls refused by the circuit breaker',
+           [({'endpoint': path}, s['rejected']) for path, s in breakers.items()])
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus metrics for this worker"""
+    return app.response_class(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('404.html'), 404
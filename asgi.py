@@ -0,0 +1,492 @@
+"""Optional ASGI entry point: serve the app from an event loop.
+
+    pip install -r requirements-async.txt
+    uvicorn asgi:app --workers 2
+
+A sync worker is tied up for the whole of each upstream round trip, so the
+WSGI app's concurrency is capped by its worker and thread counts.  Here the
+API routes that call OpenWeatherMap (/api/weather, /api/weather/batch,
+/api/compare, /api/favorites/bulk, /api/geolocation), plus /api/search
+and /api/status, run as coroutines.  Upstream calls go through upstream.get_async() on a
+pooled httpx.AsyncClient, so one process keeps hundreds of requests in
+flight.  Everything else (pages, static files) is the Flask app run on a
+thread pool by asgiref's WsgiToAsgi.
+
+The coroutine views run inside a Flask request context and reuse app.py's
+request parsing, cache, normalization and response helpers, with Flask's
+before/after request hooks (CORS), so responses are identical in both
+modes.  Helpers that can block (cache reads and writes, which are disk I/O
+with the sqlite backend; the city database, compiled on first use; search
+falling back to the geocoding API) run on threads via offload(), so they
+never stall the event loop.  Background revalidation still runs app.fetch_weather_data on the
+upstream thread pool.  Misses coalesce per worker (AsyncSingleFlight); the
+SINGLE_FLIGHT_LOCK_DIR cross-worker lock is not used in this mode.
+"""
+
+import asyncio
+import sys
+import time
+from io import BytesIO
+
+import requests
+from asgiref.wsgi import WsgiToAsgi
+from flask import jsonify, request
+
+import app as weather_app
+import metrics
+import upstream
+from single_flight import AsyncSingleFlight
+
+try:
+    import httpx  # noqa: F401 - upstream.get_async() needs it
+except ImportError as e:
+    raise ImportError("The ASGI mode needs httpx: pip install -r requirements-async.txt") from e
+
+API_KEY = weather_app.API_KEY
+flask_app = weather_app.app
+weather_flights = AsyncSingleFlight(timeout=weather_app.weather_flights.timeout,
+                                    enabled=weather_app.weather_flights.enabled)
+
+
+def offload(fn, *args):
+    """Awaitable running a blocking app.py helper on a thread, in the
+    caller's context (Flask request, metrics phases)"""
+    return asyncio.to_thread(fn, *args)
+
+
+# Async counterparts of the upstream helpers in app.py (keep their results
+# and error messages in step)
+
+async def get_current_weather(city, units='metric', timeout=None):
+    params = {'q': city, 'appid': API_KEY, 'units': units}
+    try:
+        response = await upstream.get_async('data/2.5/weather', params=params, timeout=timeout)
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 404:
+            return {'error': 'City not found'}
+        else:
+            return {'error': f'Weather service error: {response.status_code}'}
+    except requests.exceptions.RequestException as e:
+        return {'error': f'Network error: {str(e)}'}
+
+
+async def get_weather_by_coords(lat, lon, units='metric', timeout=None, deadline=None):
+    params = {'lat': lat, 'lon': lon, 'appid': API_KEY, 'units': units}
+    try:
+        response = await upstream.get_async('data/2.5/weather', params=params, timeout=timeout, deadline=deadline)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return {'error': f'Weather service error: {response.status_code}'}
+    except requests.exceptions.RequestException as e:
+        return {'error': f'Network error: {str(e)}'}
+
+
+async def get_one_call_data(lat, lon, units='metric', timeout=None, deadline=None):
+    params = {'lat': lat, 'lon': lon, 'appid': API_KEY, 'units': units, 'exclude': 'minutely'}
+    try:
+        response = await upstream.get_async('data/3.0/onecall', params=params, timeout=timeout, deadline=deadline)
+        if response.status_code == 200:
+            return response.json()
+        elif response.status_code == 429:
+            return {'error': 'One Call API rate limit exceeded', 'rate_limited': True}
+        else:
+            return {'error': f'One Call API error: {response.status_code}'}
+    except upstream.RateLimited as e:
+        return {'error': str(e), 'rate_limited': True}
+    except upstream.CircuitOpen:
+        return {'error': 'One Call API unavailable'}
+    except requests.exceptions.RequestException as e:
+        return {'error': f'Network error: {str(e)}'}
+
+
+async def get_air_quality(lat, lon, timeout=None, deadline=None):
+    params = {'lat': lat, 'lon': lon, 'appid': API_KEY}
+    try:
+        response = await upstream.get_async('data/2.5/air_pollution', params=params, timeout=timeout, deadline=deadline, optional=True)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return {'error': f'Air quality API error: {response.status_code}'}
+    except requests.exceptions.RequestException as e:
+        return {'error': f'Network error: {str(e)}'}
+
+
+async def get_forecast_by_coords(lat, lon, units='metric', timeout=None, deadline=None):
+    params = {'lat': lat, 'lon': lon, 'appid': API_KEY, 'units': units}
+    try:
+        response = await upstream.get_async('data/2.5/forecast', params=params, timeout=timeout, deadline=deadline)
+        if response.status_code == 200:
+            return response.json()
+        else:
+            return {'error': f'Forecast service error: {response.status_code}'}
+    except requests.exceptions.RequestException as e:
+        return {'error': f'Network error: {str(e)}'}
+
+
+async def reverse_geocode(lat, lon, timeout=5, deadline=None):
+    place = await offload(weather_app.nearby_place, lat, lon)
+    if place:
+        return place
+    params = {'lat': lat, 'lon': lon, 'limit': 1, 'appid': API_KEY}
+    response = await upstream.get_async('geo/1.0/reverse', params=params, timeout=timeout, deadline=deadline)
+    if response.status_code == 200 and response.json():
+        return response.json()[0]
+    return None
+
+
+async def wait(task, deadline, default=None):
+    """upstream.wait() for tasks: the result, or default once the budget runs
+    out (the task keeps running)"""
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), deadline.remaining())
+    except asyncio.TimeoutError:
+        return default
+
+
+def _timed_calls(fn, items, max_concurrency):
+    semaphore = asyncio.Semaphore(max(1, max_concurrency or upstream.BATCH_CONCURRENCY))
+
+    async def timed_call(item):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                return upstream.BatchResult(await fn(item), None, time.perf_counter() - start)
+            except Exception as e:
+                return upstream.BatchResult(None, e, time.perf_counter() - start)
+
+    return [timed_call(item) for item in items]
+
+
+async def batch(fn, items, max_concurrency=None):
+    """upstream.batch() for coroutine functions"""
+    return await asyncio.gather(*_timed_calls(fn, items, max_concurrency))
+
+
+async def batch_iter(fn, items, max_concurrency=None):
+    """upstream.batch_iter() for coroutine functions: BatchResults in
+    completion order"""
+    for call in asyncio.as_completed(_timed_calls(fn, items, max_concurrency)):
+        yield await call
+
+
+async def fetch_weather_data(lat, lon):
+    """app.fetch_weather_data() with the upstream calls made concurrently on
+    the event loop"""
+    deadline = upstream.Deadline()
+    timed_out = {'error': 'Upstream request timed out'}
+    one_call_task = asyncio.ensure_future(get_one_call_data(lat, lon, 'metric', deadline=deadline))
+    air_quality_task = asyncio.ensure_future(get_air_quality(lat, lon, deadline=deadline))
+    place_task = asyncio.ensure_future(reverse_geocode(lat, lon, deadline=deadline))
+    one_call_data = await wait(one_call_task, deadline, timed_out)
+
+    if 'error' not in one_call_data:
+        air_quality_data = await wait(air_quality_task, deadline, timed_out)
+        # Named for the place at the coordinates, as in app.fetch_weather_data()
+        place = None
+        try:
+            place = await wait(place_task, deadline)
+        except requests.exceptions.RequestException as e:
+            print(f"Reverse geocoding error: {e}")
+
+        response_data = weather_app.from_one_call(one_call_data, air_quality_data, place['name'] if place else '',
+                                                  lat, lon).to_dict()
+        await offload(weather_app.save_to_cache, lat, lon, 'metric', response_data)
+        weather_app.fetch_outcomes.inc('one_call', 'ok')
+        return response_data
+
+    elif one_call_data.get('rate_limited'):
+        weather_app.fetch_outcomes.inc('one_call', 'rate_limited')
+        return one_call_data
+
+    else:
+        weather_task = asyncio.ensure_future(get_weather_by_coords(lat, lon, 'metric', deadline=deadline))
+        forecast_task = asyncio.ensure_future(get_forecast_by_coords(lat, lon, 'metric', deadline=deadline))
+        weather_data = await wait(weather_task, deadline, timed_out)
+        forecast_data = await wait(forecast_task, deadline, timed_out)
+
+        if 'error' in weather_data or 'error' in forecast_data:
+            weather_app.fetch_outcomes.inc('fallback', 'error')
+            return {'error': weather_data.get('error') or forecast_data.get('error')}
+
+        air_quality_data = await wait(air_quality_task, deadline, timed_out)
+        response_data = weather_app.from_current_and_forecast(
+            weather_data, forecast_data, air_quality_data, lat, lon).to_dict()
+        await offload(weather_app.save_to_cache, lat, lon, 'metric', response_data)
+        weather_app.fetch_outcomes.inc('fallback', 'ok')
+        return response_data
+
+
+async def fetch_favorite_weather(favorite, units='metric'):
+    lat = favorite.get('lat')
+    lon = favorite.get('lon')
+    name = favorite.get('name', 'Unknown')
+    try:
+        with metrics.phase('fetch'):
+            response_data = await weather_flights.do(
+                weather_app.get_cache_key(lat, lon, 'metric'),
+                lambda: fetch_weather_data(lat, lon),
+                recheck=lambda: offload(weather_app.get_from_cache, lat, lon, 'metric')
+            )
+        return await offload(weather_app.favorite_result, favorite, units, response_data)
+    except Exception as e:
+        print(f"Error fetching weather for {name}: {str(e)}")
+    return None
+
+
+# Coroutine views, mirroring the Flask views in app.py
+
+async def get_weather():
+    try:
+        target, error = await offload(weather_app.weather_request)
+        if error:
+            return error
+        lat, lon, city, units = target
+
+        with metrics.phase('cache'):
+            cached = await offload(weather_app.get_with_revalidation, lat, lon, units)
+        if cached:
+            with metrics.phase('serialize'):
+                return weather_app.cached_weather_response(lat, lon, city, units, cached)
+
+        try:
+            with metrics.phase('fetch'):
+                response_data = await weather_flights.do(
+                    weather_app.get_cache_key(lat, lon, 'metric'),
+                    lambda: fetch_weather_data(lat, lon),
+                    recheck=lambda: offload(weather_app.get_from_cache, lat, lon, 'metric')
+                )
+            with metrics.phase('serialize'):
+                return await offload(weather_app.filled_weather_response, lat, lon, city, units, response_data)
+
+        except Exception as e:
+            return jsonify({'error': f'Error processing weather data: {str(e)}'}), 500
+
+    except Exception as e:
+        print(f"Error in get_weather: {str(e)}")
+        return jsonify({'error': f'Server error: {str(e)}'}), 500
+
+
+async def fetch_comparison(miss, units):
+    name, place = miss
+    if place is None:
+        return weather_app.comparison_entry(await get_current_weather(name, 'metric'), units)
+    lat, lon = place['lat'], place['lon']
+    with metrics.phase('fetch'):
+        response_data = await weather_flights.do(
+            weather_app.get_cache_key(lat, lon, 'metric'),
+            lambda: fetch_weather_data(lat, lon),
+            recheck=lambda: offload(weather_app.get_from_cache, lat, lon, 'metric')
+        )
+    return await offload(weather_app.filled_comparison_row, place, units, response_data)
+
+
+async def compare_weather():
+    target, error = weather_app.compare_request()
+    if error:
+        return error
+    cities, units = target
+
+    with metrics.phase('cache'):
+        rows, misses = await offload(weather_app.collect_cached_comparisons, cities, units)
+    with upstream.priority(upstream.BULK):
+        fetched = await batch(lambda miss: fetch_comparison(miss, units), misses)
+    return weather_app.comparison_response(rows, fetched)
+
+
+async def get_bulk_favorites():
+    target, error = weather_app.bulk_request()
+    if error:
+        return error
+    favorites, units = target
+
+    with metrics.phase('cache'):
+        results, api_calls_needed = await offload(weather_app.collect_cached_favorites, favorites, units)
+    stream_format = weather_app.bulk_stream_format()
+    if stream_format:
+        return weather_app.bulk_stream_response(
+            stream_bulk_favorites(results, api_calls_needed, units, stream_format), stream_format)
+    with upstream.priority(upstream.BULK):
+        fetched = await batch(lambda favorite: fetch_favorite_weather(favorite, units), api_calls_needed)
+    with metrics.phase('serialize'):
+        return weather_app.bulk_favorites_response(results, api_calls_needed, fetched)
+
+
+async def fetch_batch_location(item):
+    with metrics.phase('fetch'):
+        return await weather_flights.do(
+            item.key,
+            lambda: fetch_weather_data(item.lat, item.lon),
+            recheck=lambda: offload(weather_app.get_from_cache, item.lat, item.lon, 'metric')
+        )
+
+
+async def get_weather_batch():
+    items, error = await offload(weather_app.weather_batch_request)
+    if error:
+        return error
+    locations = weather_app.batch_locations(items)
+
+    with metrics.phase('cache'):
+        cached, misses = await offload(weather_app.collect_cached_locations, locations)
+    with upstream.priority(upstream.BULK):
+        fetched = await batch(fetch_batch_location, misses, max_concurrency=weather_app.WEATHER_BATCH_CONCURRENCY)
+    with metrics.phase('serialize'):
+        return await offload(weather_app.weather_batch_response, items, locations, cached,
+                             {item.key: result for item, result in zip(misses, fetched)})
+
+
+async def stream_bulk_favorites(results, api_calls_needed, units, stream_format):
+    """app.stream_bulk_favorites() as an async generator, sent by WeatherASGI
+    record by record"""
+    record = weather_app.bulk_stream_record
+    for entry in results:
+        yield record('result', entry, stream_format)
+    fetched_count = 0
+    with upstream.priority(upstream.BULK):
+        async for result in batch_iter(lambda favorite: fetch_favorite_weather(favorite, units), api_calls_needed):
+            entry = weather_app.fetched_favorite_entry(result)
+            if entry:
+                fetched_count += 1
+                yield record('result', entry, stream_format)
+    yield record('summary', weather_app.bulk_stream_summary(len(results), fetched_count), stream_format)
+
+
+async def geolocation():
+    data = request.get_json()
+    lat = data.get('lat')
+    lon = data.get('lon')
+
+    if not lat or not lon:
+        return jsonify({'error': 'Coordinates required'}), 400
+
+    try:
+        place = await reverse_geocode(lat, lon)
+        if place:
+            return jsonify(place)
+        return jsonify({'error': 'Location not found'}), 404
+    except requests.exceptions.RequestException:
+        return jsonify({'error': 'Geocoding service unavailable'}), 500
+
+
+async def search_cities_api():
+    # The first search opens the city database, and without one every
+    # search calls the geocoding API
+    return await offload(weather_app.search_cities_api)
+
+
+async def status():
+    data = (await offload(weather_app.status)).get_json()
+    data['single_flight'] = weather_flights.stats()
+    return jsonify(data)
+
+
+VIEWS = {
+    ('POST', '/api/weather'): get_weather,
+    ('POST', '/api/compare'): compare_weather,
+    ('POST', '/api/favorites/bulk'): get_bulk_favorites,
+    ('POST', '/api/weather/batch'): get_weather_batch,
+    ('POST', '/api/geolocation'): geolocation,
+    ('GET', '/api/search'): search_cities_api,
+    ('GET', '/api/status'): status
+}
+
+
+def build_environ(scope, body):
+    """WSGI environ for an ASGI http scope and its request body (bytes)"""
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf8').decode('latin1'),
+        'PATH_INFO': scope['path'].encode('utf8').decode('latin1'),
+        'QUERY_STRING': scope['query_string'].decode('ascii'),
+        'SERVER_PROTOCOL': f"HTTP/{scope['http_version']}",
+        'SERVER_NAME': scope['server'][0] if scope.get('server') else 'localhost',
+        'SERVER_PORT': str(scope['server'][1]) if scope.get('server') else '80',
+        'REMOTE_ADDR': scope['client'][0] if scope.get('client') else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = f"HTTP_{name.upper().replace('-', '_')}"
+        value = value.decode('latin1')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+async def dispatch(view, environ):
+    """Run a coroutine view the way Flask's full_dispatch_request runs a view,
+    returning the finished Flask response"""
+    with flask_app.request_context(environ):
+        try:
+            try:
+                rv = flask_app.preprocess_request()
+                if rv is None:
+                    rv = await view()
+            except Exception as e:
+                rv = flask_app.handle_user_exception(e)
+            return flask_app.finalize_request(rv)
+        except Exception as e:
+            return flask_app.handle_exception(e)
+
+
+class WeatherASGI:
+    """ASGI app: coroutine views for VIEWS, the Flask app for everything else"""
+
+    def __init__(self):
+        self.wsgi = WsgiToAsgi(flask_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        view = VIEWS.get((scope.get('method'), scope.get('path'))) if scope['type'] == 'http' else None
+        if view is None:
+            return await self.wsgi(scope, receive, send)
+
+        response = await dispatch(view, build_environ(scope, await read_body(receive)))
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1'))
+                        for name, value in response.headers.items()]
+        })
+        if hasattr(response.response, '__aiter__'):
+            # A streamed response: send each record as it is produced
+            async for chunk in response.response:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        else:
+            await send({'type': 'http.response.body', 'body': response.get_data()})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await upstream.close_async_client()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+app = WeatherASGI()
@@ -0,0 +1,111 @@
+"""Load test: sync gunicorn workers vs the ASGI mode under uvicorn.
+
+Starts a latency-injecting stub upstream, then serves the app both ways
+(gunicorn sync workers running app:app, and uvicorn running asgi:app) and
+drives each with many concurrent clients requesting /api/weather for
+distinct locations, so every request misses the cache and waits on the
+upstream.  Reports throughput, latency percentiles and errors for each.
+
+Needs the optional ASGI dependencies (pip install -r requirements-async.txt).
+
+Usage: python benchmarks/bench_asgi.py [--clients N] [--seconds S] [--latency S] [--workers N]
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(command, port, env):
+    process = subprocess.Popen(command, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/status", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"{command[0]} did not start")
+
+
+async def load(port, clients, seconds, offset):
+    latencies = []
+    errors = 0
+    stop = time.monotonic() + seconds
+    limits = httpx.Limits(max_connections=clients)
+
+    async def client_loop(client, index):
+        nonlocal errors
+        i = 0
+        while time.monotonic() < stop:
+            # A new location per request: every request is a cache miss
+            location = {'lat': round(-60 + (index * 0.37 + i * 1.3) % 120, 3),
+                        'lon': round(-170 + offset + (index * 1.7 + i * 0.9) % 300, 3), 'units': 'metric'}
+            start = time.perf_counter()
+            try:
+                response = await client.post('/api/weather', json=location)
+                if response.status_code != 200:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+            i += 1
+
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        await asyncio.gather(*(client_loop(client, index) for index in range(clients)))
+    return sorted(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--seconds', type=float, default=15)
+    parser.add_argument('--latency', type=float, default=0.2, help='injected upstream latency per call')
+    parser.add_argument('--workers', type=int, default=2)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency) as stub:
+        env = dict(os.environ, OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                   WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+        servers = (
+            ('gunicorn sync', lambda port: [sys.executable, '-m', 'gunicorn', '-w', str(args.workers),
+                                            '-b', f"127.0.0.1:{port}", '--timeout', '120', 'app:app']),
+            ('uvicorn asgi', lambda port: [sys.executable, '-m', 'uvicorn', '--workers', str(args.workers),
+                                           '--host', '127.0.0.1', '--port', str(port), '--log-level', 'warning',
+                                           'asgi:app']),
+        )
+        for offset, (label, command) in enumerate(servers):
+            port = free_port()
+            process = start_server(command(port), port, env)
+            try:
+                latencies, errors = asyncio.run(load(port, args.clients, args.seconds, offset * 3.3))
+            finally:
+                process.terminate()
+                process.wait()
+            count = len(latencies)
+            print(f"{label:<14} ({args.workers} workers, {args.clients} clients): "
+                  f"{count / args.seconds:7.1f} req/s, p50 {latencies[count // 2] * 1000:7.0f} ms, "
+                  f"p99 {latencies[int(count * 0.99)] * 1000:7.0f} ms, {errors} errors")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
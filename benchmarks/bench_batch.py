@@ -0,0 +1,64 @@
+"""Measure cold /api/favorites/bulk and /api/compare wall-clock time against a
+latency-injecting local upstream, with batches run serially and concurrently.
+
+Usage: python benchmarks/bench_batch.py [--latency S] [--favorites N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--favorites', type=int, default=10)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency) as stub:
+        os.environ['OPENWEATHER_BASE_URL'] = stub.url
+        os.environ.setdefault('OPENWEATHER_API_KEY', 'bench')
+        os.environ['UPSTREAM_RATE_PER_MINUTE'] = '0'  # the stub has no quota
+        import app
+        import upstream
+
+        client = app.app.test_client()
+        default_executor = upstream.executor
+        default_concurrency = upstream.BATCH_CONCURRENCY
+        print(f"Injected latency {args.latency * 1000:.0f} ms per upstream call")
+
+        for round_number, (mode, executor, concurrency) in enumerate((
+                ('serial', ThreadPoolExecutor(max_workers=1), 1),
+                ('batched', default_executor, default_concurrency))):
+            upstream.executor = executor
+            upstream.BATCH_CONCURRENCY = concurrency
+            app.weather_cache.clear()
+
+            favorites = [{'name': f'Fav {i}', 'lat': 40 + round_number + i * 0.1, 'lon': -70 - i * 0.1}
+                         for i in range(args.favorites)]
+            calls_before = stub.total_calls()
+            start = time.perf_counter()
+            response = client.post('/api/favorites/bulk', json={'favorites': favorites, 'units': 'metric'})
+            bulk_elapsed = time.perf_counter() - start
+            body = response.get_json()
+            item_ms = sorted(result['fetch_ms'] for result in body['results'])
+            print(f"  {mode:<8} bulk    {bulk_elapsed * 1000:7.1f} ms for {body['total_count']} favorites "
+                  f"(per-item {item_ms[0]}-{item_ms[-1]} ms, {stub.total_calls() - calls_before} upstream calls)")
+
+            start = time.perf_counter()
+            response = client.post('/api/compare', json={'cities': ['London', 'Paris', 'Tokyo', 'Lima']})
+            print(f"  {mode:<8} compare {(time.perf_counter() - start) * 1000:7.1f} ms for "
+                  f"{len(response.get_json())} cities")
+
+        upstream.executor = default_executor
+        upstream.BATCH_CONCURRENCY = default_concurrency
+
+
+if __name__ == '__main__':
+    main()
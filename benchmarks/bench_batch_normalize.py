@@ -0,0 +1,107 @@
+"""Benchmark: per-location CPU cost of normalizing One Call 3.0 payloads.
+
+Generates synthetic One Call payloads (random temperatures, winds and
+precipitation at the API's two-decimal precision, so rounding ties are
+exercised) and times producing both unit renderings of each location:
+
+- scalar: from_one_call().to_dict() and convert_units(), one location at a time
+- batch: forecast_batch.from_one_call_batch() over all the locations at once
+
+for batches of 10 to 100 locations, after checking the batch output equals
+the scalar output exactly (values and their int/float types).
+
+Usage: python benchmarks/bench_batch_normalize.py [--sizes 1,10,50,100] [--repeat N]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forecast_batch  # noqa: E402
+from forecast import convert_units, from_one_call  # noqa: E402
+from stub_upstream import air_pollution_payload  # noqa: E402
+
+CONDITIONS = [('clear sky', '01d', 'Clear'), ('few clouds', '02d', 'Clouds'), ('light rain', '10d', 'Rain'),
+              ('mist', '50n', 'Mist'), ('snow', '13d', 'Snow')]
+
+
+def condition(rng):
+    description, icon, main = rng.choice(CONDITIONS)
+    return [{'description': description, 'icon': icon, 'main': main}]
+
+
+def make_item(rng):
+    now = 1700000000 + rng.randrange(0, 86400 * 30, 3600)
+    payload = {
+        'timezone_offset': rng.randrange(-12 * 3600, 14 * 3600 + 1, 900),
+        'current': {'dt': now, 'sunrise': now - 20000, 'sunset': now + 20000, 'temp': round(rng.uniform(-20, 40), 2),
+                    'feels_like': round(rng.uniform(-25, 45), 2), 'pressure': rng.randrange(980, 1040),
+                    'humidity': rng.randrange(10, 100), 'uvi': rng.choice([0, 2, 5, 7, 10, round(rng.uniform(0, 12), 2)]),
+                    'visibility': rng.randrange(0, 10001, 250), 'wind_speed': round(rng.uniform(0, 20), 2),
+                    'weather': condition(rng)},
+        'hourly': [{'dt': now + h * 3600, 'temp': round(rng.uniform(-20, 40), 2), 'humidity': rng.randrange(10, 100),
+                    'wind_speed': round(rng.uniform(0, 20), 2), 'pop': rng.choice([0, round(rng.random(), 2)]),
+                    'weather': condition(rng)}
+                   for h in range(48)],
+        'daily': [{'dt': now + d * 86400, 'temp': {'min': round(rng.uniform(-25, 25), 2), 'max': round(rng.uniform(0, 45), 2)},
+                   'humidity': rng.randrange(10, 100), 'wind_speed': round(rng.uniform(0, 20), 2),
+                   'pop': round(rng.random(), 2), 'uvi': round(rng.uniform(0, 12), 2), 'weather': condition(rng)}
+                  for d in range(8)],
+    }
+    return payload, air_pollution_payload({}), f"City {rng.randrange(1000)}", rng.uniform(-60, 60), rng.uniform(-180, 180)
+
+
+def scalar(items):
+    results = []
+    for item in items:
+        data = from_one_call(*item).to_dict()
+        results.append({units: convert_units(data, 'metric', units) for units in ('metric', 'imperial')})
+    return results
+
+
+def canonical(results):
+    # local_time is taken from the clock as each row is built
+    for result in results:
+        for data in result.values():
+            data['current'] = dict(data['current'], local_time=None)
+    return json.dumps(results, sort_keys=True)
+
+
+def per_location_us(fn, items, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(items)
+        best = min(best, time.perf_counter() - start)
+    return best / len(items) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1,10,25,50,100')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    if forecast_batch.np is None:
+        print("NumPy is not installed: from_one_call_batch() uses the scalar path")
+    rng = random.Random(16)
+    check = [make_item(rng) for _ in range(200)]
+    assert canonical(forecast_batch.from_one_call_batch(check)) == canonical(scalar(check)), "batch output differs"
+    print("batch output matches the scalar path for 200 random locations")
+
+    print(f"{'locations':>9}  {'scalar us/loc':>13}  {'batch us/loc':>12}  speedup")
+    for size in (int(size) for size in args.sizes.split(',')):
+        items = [make_item(rng) for _ in range(size)]
+        scalar_us = per_location_us(scalar, items, args.repeat)
+        batch_us = per_location_us(forecast_batch.from_one_call_batch, items, args.repeat)
+        print(f"{size:>9}  {scalar_us:>13.1f}  {batch_us:>12.1f}  {scalar_us / batch_us:6.2f}x")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
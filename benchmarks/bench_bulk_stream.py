@@ -0,0 +1,75 @@
+"""Benchmark: plain vs streamed (NDJSON) /api/favorites/bulk.
+
+Each round asks for ten favorites of which --cached are already in the
+cache, the others being fetched from a stub upstream with a long-tailed
+latency.  The plain response arrives once the slowest fetch is done; the
+streamed one delivers the cached favorites immediately and each fetched
+favorite as it completes.  Reports the median time until the first
+favorite, until all cached favorites, and until the whole response.
+
+Usage: python benchmarks/bench_bulk_stream.py [--rounds N] [--cached N] [--latency SPEC]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def favorites(round_index, offset):
+    return [{'lat': round(-40 + round_index * 0.7 + offset, 3), 'lon': round(-100 + i * 9.3, 3), 'name': f"Fav {i}"}
+            for i in range(10)]
+
+
+def timed_bulk(client, body, stream):
+    """(first favorite, all cached favorites, complete) seconds for one request"""
+    start = time.perf_counter()
+    if not stream:
+        results = client.post('/api/favorites/bulk', json=body).get_json()['results']
+        done = time.perf_counter() - start
+        return done, done, done
+    response = client.post('/api/favorites/bulk?stream=ndjson', json=body, buffered=False)
+    first = all_cached = None
+    for chunk in response.response:
+        record = json.loads(chunk)
+        elapsed = time.perf_counter() - start
+        if 'result' in record:
+            first = first if first is not None else elapsed
+            if record['result']['cached']:
+                all_cached = elapsed
+    return first, all_cached if all_cached is not None else first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=15)
+    parser.add_argument('--cached', type=int, default=7, help='favorites (of 10) already cached')
+    parser.add_argument('--latency', default='lognormal:0.15,0.6', help='stub latency spec (see stub_upstream.py)')
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency, seed=1) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        client = app.app.test_client()
+
+        for offset, (label, stream) in enumerate((('plain JSON', False), ('streamed NDJSON', True))):
+            timings = []
+            for round_index in range(args.rounds):
+                batch = favorites(round_index, offset * 0.31)
+                # Warm the cache for the first --cached favorites
+                client.post('/api/favorites/bulk', json={'favorites': batch[:args.cached], 'units': 'metric'})
+                timings.append(timed_bulk(client, {'favorites': batch, 'units': 'metric'}, stream))
+            first, cached, complete = (statistics.median(values) * 1000 for values in zip(*timings))
+            print(f"{label:<16}: first favorite {first:7.1f} ms, all cached {cached:7.1f} ms, complete {complete:7.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+"""Replay a jittered-coordinate workload through each cache key mode and report hit rates.
+
+Simulated users around popular cities (Zipf-distributed) request weather
+with GPS-style jitter, or with the city's exact coordinates as reached
+through search and favorites.  Each request is a cache lookup; a miss is
+one upstream fetch.  A fake clock drives TTL expiry.
+
+Usage: python benchmarks/bench_cache_keys.py [--requests N] [--jitter DEG]
+"""
+
+import argparse
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from city_store import CityStore  # noqa: E402
+from geo_index import NearestCity  # noqa: E402
+from synthetic import make_cities  # noqa: E402
+from weather_cache import KEY_MODES, WeatherCache, location_key  # noqa: E402
+
+TTL = 600
+
+
+def make_workload(store, count, jitter, seed=11):
+    rng = random.Random(seed)
+    hot = list(range(200))  # city ids are in population order
+    weights = [1 / (rank + 1) for rank in range(len(hot))]
+    duration = 3600.0
+    requests = []
+    for i in range(count):
+        city_id = rng.choices(hot, weights)[0]
+        lat, lon = store.lat[city_id], store.lon[city_id]
+        if rng.random() < 0.6:
+            # Browser geolocation: same place, noisy to the 4th-6th decimal
+            lat += rng.gauss(0, jitter)
+            lon += rng.gauss(0, jitter)
+        requests.append((duration * i / count, lat, lon))
+    return requests
+
+
+def replay(requests, mode, nearest_city):
+    clock = [0.0]
+    cache = WeatherCache(TTL, max_entries=5000, clock=lambda: clock[0])
+    for timestamp, lat, lon in requests:
+        clock[0] = timestamp
+        key = location_key(lat, lon, mode=mode, nearest_city=nearest_city)
+        if cache.get(key) is None:
+            cache.put(key, True)
+    return cache.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=50000)
+    parser.add_argument('--jitter', type=float, default=0.002, help='std dev of geolocation noise, degrees')
+    args = parser.parse_args()
+
+    store = CityStore.from_cities(make_cities(20000))
+    index = NearestCity(store)
+
+    def nearest_city(lat, lon):
+        city_id, distance = index.nearest(lat, lon)
+        return f"{store.lat[city_id]}_{store.lon[city_id]}", distance
+
+    requests = make_workload(store, args.requests, args.jitter)
+    print(f"{len(requests)} requests over 1h, TTL {TTL}s, jitter sigma {args.jitter} deg")
+    baseline = None
+    for mode in KEY_MODES:
+        stats = replay(requests, mode, nearest_city)
+        upstream_fetches = stats['misses']
+        baseline = baseline or upstream_fetches
+        print(f"  {mode:<8} hit rate {stats['hit_rate']:6.1%}  upstream fetches {upstream_fetches:6d}  "
+              f"({upstream_fetches / baseline:5.1%} of exact)")
+
+
+if __name__ == '__main__':
+    main()
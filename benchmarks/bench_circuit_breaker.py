@@ -0,0 +1,60 @@
+"""Benchmark: the One Call 3.0 circuit breaker against a failing stub.
+
+The stub upstream answers One Call 3.0 with 401 (no subscription) after a
+delay, while the 2.5 endpoints work.  Cold /api/weather requests are timed
+with the breaker disabled (every miss tries One Call first) and enabled
+(after a few failures misses go straight to the fallback).  The breaker's
+state transitions are covered by tests/test_circuit_breaker.py.
+
+Usage: python benchmarks/bench_circuit_breaker.py [--requests N] [--latency S]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from circuit_breaker import CircuitBreaker  # noqa: E402
+from stub_upstream import StubUpstream  # noqa: E402
+
+ONE_CALL = 'data/3.0/onecall'
+
+
+def cold_requests(client, count, offset):
+    latencies = []
+    for i in range(count):
+        start = time.perf_counter()
+        response = client.post('/api/weather', json={'lat': 10 + i * 0.5, 'lon': 20 + offset, 'units': 'metric'})
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return sorted(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20)
+    parser.add_argument('--latency', type=float, default=0.3, help='delay of the failing One Call endpoint')
+    args = parser.parse_args()
+
+    routes = {f"/{ONE_CALL}": lambda params: (401, {'cod': 401, 'message': 'Invalid API key'})}
+    latency = lambda path: args.latency if path == f"/{ONE_CALL}" else 0.01
+    with StubUpstream(latency=latency, routes=routes) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        client = app.app.test_client()
+
+        for label, threshold in (('no breaker', 0), ('circuit breaker', 3)):
+            app.upstream.breakers[ONE_CALL] = CircuitBreaker(threshold, probe_interval=60)
+            before = stub.calls.get(f"/{ONE_CALL}", 0)
+            latencies = cold_requests(client, args.requests, offset=threshold * 10)
+            calls = stub.calls.get(f"/{ONE_CALL}", 0) - before
+            print(f"{label:<16}: p50 {latencies[len(latencies) // 2] * 1000:6.1f} ms, "
+                  f"max {latencies[-1] * 1000:6.1f} ms, {calls}/{args.requests} misses called One Call")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
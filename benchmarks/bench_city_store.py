@@ -0,0 +1,61 @@
+"""Compare per-process memory of raw city dicts with the mmapped city store.
+
+Usage: python benchmarks/bench_city_store.py [--cities N]
+"""
+
+import argparse
+import gc
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from city_index import CityIndex  # noqa: E402
+from city_store import load_city_store, sidecar_path  # noqa: E402
+from synthetic import make_cities  # noqa: E402
+
+
+def traced(label, load):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    elapsed = time.perf_counter() - start
+    allocated, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} {allocated / 1e6:8.1f} MB private heap  {elapsed * 1000:8.1f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=200000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, 'cities.json')
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(make_cities(args.cities), f)
+
+        def load_json():
+            with open(json_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+
+        cities = traced('json.load (list of dicts)', load_json)
+        del cities
+
+        start = time.perf_counter()
+        load_city_store(json_path)
+        print(f"Built sidecar in {time.perf_counter() - start:.2f}s "
+              f"({os.path.getsize(sidecar_path(json_path)) / 1e6:.1f} MB on disk, shared via mmap)")
+
+        store = traced('mmapped store + index', lambda: CityIndex(load_city_store(json_path)))
+        print(f"Sample lookup: {store.search('san')[:1]}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+"""Cold start: import time and first responses of the app in fresh interpreters.
+
+Each run starts a new Python process (as a serverless cold start does) and
+times `import app`, the first GET / and the first /api/search, with
+a synthetic static/cities.json either alone (the sidecar is compiled on the
+first search) or with a prebuilt static/cities.bin next to it.  Medians
+over the runs are reported, followed by an -X importtime profile of the
+modules app imports.  With --max-import-ms the script exits non-zero when
+the median import time exceeds it, so regressions show up.
+
+Usage: python benchmarks/bench_cold_start.py [--runs N] [--cities N] [--max-import-ms MS]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from city_store import build_sections, fallback_sidecar_path, sidecar_path, write_sidecar  # noqa: E402
+from synthetic import make_cities  # noqa: E402
+
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+client = app.app.test_client()
+assert client.get('/').status_code == 200
+page = time.perf_counter()
+assert client.get('/api/search?q=san').status_code == 200
+search = time.perf_counter()
+print(json.dumps({'import': imported - start, 'page': page - imported, 'search': search - page}))
+"""
+
+
+def child_env():
+    return dict(os.environ, PYTHONPATH=ROOT, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+
+
+def cold_starts(workdir, runs, prepare):
+    timings = []
+    for _ in range(runs):
+        prepare()
+        output = subprocess.run([sys.executable, '-c', CHILD], cwd=workdir, env=child_env(),
+                                capture_output=True, text=True, check=True).stdout
+        timings.append(json.loads(output.splitlines()[-1]))
+    return {phase: statistics.median(t[phase] for t in timings) for phase in timings[0]}
+
+
+def import_profile(workdir, top):
+    """Cumulative import time of app's own imports, from -X importtime"""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=workdir,
+                            env=child_env(), capture_output=True, text=True, check=True).stderr
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        # One space after the separator, then two per nesting level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth <= 1:
+            rows.append((int(cumulative_us), int(self_us), name.strip(), depth))
+    app_row = next(row for row in rows if row[2] == 'app' and row[3] == 0)
+    children = sorted((row for row in rows if row[3] == 1), reverse=True)[:top]
+    return app_row, children
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--cities', type=int, default=50000)
+    parser.add_argument('--top', type=int, default=12, help='modules to list in the import profile')
+    parser.add_argument('--max-import-ms', type=float, help='fail when the median import exceeds this')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        json_path = os.path.join(workdir, 'static', 'cities.json')
+        os.makedirs(os.path.dirname(json_path))
+        cities = make_cities(args.cities)
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(cities, f)
+        sidecars = (sidecar_path(json_path), fallback_sidecar_path(json_path))
+
+        def remove_sidecars():
+            for path in sidecars:
+                if os.path.exists(path):
+                    os.remove(path)
+
+        sections = build_sections(cities)
+        scenarios = (('cities.json only', remove_sidecars),
+                     ('prebuilt sidecar', lambda: write_sidecar(sections, sidecars[0])))
+        print(f"{args.cities} cities, median of {args.runs} fresh processes")
+        for label, prepare in scenarios:
+            median = cold_starts(workdir, args.runs, prepare)
+            print(f"{label:<18}: import {median['import'] * 1000:6.1f} ms, first page {median['page'] * 1000:6.1f} ms, "
+                  f"first search {median['search'] * 1000:7.1f} ms")
+        remove_sidecars()
+
+        (app_cumulative, app_self, _, _), children = import_profile(workdir, args.top)
+        print(f"\nimport app: {app_cumulative / 1000:.1f} ms ({app_self / 1000:.1f} ms in app.py itself)")
+        for cumulative, _, name, _ in children:
+            print(f"  {name:<20} {cumulative / 1000:7.1f} ms")
+
+    if args.max_import_ms is not None and median['import'] * 1000 > args.max_import_ms:
+        print(f"median import {median['import'] * 1000:.1f} ms exceeds {args.max_import_ms} ms")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
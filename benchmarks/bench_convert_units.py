@@ -0,0 +1,87 @@
+"""Microbenchmark: serving an imperial /api/weather response from the cache.
+
+Builds a 24-hour / 7-day response through fetch_weather_data (against the
+local stub upstream) and times three ways of answering an imperial request:
+
+- legacy: the original convert_units, deep-copying via json on every hit
+- convert: the copy-free convert_units run on every hit
+- cached variant: the imperial rendering stored at fill time, looked up
+
+The copy-free conversion is checked to produce the legacy output exactly.
+
+Usage: python benchmarks/bench_convert_units.py [--iterations N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def legacy_convert_units(data, from_units, to_units):
+    """The original metric -> imperial path of convert_units, kept as the reference"""
+    converted_data = json.loads(json.dumps(data))
+    converted_data['current']['temp'] = round((data['current']['temp'] * 9/5) + 32)
+    converted_data['current']['feels_like'] = round((data['current']['feels_like'] * 9/5) + 32)
+    converted_data['current']['wind_speed'] = round(data['current']['wind_speed'] * 0.621371, 1)
+    converted_data['current']['speed_unit'] = 'mph'
+    converted_data['current']['temp_unit'] = '°F'
+    if 'visibility' in data['current'] and data['current']['visibility'] != 'N/A':
+        converted_data['current']['visibility'] = round(data['current']['visibility'] * 0.621371)
+    converted_data['current']['visibility_unit'] = 'miles'
+    for hour in converted_data.get('hourly', []):
+        hour['temp'] = round((hour['temp'] * 9/5) + 32)
+        hour['wind_speed'] = round(hour['wind_speed'] * 0.621371, 1)
+    for day in converted_data.get('daily', []):
+        day['temp_max'] = round((day['temp_max'] * 9/5) + 32)
+        day['temp_min'] = round((day['temp_min'] * 9/5) + 32)
+        day['wind_speed'] = round(day['wind_speed'] * 0.621371, 1)
+    return converted_data
+
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=0) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        lat, lon = 48.8566, 2.3522
+        app.weather_cache.clear()
+        metric = app.fetch_weather_data(lat, lon)
+        print(f"Payload: {len(metric['hourly'])} hourly, {len(metric['daily'])} daily rows")
+
+        identical = json.dumps(app.convert_units(metric, 'metric', 'imperial'), sort_keys=True) == \
+            json.dumps(legacy_convert_units(metric, 'metric', 'imperial'), sort_keys=True)
+        print(f"Copy-free output identical to legacy: {identical}")
+        unchanged = json.dumps(metric, sort_keys=True) == json.dumps(app.get_from_cache(lat, lon, 'metric'), sort_keys=True)
+
+        timings = {
+            'legacy (json deep copy)': time_per_call(lambda: legacy_convert_units(metric, 'metric', 'imperial'),
+                                                     args.iterations),
+            'copy-free convert': time_per_call(lambda: app.convert_units(metric, 'metric', 'imperial'),
+                                               args.iterations),
+            'cached variant': time_per_call(lambda: app.get_with_revalidation(lat, lon, 'imperial'),
+                                            args.iterations),
+        }
+        for label, seconds in timings.items():
+            print(f"{label:<24}: {seconds * 1e6:8.1f} us per imperial hit")
+    return 0 if identical and unchanged else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Benchmark: daily rows for the 5 day / 3 hour fallback forecast.
+
+Generates many synthetic forecast payloads (40 three-hour entries each, with
+random start times and timezone offsets) and compares:
+
+- legacy: the original loop, which re-scans the whole list with two
+  datetime.fromtimestamp() calls per entry for every new date, in the
+  server's timezone
+- single pass: forecast.aggregate_daily(), location-local days
+
+It also times extracting the numeric columns from the JSON dicts, the
+per-entry Python work any array-based (NumPy) version would still have to
+do before vectorizing anything; it costs most of the single pass on its own.
+
+Usage: python benchmarks/bench_daily_aggregation.py [--payloads N]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import forecast  # noqa: E402
+
+CONDITIONS = [('clear sky', '01'), ('few clouds', '02'), ('light rain', '10'), ('mist', '50'), ('snow', '13')]
+
+
+def make_payload(rng):
+    start = 1700000000 + rng.randrange(0, 86400 * 30, 10800)
+    offset = rng.randrange(-12 * 3600, 14 * 3600 + 1, 900)
+    entries = []
+    for i in range(40):
+        description, icon = rng.choice(CONDITIONS)
+        entries.append({
+            'dt': start + i * 10800,
+            'main': {'temp': round(rng.uniform(-15, 35), 2), 'humidity': rng.randrange(20, 100)},
+            'wind': {'speed': round(rng.uniform(0, 15), 2)},
+            'pop': round(rng.random(), 2),
+            'weather': [{'description': description, 'icon': icon + rng.choice('dn')}]
+        })
+    return entries, offset
+
+
+def legacy_daily(entries):
+    """The original fallback loop, kept as the reference for timing"""
+    daily_forecast = []
+    processed_dates = set()
+    for entry in entries:
+        entry_date = datetime.fromtimestamp(entry['dt']).date()
+        if entry_date not in processed_dates and len(daily_forecast) < 7:
+            temps_for_day = [e['main']['temp'] for e in entries if datetime.fromtimestamp(e['dt']).date() == entry_date]
+            wind_speeds_for_day = [e['wind']['speed'] for e in entries if datetime.fromtimestamp(e['dt']).date() == entry_date]
+            daily_forecast.append({
+                'dt': entry['dt'], 'temp_max': round(max(temps_for_day)), 'temp_min': round(min(temps_for_day)),
+                'description': entry['weather'][0]['description'].title(),
+                'icon': entry['weather'][0]['icon'], 'pop': round(entry.get('pop', 0) * 100),
+                'humidity': entry['main']['humidity'],
+                'wind_speed': round(sum(wind_speeds_for_day) / len(wind_speeds_for_day) * 3.6, 1), 'uvi': 0
+            })
+            processed_dates.add(entry_date)
+    return daily_forecast
+
+
+def extract_columns(entries):
+    """The columns an array-based aggregation would start from"""
+    return ([entry['dt'] for entry in entries], [entry['main']['temp'] for entry in entries],
+            [entry['wind']['speed'] for entry in entries], [entry['main']['humidity'] for entry in entries],
+            [entry.get('pop', 0) for entry in entries], [entry['weather'][0]['description'] for entry in entries])
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payloads', type=int, default=5000)
+    parser.add_argument('--seed', type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    payloads = [make_payload(rng) for _ in range(args.payloads)]
+
+    _, legacy_seconds = timed(lambda: [legacy_daily(entries) for entries, _ in payloads])
+    single, single_seconds = timed(lambda: [forecast.aggregate_daily(entries, offset) for entries, offset in payloads])
+    _, extract_seconds = timed(lambda: [extract_columns(entries) for entries, _ in payloads])
+
+    days = sum(len(rows) for rows in single)
+    print(f"{args.payloads} payloads x 40 entries -> {days / args.payloads:.2f} local days each")
+    for label, seconds in (('legacy (O(days x 40))', legacy_seconds), ('single pass', single_seconds),
+                           ('column extraction only', extract_seconds)):
+        print(f"{label:<24}: {seconds * 1e6 / args.payloads:7.1f} us per payload")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,88 @@
+"""Benchmark: /api/weather cache-hit throughput with pre-encoded bodies.
+
+Warms one location through the local stub upstream, then measures hit-path
+requests/sec through the Flask test client for:
+
+- jsonify: the previous hit path (cache lookup + jsonify of the nested dict),
+  served from a benchmark-only route
+- encoded: the current /api/weather hit path (cached bytes + ETag)
+- encoded+gzip: the same with Accept-Encoding: gzip
+- 304: a client revalidating with If-None-Match
+
+Usage: python benchmarks/bench_encoded_responses.py [--requests N] [--units metric|imperial]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+PAYLOAD = {'lat': 48.8566, 'lon': 2.3522, 'city': 'Paris'}
+
+
+def requests_per_second(client, path, payload, headers, count, expected_status):
+    start = time.perf_counter()
+    for _ in range(count):
+        response = client.post(path, json=payload, headers=headers)
+        assert response.status_code == expected_status, response.status_code
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--units', default='metric')
+    args = parser.parse_args()
+
+    with StubUpstream(latency=0) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        from flask import jsonify
+
+        @app.app.route('/bench/legacy-weather', methods=['POST'])
+        def legacy_weather():
+            data = app.request.get_json()
+            cached = app.get_with_revalidation(data['lat'], data['lon'], data['units'])
+            return jsonify(app.located(cached[0], data['lat'], data['lon'], data['city']))
+
+        payload = dict(PAYLOAD, units=args.units)
+        client = app.app.test_client()
+        warm = client.post('/api/weather', json=payload)
+        assert warm.status_code == 200
+        legacy = client.post('/bench/legacy-weather', json=payload)
+        assert legacy.data == client.post('/api/weather', json=payload).data, 'hit bodies differ'
+        print(f"Body: {len(warm.data)} bytes, identical to jsonify output")
+
+        cases = [
+            ('jsonify (before)', '/bench/legacy-weather', {}, 200),
+            ('encoded', '/api/weather', {}, 200),
+            ('encoded + gzip', '/api/weather', {'Accept-Encoding': 'gzip'}, 200),
+            ('If-None-Match -> 304', '/api/weather', {'If-None-Match': warm.headers['ETag']}, 304),
+        ]
+        for label, path, headers, status in cases:
+            rate = requests_per_second(client, path, payload, headers, args.requests, status)
+            print(f"{label:<22}: {rate:8.0f} requests/s")
+
+        # The response-building step alone, without the WSGI/test client overhead
+        location = (payload['lat'], payload['lon'], payload['city'])
+        with app.app.test_request_context('/api/weather', method='POST', json=payload):
+            cached = app.get_with_revalidation(payload['lat'], payload['lon'], args.units)
+            steps = [
+                ('jsonify (before)', lambda: jsonify(app.located(cached[0], *location))),
+                ('encoded', lambda: app.cached_weather_response(*location, args.units, cached)),
+            ]
+            for label, build in steps:
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    build()
+                per_call = (time.perf_counter() - start) / args.requests
+                print(f"build response, {label:<16}: {per_call * 1e6:7.1f} us")
+
+
+if __name__ == '__main__':
+    main()
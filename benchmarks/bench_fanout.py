@@ -0,0 +1,64 @@
+"""Measure cold /api/weather latency against a latency-injecting local upstream.
+
+Runs the same cache-missing requests with the upstream pool limited to one
+thread (calls effectively serial) and with the normal pool (concurrent
+fan-out), and compares both with the injected per-call latency.
+
+Usage: python benchmarks/bench_fanout.py [--latency S] [--requests N]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def run(client, count, offset):
+    samples = []
+    for i in range(count):
+        # Distinct coordinates so every request is a cache miss
+        payload = {'lat': 10 + offset + i * 0.01, 'lon': 20 + offset + i * 0.01, 'units': 'metric'}
+        start = time.perf_counter()
+        response = client.post('/api/weather', json=payload)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.get_json()
+    return sorted(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--requests', type=int, default=10)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency) as stub:
+        os.environ['OPENWEATHER_BASE_URL'] = stub.url
+        os.environ.setdefault('OPENWEATHER_API_KEY', 'bench')
+        os.environ['UPSTREAM_RATE_PER_MINUTE'] = '0'  # the stub has no quota
+        import app
+        import upstream
+
+        client = app.app.test_client()
+        default_executor = upstream.executor
+
+        for label, fail_one_call in (('One Call path', False), ('2.5 fallback path', True)):
+            if fail_one_call:
+                stub.routes['/data/3.0/onecall'] = lambda params: (401, {'cod': 401})
+            print(f"{label} (injected latency {args.latency * 1000:.0f} ms per upstream call)")
+            for mode, executor in (('serial', ThreadPoolExecutor(max_workers=1)), ('concurrent', default_executor)):
+                upstream.executor = executor
+                calls_before = stub.total_calls()
+                samples = run(client, args.requests, offset=len(mode) + fail_one_call * 40)
+                calls = (stub.total_calls() - calls_before) / args.requests
+                print(f"  {mode:<10} p50={samples[len(samples) // 2] * 1000:7.1f} ms  "
+                      f"max={samples[-1] * 1000:7.1f} ms  upstream calls/request={calls:.1f}")
+        upstream.executor = default_executor
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""End-to-end load benchmark of the API against the stub upstream.
+
+Drives /api/weather, /api/search, /api/compare and /api/favorites/bulk, one
+scenario at a time, from concurrent clients, and reports throughput,
+latency percentiles, errors and upstream calls per request for each.  The
+app runs in-process (Flask test clients on threads) or as a gunicorn
+server in a subprocess, pointed at a StubUpstream with a latency
+distribution, error rate and optionally recorded payloads (see
+stub_upstream.py).  Request bodies come from a seeded generator, and
+locations are drawn from a hot set most of the time (--hot-ratio), so
+runs with the same arguments are comparable.
+
+Usage: python benchmarks/bench_load.py [--requests N] [--concurrency N] [--latency SPEC] [--error-rate R]
+                                       [--replay DIR] [--server inprocess|gunicorn] [--scenarios a,b]
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_upstream import StubUpstream  # noqa: E402
+from synthetic import make_cities, make_queries  # noqa: E402
+
+SCENARIOS = ('weather', 'search', 'compare', 'bulk')
+
+
+class Workload:
+    """Seeded request bodies for each scenario"""
+
+    def __init__(self, cities, seed, hot_ratio, hot_locations=50):
+        self.rng = random.Random(seed)
+        self.cities = cities
+        self.hot = [self.city_location(city) for city in self.rng.sample(cities, hot_locations)]
+        self.hot_ratio = hot_ratio
+        self.queries = make_queries(cities, seed=seed)
+
+    @staticmethod
+    def city_location(city):
+        return {'lat': round(float(city['lat']), 4), 'lon': round(float(city['lng']), 4), 'name': city['name']}
+
+    def location(self):
+        if self.rng.random() < self.hot_ratio:
+            return self.rng.choice(self.hot)
+        return self.city_location(self.rng.choice(self.cities))
+
+    def request(self, scenario):
+        """(method, path, json body) of the next request of scenario"""
+        units = self.rng.choice(('metric', 'imperial'))
+        if scenario == 'weather':
+            location = self.location()
+            return 'POST', '/api/weather', {'lat': location['lat'], 'lon': location['lon'], 'units': units}
+        if scenario == 'search':
+            return 'GET', f"/api/search?q={self.rng.choice(self.queries)}", None
+        if scenario == 'compare':
+            names = [self.location()['name'] for _ in range(self.rng.randint(2, 4))]
+            return 'POST', '/api/compare', {'cities': names, 'units': units}
+        favorites = [self.location() for _ in range(self.rng.randint(3, 10))]
+        return 'POST', '/api/favorites/bulk', {'favorites': favorites, 'units': units}
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_scenario(clients, workload, scenario, count):
+    """Send count requests of scenario from one thread per client (a
+    send(method, path, body) -> status callable); returns (latencies,
+    errors, elapsed)"""
+    planned = [workload.request(scenario) for _ in range(count)]
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    # Shared by the threads: each request is sent once, by whichever is free
+    position = iter(range(count))
+
+    def client_loop(send_one):
+        for index in position:
+            method, path, body = planned[index]
+            start = time.perf_counter()
+            try:
+                ok = send_one(method, path, body) < 400
+            except requests.exceptions.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+
+    threads = [threading.Thread(target=client_loop, args=(send_one,)) for send_one in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies), errors[0], time.perf_counter() - start
+
+
+def in_process_clients(app, concurrency):
+    def client():
+        test_client = app.app.test_client()
+        return lambda method, path, body: test_client.open(path, method=method, json=body).status_code
+    return [client() for _ in range(concurrency)]
+
+
+def http_clients(url, concurrency):
+    def client():
+        session = requests.Session()
+        return lambda method, path, body: session.request(method, url + path, json=body, timeout=60).status_code
+    return [client() for _ in range(concurrency)]
+
+
+def start_gunicorn(workdir, env, workers, threads):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-w', str(workers), '--threads', str(threads),
+                                '-b', f"127.0.0.1:{port}", 'app:app'], cwd=workdir,
+                               env=dict(env, PYTHONPATH=ROOT), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            requests.get(f"{url}/api/status", timeout=1)
+            return process, url
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError('gunicorn did not start')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=300, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency', default='lognormal:0.08,0.5', help='stub latency spec (see stub_upstream.py)')
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--replay', metavar='DIR', help='serve upstream payloads recorded in DIR')
+    parser.add_argument('--cities', type=int, default=20000)
+    parser.add_argument('--hot-ratio', type=float, default=0.8)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--server', choices=('inprocess', 'gunicorn'), default='inprocess')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    args = parser.parse_args()
+
+    cities = make_cities(args.cities, seed=args.seed)
+    workload = Workload(cities, args.seed, args.hot_ratio)
+    with tempfile.TemporaryDirectory() as workdir, \
+            StubUpstream(latency=args.latency, error_rate=args.error_rate, replay=args.replay, seed=args.seed) as stub:
+        cities_path = os.path.join(workdir, 'static', 'cities.json')
+        os.makedirs(os.path.dirname(cities_path))
+        with open(cities_path, 'w', encoding='utf-8') as f:
+            json.dump(cities, f)
+        env = dict(os.environ, OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                   WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+
+        process = None
+        if args.server == 'gunicorn':
+            process, url = start_gunicorn(workdir, env, args.workers, max(1, args.concurrency // args.workers))
+            clients = http_clients(url, args.concurrency)
+        else:
+            os.environ.update(env)
+            import app
+            app.CITIES_PATH = cities_path
+            clients = in_process_clients(app, args.concurrency)
+
+        print(f"{args.server}, {args.concurrency} clients, upstream latency {args.latency}, "
+              f"error rate {args.error_rate}{', replaying ' + args.replay if args.replay else ''}")
+        print(f"{'scenario':<9} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'errors':>7} {'upstream/req':>13}")
+        try:
+            for scenario in args.scenarios.split(','):
+                calls_before = stub.total_calls()
+                latencies, errors, elapsed = run_scenario(clients, workload, scenario, args.requests)
+                upstream_calls = stub.total_calls() - calls_before
+                print(f"{scenario:<9} {len(latencies) / elapsed:8.1f} {percentile(latencies, 0.5) * 1000:8.1f} "
+                      f"{percentile(latencies, 0.95) * 1000:8.1f} {percentile(latencies, 0.99) * 1000:8.1f} "
+                      f"{errors:7d} {upstream_calls / len(latencies):13.2f}")
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
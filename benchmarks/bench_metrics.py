@@ -0,0 +1,76 @@
+"""Benchmark: cost of request timing and metrics on the hottest path.
+
+Times warm /api/weather cache hits (the cheapest request the app serves,
+so the one where instrumentation weighs most) with metrics enabled and
+disabled, alternating rounds to even out noise, and the cost of the
+individual primitives.  Also prints a sample Server-Timing header of a
+cold request and the size of a /metrics scrape.
+
+Usage: python benchmarks/bench_metrics.py [--requests N] [--rounds N]
+"""
+
+import argparse
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def hit_latency(client, requests):
+    body = {'lat': 51.5, 'lon': -0.12, 'units': 'metric'}
+    start = time.perf_counter()
+    for _ in range(requests):
+        client.post('/api/weather', json=body)
+    return (time.perf_counter() - start) / requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=0.02) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        import metrics
+        client = app.app.test_client()
+
+        cold = client.post('/api/weather', json={'lat': 51.5, 'lon': -0.12, 'units': 'metric'})
+        print(f"cold Server-Timing: {cold.headers['Server-Timing']}")
+
+        best = {True: float('inf'), False: float('inf')}
+        for _ in range(args.rounds):
+            for enabled in (True, False):
+                metrics.ENABLED = enabled
+                best[enabled] = min(best[enabled], hit_latency(client, args.requests))
+        metrics.ENABLED = True
+        print(f"warm hit, metrics off: {best[False] * 1e6:7.1f} us/request")
+        print(f"warm hit, metrics on : {best[True] * 1e6:7.1f} us/request "
+              f"(+{(best[True] - best[False]) * 1e6:.1f} us, {best[True] / best[False] - 1:+.1%})")
+
+        def empty_phase():
+            with metrics.phase('cache'):
+                pass
+
+        token = metrics.start_request()
+        count = 100000
+        for label, statement in (('phase()', empty_phase),
+                                 ('histogram observe', lambda: app.request_seconds.observe(0.003, 'get_weather', '200')),
+                                 ('counter inc', lambda: app.fetch_outcomes.inc('one_call', 'ok'))):
+            print(f"{label:<18}: {timeit.timeit(statement, number=count) / count * 1e6:5.2f} us")
+        metrics.end_request(token)
+
+        start = time.perf_counter()
+        scrape = client.get('/metrics').get_data()
+        print(f"/metrics scrape: {len(scrape)} bytes in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
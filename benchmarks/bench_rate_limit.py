@@ -0,0 +1,154 @@
+"""Simulation: interactive requests competing with bulk load for the API quota.
+
+Runs the app against a local stub upstream that enforces a per-key quota
+(calls per rolling minute, answering 429 beyond it, like OpenWeatherMap).
+One client makes interactive /api/weather requests for new locations while
+several clients loop /api/favorites/bulk with ten new favorites each.  With
+the limiter off, bulk traffic burns the quota and interactive requests fail
+with upstream 429s; with it on, bulk calls stop at their reserve and
+interactive requests keep being served.
+
+It also checks that the bucket is shared across processes: several
+processes draining one state file together get about burst + rate * time
+tokens in total, not that much each.
+
+Usage: python benchmarks/bench_rate_limit.py [--quota N] [--seconds S] [--bulk-clients N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import TokenBucket  # noqa: E402
+from stub_upstream import ROUTES, StubUpstream  # noqa: E402
+
+
+class Quota:
+    """Answer 429 once more than limit calls arrived in the last minute"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.calls = deque()
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    def wrap(self, route):
+        def limited(params):
+            with self.lock:
+                now = time.monotonic()
+                while self.calls and self.calls[0] <= now - 60:
+                    self.calls.popleft()
+                if len(self.calls) >= self.limit:
+                    self.rejected += 1
+                    return 429, {'cod': 429, 'message': 'rate limit exceeded'}
+                self.calls.append(now)
+            return route(params)
+        return limited
+
+
+def random_location(rng):
+    return round(rng.uniform(-60, 60), 3), round(rng.uniform(-180, 180), 3)
+
+
+def run(app, seconds, bulk_clients, rng):
+    client = app.app.test_client()
+    stop = time.monotonic() + seconds
+    interactive = {'ok': 0, 'failed': 0, 'latencies': []}
+    bulk = {'requests': 0, 'favorites': 0}
+
+    def bulk_loop(seed):
+        bulk_rng = random.Random(seed)
+        bulk_client = app.app.test_client()
+        while time.monotonic() < stop:
+            favorites = [dict(zip(('lat', 'lon'), random_location(bulk_rng)), name='Fav') for _ in range(10)]
+            response = bulk_client.post('/api/favorites/bulk', json={'favorites': favorites, 'units': 'metric'})
+            bulk['requests'] += 1
+            bulk['favorites'] += len(response.get_json()['results'])
+
+    threads = [threading.Thread(target=bulk_loop, args=(rng.random(),)) for _ in range(bulk_clients)]
+    for thread in threads:
+        thread.start()
+    while time.monotonic() < stop:
+        lat, lon = random_location(rng)
+        start = time.perf_counter()
+        response = client.post('/api/weather', json={'lat': lat, 'lon': lon, 'units': 'metric'})
+        interactive['latencies'].append(time.perf_counter() - start)
+        interactive['ok' if response.status_code == 200 else 'failed'] += 1
+        time.sleep(0.25)
+    for thread in threads:
+        thread.join()
+    return interactive, bulk
+
+
+def drain(path, rate, burst, seconds, results):
+    bucket = TokenBucket(rate, burst, path=path)
+    granted = 0
+    stop = time.monotonic() + seconds
+    while time.monotonic() < stop:
+        if not bucket.try_acquire():
+            granted += 1
+        else:
+            time.sleep(0.001)
+    results.put(granted)
+
+
+def check_shared(processes=4, rate=50.0, burst=20, seconds=2.0):
+    path = os.path.join(tempfile.mkdtemp(), 'budget')
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=drain, args=(path, rate, burst, seconds, results))
+               for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    granted = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+    print(f"shared bucket: {processes} processes got {sum(granted)} tokens in {seconds:.0f}s "
+          f"(expected ~{burst + rate * seconds:.0f}; per process {granted})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--quota', type=int, default=300, help='upstream calls allowed per minute')
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--bulk-clients', type=int, default=3)
+    args = parser.parse_args()
+
+    check_shared()
+
+    os.environ.update(OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'), WEATHER_CACHE_BACKEND='memory',
+                      HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_STATE='')
+    import app
+
+    # Budget a little under the quota, leaving room for its rolling window
+    rate = args.quota * 0.9 / 60
+    for label, limiter in (('no limiter', TokenBucket(0, 0)),
+                           ('token bucket', TokenBucket(rate, args.quota * 0.1))):
+        quota = Quota(args.quota)
+        routes = {path: quota.wrap(route) for path, route in ROUTES.items()}
+        with StubUpstream(latency=0.02, routes=routes) as stub:
+            app.upstream.BASE_URL = stub.url
+            app.upstream.limiter = limiter
+            app.weather_cache.clear()
+            interactive, bulk = run(app, args.seconds, args.bulk_clients, random.Random(17))
+            latencies = sorted(interactive['latencies'])
+            total = interactive['ok'] + interactive['failed']
+            print(f"{label:<13}: interactive {interactive['ok']}/{total} ok, "
+                  f"p50 {latencies[len(latencies) // 2] * 1000:.0f} ms; "
+                  f"bulk {bulk['favorites']} favorites in {bulk['requests']} requests; "
+                  f"{stub.total_calls()} upstream calls, {quota.rejected} answered 429")
+        if limiter.enabled:
+            budget = limiter.stats()
+            print(f"{'':<13}  granted {budget['granted']}, refused {budget['refused']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,56 @@
+"""Compare local nearest-city lookups with per-request reverse geocoding over HTTP.
+
+Usage: python benchmarks/bench_reverse_geocode.py [--cities N] [--queries N] [--latency S]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from city_store import CityStore  # noqa: E402
+from geo_index import NearestCity  # noqa: E402
+from stub_upstream import StubUpstream  # noqa: E402
+from synthetic import make_cities  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--http-queries', type=int, default=200)
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='extra seconds injected per upstream call (0 = loopback only)')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    store = CityStore.from_cities(make_cities(args.cities))
+    index = NearestCity(store)
+    print(f"Built store + k-d tree for {len(store)} cities in {time.perf_counter() - start:.2f}s")
+
+    rng = random.Random(3)
+    points = [(rng.uniform(-60, 70), rng.uniform(-180, 180)) for _ in range(args.queries)]
+
+    start = time.perf_counter()
+    for lat, lon in points:
+        index.nearest(lat, lon)
+    elapsed = time.perf_counter() - start
+    print(f"local k-d tree  {args.queries / elapsed:10.0f} lookups/s  ({elapsed / args.queries * 1e6:.1f} us each)")
+
+    with StubUpstream(latency=args.latency) as stub:
+        start = time.perf_counter()
+        for lat, lon in points[:args.http_queries]:
+            requests.get(f"{stub.url}/geo/1.0/reverse",
+                         params={'lat': lat, 'lon': lon, 'limit': 1, 'appid': 'bench'}, timeout=5).json()
+        elapsed = time.perf_counter() - start
+    print(f"HTTP per request {args.http_queries / elapsed:10.0f} lookups/s  "
+          f"({elapsed / args.http_queries * 1e3:.2f} ms each, latency={args.latency}s)")
+
+
+if __name__ == '__main__':
+    main()
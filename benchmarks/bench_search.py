@@ -0,0 +1,99 @@
+"""Benchmark /api/search city lookups against a synthetic 200k-city dataset.
+
+Usage: python benchmarks/bench_search.py [--cities N] [--queries N]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from city_index import CityIndex  # noqa: E402
+from city_store import CityStore  # noqa: E402
+from synthetic import make_cities, make_queries  # noqa: E402
+
+
+def legacy_search(cities, query):
+    """The original linear-scan implementation, kept as the reference ordering"""
+    query_lower = query.lower().strip()
+    matches = []
+    for city in cities:
+        city_name = city.get('name', '').lower()
+        admin1 = city.get('adminCode', '') or city.get('admin1', '') or ''
+        longitude = city.get('lng') or city.get('lon')
+        latitude = city.get('lat')
+        if not longitude or not latitude:
+            continue
+        if city_name.startswith(query_lower):
+            priority = 1
+        elif query_lower in city_name:
+            priority = 2
+        else:
+            continue
+        matches.append({
+            'name': city['name'], 'country': city['country'], 'state': admin1,
+            'lat': float(latitude), 'lon': float(longitude),
+            'display': f"{city['name']}, {city['country']}" + (f" ({admin1})" if admin1 else ""),
+            'population': city.get('population', 0), 'priority': priority
+        })
+    matches.sort(key=lambda x: (x['priority'], -x.get('population', 0), x['name']))
+    seen = set()
+    unique_matches = []
+    for match in matches:
+        key = (match['name'], match['country'], match['lat'], match['lon'])
+        if key not in seen:
+            seen.add(key)
+            unique_matches.append({k: v for k, v in match.items() if k != 'priority'})
+            if len(unique_matches) >= 10:
+                break
+    return unique_matches
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def time_queries(search, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples):
+    print(f"{label:<10} p50={percentile(samples, 50):8.3f} ms  p99={percentile(samples, 99):8.3f} ms  "
+          f"mean={sum(samples) / len(samples):8.3f} ms  (n={len(samples)})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cities', type=int, default=200000)
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--legacy-queries', type=int, default=50,
+                        help='queries to run through the linear scan (slow)')
+    args = parser.parse_args()
+
+    cities = make_cities(args.cities)
+    queries = make_queries(cities, args.queries)
+
+    start = time.perf_counter()
+    index = CityIndex(CityStore.from_cities(cities))
+    print(f"Indexed {len(index)} cities in {time.perf_counter() - start:.2f}s")
+
+    mismatches = [q for q in queries[:args.legacy_queries] if index.search(q) != legacy_search(cities, q)]
+    print(f"Ordering check: {args.legacy_queries - len(mismatches)}/{args.legacy_queries} queries match the linear scan")
+    if mismatches:
+        print(f"  mismatched queries: {mismatches[:10]}")
+
+    report('index', time_queries(index.search, queries))
+    report('linear', time_queries(lambda q: legacy_search(cities, q), queries[:args.legacy_queries]))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
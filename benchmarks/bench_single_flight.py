@@ -0,0 +1,111 @@
+"""Load test: upstream calls per cache expiry with and without single-flight.
+
+Each burst starts with an empty cache entry for one popular location (as if
+it had just expired) and fires many concurrent /api/weather requests for it
+at a latency-injecting local upstream.  With coalescing, a burst should cost
+one One Call request, not one per client.
+
+--processes runs the burst from several worker processes sharing the
+sqlite cache backend and a file-lock directory (cross-worker mode).
+
+Usage: python benchmarks/bench_single_flight.py [--clients N] [--bursts N] [--processes N]
+"""
+
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+PAYLOAD = {'lat': 48.8566, 'lon': 2.3522, 'city': 'Paris', 'units': 'metric'}
+
+
+def burst(app_module, clients):
+    """Fire clients concurrent requests for PAYLOAD; returns the slowest latency"""
+    barrier = threading.Barrier(clients)
+    latencies = []
+
+    def client():
+        test_client = app_module.app.test_client()
+        barrier.wait()
+        start = time.perf_counter()
+        response = test_client.post('/api/weather', json=PAYLOAD)
+        latencies.append(time.perf_counter() - start)
+        assert response.status_code == 200
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return max(latencies)
+
+
+def worker_process(env, clients, bursts, barrier):
+    os.environ.update(env)
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    import app
+    for _ in range(bursts):
+        barrier.wait()  # all workers: entry expired
+        burst(app, clients)
+        barrier.wait()  # all workers done with this burst
+        if barrier.wait() == 0:
+            app.weather_cache.clear()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--clients', type=int, default=50)
+    parser.add_argument('--bursts', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.3)
+    parser.add_argument('--processes', type=int, default=0)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency) as stub:
+        env = {'OPENWEATHER_BASE_URL': stub.url, 'OPENWEATHER_API_KEY': os.getenv('OPENWEATHER_API_KEY', 'bench'),
+               'UPSTREAM_RATE_PER_MINUTE': '0'}
+
+        if args.processes:
+            tmp = tempfile.mkdtemp()
+            for label, lock_dir in (('per-process only', ''), ('file-lock', os.path.join(tmp, 'locks'))):
+                env.update(WEATHER_CACHE_BACKEND='sqlite', WEATHER_CACHE_PATH=os.path.join(tmp, f'{label}.sqlite3'),
+                           SINGLE_FLIGHT_LOCK_DIR=lock_dir)
+                if not lock_dir:
+                    del env['SINGLE_FLIGHT_LOCK_DIR']
+                context = multiprocessing.get_context('spawn')
+                barrier = context.Barrier(args.processes)
+                before = stub.calls.get('/data/3.0/onecall', 0)
+                workers = [context.Process(target=worker_process, args=(env, args.clients, args.bursts, barrier))
+                           for _ in range(args.processes)]
+                for worker in workers:
+                    worker.start()
+                for worker in workers:
+                    worker.join()
+                calls = stub.calls.get('/data/3.0/onecall', 0) - before
+                print(f"{args.processes} workers x {args.clients} clients, {label:<16}: "
+                      f"{calls / args.bursts:.1f} One Call requests per expiry")
+            return
+
+        os.environ.update(env)
+        import app
+        for enabled in (False, True):
+            app.weather_flights.enabled = enabled
+            calls = []
+            slowest = []
+            for _ in range(args.bursts):
+                app.weather_cache.clear()
+                before = stub.calls.get('/data/3.0/onecall', 0)
+                slowest.append(burst(app, args.clients))
+                calls.append(stub.calls.get('/data/3.0/onecall', 0) - before)
+            print(f"single-flight {'on ' if enabled else 'off'}: {sum(calls) / len(calls):5.1f} One Call requests "
+                  f"per expiry ({args.clients} concurrent clients), slowest client {max(slowest) * 1000:.0f} ms")
+
+
+if __name__ == '__main__':
+    main()
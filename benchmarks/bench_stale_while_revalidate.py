@@ -0,0 +1,96 @@
+"""Simulation: client latency for popular cities across cache expiries.
+
+Replays a day of traffic (one step per simulated minute) against a
+latency-injecting local upstream, driving the weather cache and the
+revalidator from a fake clock.  Each step requests a few popular cities and
+one rarely seen location.  It compares plain TTL expiry with
+stale-while-revalidate plus hot-key refresh-ahead, and reports client
+latency percentiles for the popular cities and how often a popular-city
+request had to wait for the upstream.
+
+Usage: python benchmarks/bench_stale_while_revalidate.py [--minutes N] [--latency S]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cache_refresh import Revalidator  # noqa: E402
+from stub_upstream import StubUpstream  # noqa: E402
+
+POPULAR = [(48.8566, 2.3522), (51.5074, -0.1278), (40.7128, -74.006), (35.6762, 139.6503)]
+
+
+class FakeClock:
+    def __init__(self, now=1700000000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+
+def drain(revalidator):
+    """Wait for background refreshes so each simulated minute starts settled"""
+    while revalidator.stats()['refreshing']:
+        time.sleep(0.005)
+
+
+def simulate(app, clock, minutes, stale_window, top_n, upstream_latency):
+    app.weather_cache.clear()
+    app.weather_cache.stale_window = stale_window
+    app.weather_revalidator = Revalidator(app.weather_cache, top_n=top_n, interval=0,
+                                          executor=app.upstream.batch_executor, clock=clock)
+    client = app.app.test_client()
+    latencies = []
+    slow = 0
+    for minute in range(minutes):
+        clock.now += 60
+        if minute % 2 == 0:
+            app.weather_revalidator.refresh_hot()
+            drain(app.weather_revalidator)
+        for lat, lon in POPULAR:
+            start = time.perf_counter()
+            response = client.post('/api/weather', json={'lat': lat, 'lon': lon, 'units': 'metric'})
+            elapsed = time.perf_counter() - start
+            assert response.status_code == 200
+            latencies.append(elapsed)
+            slow += elapsed >= upstream_latency
+        rare = (10 + minute * 0.37 % 50, 20 + minute * 0.53 % 50)
+        client.post('/api/weather', json={'lat': rare[0], 'lon': rare[1], 'units': 'metric'})
+        drain(app.weather_revalidator)
+    return latencies, slow
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--minutes', type=int, default=12 * 60)
+    parser.add_argument('--latency', type=float, default=0.05)
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        clock = FakeClock()
+        app.weather_cache.clock = clock
+
+        for label, stale_window, top_n in (('TTL only', 0, 0),
+                                           ('stale-while-revalidate + refresh-ahead', app.CACHE_STALE_WINDOW, 20)):
+            before = stub.calls.get('/data/3.0/onecall', 0)
+            latencies, slow = simulate(app, clock, args.minutes, stale_window, top_n, args.latency)
+            calls = stub.calls.get('/data/3.0/onecall', 0) - before
+            print(f"{label:<40}: popular p50 {percentile(latencies, 50) * 1000:6.1f} ms, "
+                  f"p99 {percentile(latencies, 99) * 1000:6.1f} ms, "
+                  f"{slow}/{len(latencies)} waited on upstream, {calls} One Call requests")
+
+
+if __name__ == '__main__':
+    main()
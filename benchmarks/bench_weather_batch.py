@@ -0,0 +1,87 @@
+"""Benchmark: a dashboard refresh as per-location calls vs one batch call.
+
+A dashboard of --locations locations (a share of them duplicates or
+neighbours that snap to the same cache key, a share of them already
+cached, mixed units and views) is refreshed either with one /api/weather
+request per location, --concurrency at a time, or with a single
+/api/weather/batch request.  Reports the time of the refresh, the
+requests it took and the upstream calls it made.
+
+Usage: python benchmarks/bench_weather_batch.py [--locations N] [--cached R] [--duplicates R] [--latency SPEC]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+
+def dashboard(rng, count, duplicates, offset):
+    """count locations, a duplicates share of them repeating (or sitting
+    next to) an earlier one"""
+    locations = []
+    for _ in range(count):
+        if locations and rng.random() < duplicates:
+            base = rng.choice(locations)
+            lat, lon = base['lat'], base['lon'] + rng.choice((0, 0.001))
+        else:
+            lat, lon = round(rng.uniform(-60, 60) + offset, 3), round(rng.uniform(-170, 170), 3)
+        locations.append({'lat': lat, 'lon': lon, 'units': rng.choice(('metric', 'imperial')),
+                          'view': rng.choice(('full', 'summary'))})
+    return locations
+
+
+def per_location(app, locations, concurrency):
+    def one(location):
+        client = app.app.test_client()
+        return client.post('/api/weather', json=location).status_code
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        statuses = list(pool.map(one, locations))
+    return len(statuses), sum(status >= 400 for status in statuses)
+
+
+def batched(app, locations, concurrency):
+    results = app.app.test_client().post('/api/weather/batch', json={'locations': locations}).get_json()['results']
+    return 1, sum(result['status'] != 'ok' for result in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--locations', type=int, default=300)
+    parser.add_argument('--cached', type=float, default=0.7, help='share of locations already cached')
+    parser.add_argument('--duplicates', type=float, default=0.2, help='share of repeated locations')
+    parser.add_argument('--concurrency', type=int, default=8, help='parallel per-location requests')
+    parser.add_argument('--latency', default='lognormal:0.08,0.5', help='stub latency spec (see stub_upstream.py)')
+    args = parser.parse_args()
+
+    with StubUpstream(latency=args.latency, seed=1) as stub:
+        os.environ.update(OPENWEATHER_BASE_URL=stub.url, OPENWEATHER_API_KEY=os.getenv('OPENWEATHER_API_KEY', 'bench'),
+                          WEATHER_CACHE_BACKEND='memory', HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0')
+        import app
+        app.WEATHER_BATCH_CONCURRENCY = args.concurrency
+
+        for offset, (label, refresh) in enumerate((('per-location', per_location), ('batch', batched))):
+            rng = random.Random(7)
+            locations = dashboard(rng, args.locations, args.duplicates, offset * 0.5)
+            # Warm the cache for a --cached share of the locations
+            warm = [location for location in locations if rng.random() < args.cached]
+            app.app.test_client().post('/api/weather/batch', json={'locations': warm})
+
+            calls_before = stub.total_calls()
+            start = time.perf_counter()
+            requests_made, failed = refresh(app, locations, args.concurrency)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<13}: {elapsed * 1000:8.1f} ms, {requests_made:4d} requests, "
+                  f"{stub.total_calls() - calls_before:4d} upstream calls, {failed} failed")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
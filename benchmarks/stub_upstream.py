@@ -0,0 +1,304 @@
+"""Local stand-in for the OpenWeatherMap API used by the benchmarks.
+
+Serves canned JSON for the endpoints app.py calls, after an injected delay,
+from a background ThreadingHTTPServer:
+
+    with StubUpstream(latency=0.2) as stub:
+        requests.get(f"{stub.url}/geo/1.0/reverse", params=...)
+
+The delay can be a latency distribution ('lognormal:0.08,0.5', optionally
+per endpoint, see latency_distribution()), and error_rate answers that
+fraction of calls with error_status instead.  With record=DIR every call is
+forwarded to the real API and its response saved to DIR (without the API
+key); replay=DIR then serves those recordings in place of the canned
+payloads, for the endpoints that were recorded.
+
+Run standalone to point a separately started app at it (set
+OPENWEATHER_BASE_URL to the printed URL):
+
+Usage: python benchmarks/stub_upstream.py [--port N] [--latency SPEC] [--error-rate R] [--replay DIR | --record DIR]
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import requests
+
+NOW = 1700000000
+
+
+def _coords(params):
+    return float(params.get('lat', 0)), float(params.get('lon', 0))
+
+
+def _condition(i):
+    return [{'id': 800 + i % 4, 'main': ['Clear', 'Clouds', 'Rain', 'Mist'][i % 4],
+             'description': ['clear sky', 'few clouds', 'light rain', 'mist'][i % 4],
+             'icon': ['01d', '02d', '10d', '50n'][i % 4]}]
+
+
+def one_call_payload(params):
+    lat, lon = _coords(params)
+    return {
+        'lat': lat, 'lon': lon, 'timezone': 'Etc/GMT-2', 'timezone_offset': 7200,
+        'current': {'dt': NOW, 'sunrise': NOW - 20000, 'sunset': NOW + 20000, 'temp': 18.4,
+                    'feels_like': 17.9, 'pressure': 1014, 'humidity': 62, 'uvi': 4.2,
+                    'visibility': 10000, 'wind_speed': 3.6, 'weather': _condition(0)},
+        'hourly': [{'dt': NOW + h * 3600, 'temp': 15 + (h % 12) * 0.7, 'humidity': 55 + h % 20,
+                    'wind_speed': 2.0 + (h % 7) * 0.4, 'pop': (h % 10) / 10, 'weather': _condition(h)}
+                   for h in range(48)],
+        'daily': [{'dt': NOW + d * 86400, 'temp': {'min': 9.5 + d, 'max': 21.3 + d}, 'humidity': 60 + d,
+                   'wind_speed': 4.1 + d * 0.3, 'pop': (d % 5) / 5, 'uvi': 3.0 + d, 'weather': _condition(d)}
+                  for d in range(8)],
+    }
+
+
+def weather_payload(params):
+    return {
+        'name': params.get('q', 'Stubville'), 'dt': NOW, 'timezone': 7200, 'visibility': 10000,
+        'coord': {'lat': float(params.get('lat', 51.5)), 'lon': float(params.get('lon', -0.12))},
+        'main': {'temp': 18.4, 'feels_like': 17.9, 'humidity': 62, 'pressure': 1014},
+        'wind': {'speed': 3.6}, 'weather': _condition(1),
+        'sys': {'country': 'GB', 'sunrise': NOW - 20000, 'sunset': NOW + 20000},
+    }
+
+
+def forecast_payload(params):
+    return {
+        'city': {'name': 'Stubville', 'timezone': 7200},
+        'list': [{'dt': NOW + i * 10800, 'main': {'temp': 12 + (i % 8) * 1.3, 'humidity': 60 + i % 15},
+                  'wind': {'speed': 2.5 + (i % 6) * 0.5}, 'pop': (i % 10) / 10, 'weather': _condition(i)}
+                 for i in range(40)],
+    }
+
+
+def air_pollution_payload(params):
+    return {'list': [{'main': {'aqi': 2}, 'components': {
+        'co': 201.9, 'no': 0.02, 'no2': 0.77, 'o3': 68.66, 'so2': 0.64, 'pm2_5': 0.5, 'pm10': 0.54, 'nh3': 0.12}}]}
+
+
+def reverse_geocode_payload(params):
+    lat, lon = _coords(params)
+    return [{'name': 'Stubville', 'lat': lat, 'lon': lon, 'country': 'US', 'state': 'CA'}]
+
+
+def direct_geocode_payload(params):
+    name = params.get('q', 'Stubville').split(',')[0]
+    return [{'name': name, 'lat': 51.5, 'lon': -0.12, 'country': 'GB', 'state': ''}]
+
+
+ROUTES = {
+    '/data/3.0/onecall': one_call_payload,
+    '/data/2.5/weather': weather_payload,
+    '/data/2.5/forecast': forecast_payload,
+    '/data/2.5/air_pollution': air_pollution_payload,
+    '/geo/1.0/reverse': reverse_geocode_payload,
+    '/geo/1.0/direct': direct_geocode_payload,
+}
+OPENWEATHER_URL = 'https://api.openweathermap.org'
+# Query parameters left out of recordings (and ignored when matching them)
+UNRECORDED_PARAMS = ('appid',)
+
+
+def _sampler(spec, rng):
+    kind, _, args = spec.partition(':') if ':' in spec else ('fixed', '', spec)
+    values = [float(value) for value in args.split(',') if value]
+    if kind == 'fixed':
+        return lambda: values[0]
+    if kind == 'uniform':
+        return lambda: rng.uniform(values[0], values[1])
+    if kind == 'lognormal':
+        # values: median and sigma of the underlying normal (the tail weight)
+        return lambda: rng.lognormvariate(math.log(values[0]), values[1])
+    if kind == 'exponential':
+        return lambda: rng.expovariate(1 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def latency_distribution(spec, seed=None):
+    """Callable(path) -> seconds for a latency spec: 'S' or 'fixed:S',
+    'uniform:LO,HI', 'lognormal:MEDIAN,SIGMA' or 'exponential:MEAN'.
+    Endpoints can get their own as 'PATH=SPEC;...;SPEC', the entry without a
+    path being the default (otherwise 0)."""
+    rng = random.Random(seed)
+    default = lambda: 0.0
+    per_path = {}
+    for entry in filter(None, (part.strip() for part in spec.split(';'))):
+        path, _, entry_spec = entry.rpartition('=')
+        if path:
+            per_path['/' + path.lstrip('/')] = _sampler(entry_spec, rng)
+        else:
+            default = _sampler(entry_spec, rng)
+    return lambda path: per_path.get(path, default)()
+
+
+def _recorded_params(params):
+    return {key: value for key, value in sorted(params.items()) if key not in UNRECORDED_PARAMS}
+
+
+class Recordings:
+    """Upstream responses stored in a directory, one JSON file per distinct
+    call ({'path', 'params', 'status', 'body'})"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._by_path = {}
+        if os.path.isdir(directory):
+            for name in sorted(os.listdir(directory)):
+                if name.endswith('.json'):
+                    with open(os.path.join(directory, name), encoding='utf-8') as f:
+                        recording = json.load(f)
+                    self._add(recording)
+
+    def _add(self, recording):
+        # A later recording of the same call replaces the earlier one
+        self._by_path.setdefault(recording['path'], {})[json.dumps(recording['params'])] = recording
+
+    def paths(self):
+        return list(self._by_path)
+
+    def save(self, path, params, status, body):
+        params = _recorded_params(params)
+        digest = hashlib.md5(json.dumps([path, params]).encode()).hexdigest()[:12]
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = f"{path.strip('/').replace('/', '_')}-{digest}.json"
+        recording = {'path': path, 'params': params, 'status': status, 'body': body}
+        with open(os.path.join(self.directory, file_name), 'w', encoding='utf-8') as f:
+            json.dump(recording, f)
+        self._add(recording)
+
+    def route(self, path):
+        """Route replaying the recording of path with the same parameters,
+        else the one recorded nearest to the requested coordinates"""
+        recordings = self._by_path[path]
+
+        def replay(params):
+            params = _recorded_params(params)
+            match = recordings.get(json.dumps(params))
+            if match is None:
+                lat, lon = _coords(params)
+                match = min(recordings.values(), key=lambda r: (float(r['params'].get('lat', 0)) - lat) ** 2
+                                                      + (float(r['params'].get('lon', 0)) - lon) ** 2)
+            return match['status'], match['body']
+        return replay
+
+
+class StubUpstream:
+    """Threaded HTTP server answering ROUTES after `latency` seconds (a
+    number, a callable(path) or a latency_distribution() spec)"""
+
+    def __init__(self, latency=0.0, routes=None, port=0, error_rate=0.0, error_status=500,
+                 replay=None, record=None, record_from=OPENWEATHER_URL, seed=None):
+        self.latency = latency_distribution(latency, seed) if isinstance(latency, str) else latency
+        self.routes = dict(ROUTES)
+        if replay:
+            recordings = Recordings(replay)
+            self.routes.update({path: recordings.route(path) for path in recordings.paths()})
+        self.routes.update(routes or {})
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.recordings = Recordings(record) if record else None
+        self.record_from = record_from.rstrip('/')
+        self.calls = {}
+        self.errors = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                with stub._lock:
+                    stub.calls[parsed.path] = stub.calls.get(parsed.path, 0) + 1
+                delay = stub.latency(parsed.path) if callable(stub.latency) else stub.latency
+                if delay:
+                    time.sleep(delay)
+                params = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                route = stub.routes.get(parsed.path)
+                if stub.error_rate and stub._rng.random() < stub.error_rate:
+                    with stub._lock:
+                        stub.errors += 1
+                    status, payload = stub.error_status, {'cod': stub.error_status, 'message': 'injected error'}
+                elif stub.recordings is not None:
+                    status, payload = stub.forward(parsed.path, params)
+                elif route is None:
+                    status, payload = 404, {'cod': 404, 'message': 'not found'}
+                else:
+                    result = route(params)
+                    status, payload = result if isinstance(result, tuple) else (200, result)
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def forward(self, path, params):
+        """Answer a call from the real API, recording the response"""
+        response = requests.get(f"{self.record_from}{path}", params=params, timeout=15)
+        try:
+            body = response.json()
+        except ValueError:
+            body = {'cod': response.status_code, 'message': response.text[:200]}
+        self.recordings.save(path, params, response.status_code, body)
+        return response.status_code, body
+
+    def total_calls(self):
+        with self._lock:
+            return sum(self.calls.values())
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--latency', default='0', help="e.g. 'lognormal:0.08,0.5' or '/data/3.0/onecall=0.3;0.05'")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--error-status', type=int, default=500)
+    parser.add_argument('--seed', type=int)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--replay', metavar='DIR', help='serve the responses recorded in DIR')
+    source.add_argument('--record', metavar='DIR', help=f"forward calls to {OPENWEATHER_URL} and record them in DIR")
+    args = parser.parse_args()
+
+    stub = StubUpstream(latency=args.latency, port=args.port, error_rate=args.error_rate,
+                        error_status=args.error_status, replay=args.replay, record=args.record, seed=args.seed)
+    with stub:
+        print(f"Serving on {stub.url}; start the app with OPENWEATHER_BASE_URL={stub.url}")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            pass
+    print(f"calls: {stub.calls}, injected errors: {stub.errors}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
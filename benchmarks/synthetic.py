@@ -0,0 +1,45 @@
+"""Synthetic datasets shared by the benchmark scripts."""
+
+import random
+
+SYLLABLES = [
+    'san', 'ta', 'ma', 'ri', 'ber', 'lin', 'to', 'ky', 'o', 'par', 'is', 'new', 'york',
+    'del', 'hi', 'mum', 'bai', 'ca', 'ro', 'la', 'gos', 'lon', 'don', 'mos', 'cow',
+    'ist', 'an', 'bul', 'li', 'ma', 'bo', 'go', 'ta', 'vi', 'en', 'na', 'pra', 'gue',
+    'mad', 'rid', 'sao', 'pau', 'lo', 'kar', 'chi', 'dha', 'ka', 'bang', 'kok', 'ha',
+]
+COUNTRIES = ['US', 'GB', 'IN', 'BR', 'DE', 'FR', 'JP', 'CN', 'NG', 'RU', 'ES', 'IT', 'MX', 'CA', 'AU']
+
+
+def make_cities(count=200000, seed=42):
+    """Build a GeoNames-shaped list of city dicts"""
+    rng = random.Random(seed)
+    cities = []
+    for _ in range(count):
+        name = ''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))).title()
+        if rng.random() < 0.1:
+            name = f"{name} {''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 2))).title()}"
+        cities.append({
+            'name': name,
+            'country': rng.choice(COUNTRIES),
+            'adminCode': str(rng.randint(1, 60)) if rng.random() < 0.8 else '',
+            'lat': f"{rng.uniform(-60, 70):.5f}",
+            'lng': f"{rng.uniform(-180, 180):.5f}",
+            'population': int(rng.paretovariate(1.2) * 1000)
+        })
+    return cities
+
+
+def make_queries(cities, count=2000, seed=7):
+    """Pick 2-6 character queries, mostly prefixes and some infixes of real names"""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        name = rng.choice(cities)['name'].lower()
+        length = rng.randint(2, 6)
+        if rng.random() < 0.7 or len(name) <= length:
+            queries.append(name[:length])
+        else:
+            start = rng.randint(1, len(name) - length)
+            queries.append(name[start:start + length])
+    return queries
@@ -0,0 +1,168 @@
+"""Stale-while-revalidate and refresh-ahead for the weather cache.
+
+Revalidator.get() serves an entry that is past its TTL but still inside the
+cache's stale window straight away, and refreshes it in the background, so
+the request that finds it expired does not wait on the upstream API.
+
+It also counts lookups per cache key (with exponential decay) and a
+background thread re-fetches the top_n hottest keys once they are within
+refresh_ahead seconds of expiring, so popular locations are normally fresh
+when requested.
+"""
+
+import heapq
+import os
+import threading
+import time
+from operator import itemgetter
+
+# Keys whose decayed request count drops below this are forgotten
+MIN_HOT_COUNT = 0.5
+
+
+class RefreshFailed(Exception):
+    """Raised by a refresh callable whose fetch produced no data"""
+
+
+class Revalidator:
+    """Serve stale entries while refreshing them, and keep hot keys warm.
+
+    refresh callables passed to get() take the timestamp of the entry that
+    was due (None if the key had none), fetch the key's data and store it in
+    the cache, and raise (e.g. RefreshFailed) when the fetch fails, so the
+    key is retried and counted in failures.  They may skip the fetch when
+    the cache already holds an entry newer than that timestamp (another
+    worker refreshed it).  They run on executor (anything with submit), or
+    inline when executor is None.
+    """
+
+    def __init__(self, cache, top_n=20, refresh_ahead=60, interval=30, decay=0.5,
+                 executor=None, clock=time.time):
+        self.cache = cache
+        self.top_n = top_n
+        self.refresh_ahead = refresh_ahead
+        self.interval = interval
+        self.decay = decay
+        self.executor = executor
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._counts = {}      # key -> decayed request count
+        self._refreshers = {}  # key -> latest refresh callable
+        self._timestamps = {}  # key -> timestamp of the entry last seen or written
+        self._refreshing = set()
+        self._thread_pid = None
+        self.stale_served = 0
+        self.revalidations = 0
+        self.hot_refreshes = 0
+        self.failures = 0
+
+    def get(self, key, refresh):
+        """Cached data for key, fresh or stale, or None on a miss.
+        A stale hit schedules refresh() in the background."""
+        entry = self.get_entry(key, refresh)
+        return entry[0] if entry else None
+
+    def get_entry(self, key, refresh):
+        """Like get(), but returns the cache's (data, timestamp) entry"""
+        self.start()
+        with self._lock:
+            self._counts[key] = self._counts.get(key, 0) + 1
+            self._refreshers[key] = refresh
+
+        entry = self.cache.get_entry(key, allow_stale=True)
+        if entry is None:
+            return None
+        data, timestamp = entry
+        with self._lock:
+            self._timestamps[key] = timestamp
+        if self.clock() - timestamp >= self.cache.ttl:
+            with self._lock:
+                self.stale_served += 1
+            self.revalidate(key)
+        return entry
+
+    def revalidate(self, key):
+        """Refresh key in the background unless a refresh is already running.
+        Returns whether one was scheduled."""
+        with self._lock:
+            refresh = self._refreshers.get(key)
+            if refresh is None or key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            self.revalidations += 1
+        if self.executor is None:
+            self._run(key, refresh)
+        else:
+            self.executor.submit(self._run, key, refresh)
+        return True
+
+    def _run(self, key, refresh):
+        with self._lock:
+            seen = self._timestamps.get(key)
+        try:
+            refresh(seen)
+            # The refresh may have found another worker's entry rather than
+            # fetching one, so record the age of what the cache now holds
+            entry = self.cache.get_entry(key, allow_stale=True)
+            with self._lock:
+                if key in self._counts:
+                    self._timestamps[key] = entry[1] if entry is not None else self.clock()
+        except Exception as e:
+            print(f"Background refresh of {key} failed: {e}")
+            with self._lock:
+                self.failures += 1
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def refresh_hot(self):
+        """Refresh the top_n most requested keys that are missing or expire
+        within refresh_ahead seconds, then decay the request counts.
+        Returns the keys refreshed."""
+        with self._lock:
+            hot = [key for key, _ in heapq.nlargest(self.top_n, self._counts.items(), key=itemgetter(1))]
+            for key in list(self._counts):
+                count = self._counts[key] * self.decay
+                if count < MIN_HOT_COUNT:
+                    del self._counts[key]
+                    self._refreshers.pop(key, None)
+                    self._timestamps.pop(key, None)
+                else:
+                    self._counts[key] = count
+            due_by = self.clock() + self.refresh_ahead - self.cache.ttl
+            due = [key for key in hot if self._timestamps.get(key, float('-inf')) <= due_by]
+
+        refreshed = [key for key in due if self.revalidate(key)]
+        with self._lock:
+            self.hot_refreshes += len(refreshed)
+        return refreshed
+
+    def start(self):
+        """Start the refresh-ahead thread for this process, if enabled and not
+        already running (threads do not survive a fork, so workers each start one)"""
+        if self.top_n <= 0 or self.interval <= 0 or self._thread_pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread_pid == os.getpid():
+                return
+            self._thread_pid = os.getpid()
+        threading.Thread(target=self._loop, name='cache-refresh', daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh_hot()
+            except Exception as e:
+                print(f"Hot key refresh failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tracked_keys': len(self._counts),
+                'refreshing': len(self._refreshing),
+                'stale_served': self.stale_served,
+                'revalidations': self.revalidations,
+                'hot_refreshes': self.hot_refreshes,
+                'failures': self.failures
+            }
@@ -0,0 +1,94 @@
+"""Circuit breaker for an upstream endpoint that may be unavailable.
+
+After failure_threshold consecutive failures the breaker opens and calls
+are refused straight away, so callers go to their fallback without waiting
+for another error.  Once probe_interval seconds have passed it is half-open:
+a single probe call is let through, closing the breaker if it succeeds and
+re-opening it for another interval if it fails.
+
+State is per worker process.
+"""
+
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+class CircuitBreaker:
+    """Track consecutive failures of one endpoint and gate calls to it"""
+
+    def __init__(self, failure_threshold=3, probe_interval=60, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+        self.times_opened = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self):
+        return self.failure_threshold > 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self):
+        if self._state == OPEN and self.clock() - self._opened_at >= self.probe_interval:
+            self._state = HALF_OPEN
+        return self._state
+
+    def allow(self):
+        """Whether a call may be made now. In the half-open state only one
+        caller (the probe) is allowed until it reports back."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            state = self._current_state()
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.rejected += 1
+            return False
+
+    def release(self):
+        """Give back a call allowed by allow() that was not made after all"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or (self._state == CLOSED and self.enabled and self._failures >= self.failure_threshold):
+                self._state = OPEN
+                self._opened_at = self.clock()
+                self.times_opened += 1
+            self._probing = False
+
+    def stats(self):
+        with self._lock:
+            state = self._current_state()
+            return {
+                'state': state,
+                'consecutive_failures': self._failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'probe_in_seconds': (round(max(0.0, self._opened_at + self.probe_interval - self.clock()), 1)
+                                     if state == OPEN else None)
+            }
@@ -0,0 +1,189 @@
+"""Search index over the local cities database used by /api/search.
+
+Cities are ranked once at build time by (population desc, name) and given
+ids in that order, so "top k by population" for any candidate set is simply
+"the k smallest ids".  Starts-with matches come from the lowercased names in
+sorted order (with the top results for short prefixes precomputed) and
+contains matches from a 2/3-gram posting index.  All of it is stored as
+sections of the memory-mapped city_store sidecar.
+"""
+
+import heapq
+from array import array
+from bisect import bisect_left
+
+from city_store import pack_strings
+
+MAX_RESULTS = 10
+# Prefixes up to this length have their top results precomputed; longer
+# prefixes select a narrow enough slice of the sorted names to rank on demand.
+PRECOMPUTED_PREFIX_LEN = 3
+NGRAM_SIZES = (2, 3)
+
+
+def _posting_sections(name, postings):
+    """Serialize a {key: [ids]} mapping as sorted keys + offsets + ids"""
+    keys = sorted(postings)
+    offsets = array('Q', [0])
+    ids = array('i')
+    for key in keys:
+        ids.extend(postings[key])
+        offsets.append(len(ids))
+    key_offsets, key_blob = pack_strings(keys)
+    return {
+        f'{name}.keys.offsets': key_offsets,
+        f'{name}.keys.blob': key_blob,
+        f'{name}.offsets': offsets,
+        f'{name}.ids': ids,
+    }
+
+
+def build_index_sections(lower_names):
+    """Build the search sections for lowercased names given in rank order"""
+    prefix_top = {}
+    ngrams = {}
+    for city_id, lower_name in enumerate(lower_names):
+        for length in range(min(len(lower_name), PRECOMPUTED_PREFIX_LEN) + 1):
+            top = prefix_top.setdefault(lower_name[:length], [])
+            if len(top) < MAX_RESULTS:
+                top.append(city_id)
+        grams = set()
+        for size in NGRAM_SIZES:
+            for start in range(len(lower_name) - size + 1):
+                grams.add(lower_name[start:start + size])
+        for gram in grams:
+            postings = ngrams.get(gram)
+            if postings is None:
+                postings = ngrams[gram] = array('i')
+            postings.append(city_id)
+
+    sections = {'sorted_ids': array('i', sorted(range(len(lower_names)), key=lower_names.__getitem__))}
+    sections.update(_posting_sections('prefix', prefix_top))
+    sections.update(_posting_sections('ngram', ngrams))
+    return sections
+
+
+class _Postings:
+    """Lookup side of a serialized {key: [ids]} mapping"""
+
+    def __init__(self, store, name):
+        self._keys = store.string_table(f'{name}.keys')
+        self._offsets = store.sections[f'{name}.offsets']
+        self._ids = store.sections[f'{name}.ids']
+
+    def get(self, key):
+        i = bisect_left(self._keys, key)
+        if i < len(self._keys) and self._keys[i] == key:
+            return self._ids[self._offsets[i]:self._offsets[i + 1]]
+        return None
+
+
+class _SortedNames:
+    """Lowercased names in lexicographic order, for bisecting prefix ranges"""
+
+    def __init__(self, lower_names, sorted_ids):
+        self._lower_names = lower_names
+        self._sorted_ids = sorted_ids
+
+    def __len__(self):
+        return len(self._sorted_ids)
+
+    def __getitem__(self, index):
+        return self._lower_names[self._sorted_ids[index]]
+
+
+class CityIndex:
+    """Prefix, n-gram and population-ranked search over a CityStore"""
+
+    def __init__(self, store):
+        self._store = store
+        self._lower_names = store.lower_names
+        self._sorted_ids = store.sections['sorted_ids']
+        self._sorted_names = _SortedNames(self._lower_names, self._sorted_ids)
+        self._prefix_top = _Postings(store, 'prefix')
+        self._ngrams = _Postings(store, 'ngram')
+
+    def __len__(self):
+        return len(self._store)
+
+    def _prefix_matches(self, query, limit):
+        """Ids of the best-ranked names starting with query"""
+        if len(query) <= PRECOMPUTED_PREFIX_LEN:
+            top = self._prefix_top.get(query)
+            return list(top[:limit]) if top is not None else []
+        lo = bisect_left(self._sorted_names, query)
+        hi = bisect_left(self._sorted_names, query + '\U0010ffff', lo)
+        return heapq.nsmallest(limit, self._sorted_ids[lo:hi])
+
+    def _contains_matches(self, query, limit):
+        """Ids of the best-ranked names containing (but not starting with) query"""
+        if not query or limit <= 0:
+            return []
+
+        size = min(len(query), max(NGRAM_SIZES))
+        if size in NGRAM_SIZES:
+            candidates = None
+            for start in range(len(query) - size + 1):
+                postings = self._ngrams.get(query[start:start + size])
+                if postings is None:
+                    return []
+                if candidates is None or len(postings) < len(candidates):
+                    candidates = postings
+        else:
+            candidates = range(len(self._store))
+
+        matches = []
+        lower_names = self._lower_names
+        for city_id in candidates:
+            lower_name = lower_names[city_id]
+            if query in lower_name and not lower_name.startswith(query):
+                matches.append(city_id)
+                if len(matches) >= limit:
+                    break
+        return matches
+
+    def format(self, city_id):
+        """Suggestion dict for a city, as returned by search_cities"""
+        store = self._store
+        name = store.names[city_id]
+        country = store.country(city_id)
+        admin1 = store.admin(city_id)
+        return {
+            'name': name,
+            'country': country,
+            'state': admin1,
+            'lat': store.lat[city_id],
+            'lon': store.lon[city_id],
+            'display': f"{name}, {country}" + (f" ({admin1})" if admin1 else ""),
+            'population': store.population[city_id]
+        }
+
+    def search(self, query, limit=MAX_RESULTS):
+        """Return up to limit cities: starts-with matches first, then contains
+        matches, each ordered by population (descending) then name"""
+        query = query.lower().strip()
+        ids = self._prefix_matches(query, limit)
+        if len(ids) < limit:
+            ids += self._contains_matches(query, limit - len(ids))
+        return [self.format(city_id) for city_id in ids]
+
+    def resolve(self, name):
+        """The city a typed name means, as a suggestion dict: the most
+        populous exact (case-insensitive) match, narrowed to a country when the
+        name ends in ", CC".  None when no city has exactly that name (and
+        country), so partial or unknown names are not guessed at."""
+        query = ' '.join(name.lower().split())
+        country = None
+        if ',' in query:
+            head, tail = (part.strip() for part in query.rsplit(',', 1))
+            if head and len(tail) == 2:
+                query, country = head, tail.upper()
+        if not query:
+            return None
+        lo = bisect_left(self._sorted_names, query)
+        hi = bisect_left(self._sorted_names, query + '\0', lo)
+        # Equal names keep their rank order in sorted_ids
+        for city_id in self._sorted_ids[lo:hi]:
+            if country is None or self._store.country(city_id) == country:
+                return self.format(city_id)
+        return None
@@ -0,0 +1,278 @@
+"""Compact columnar storage for the cities database.
+
+static/cities.json is compiled once into a binary sidecar (static/cities.bin)
+holding typed columns (lat/lon/population), interned country/admin strings,
+names packed into a single UTF-8 blob addressed by integer offsets, and the
+search and nearest-city index sections from city_index and geo_index.  Every
+worker memory-maps the same file, so the data lives once in the page cache
+instead of as per-process lists of dicts.
+
+The sidecar is a build output, ignored by git like the JSON it is compiled
+from.  A release step that puts static/cities.json in place should also run
+``python city_store.py`` to build static/cities.bin next to it, so cold
+starts only map the file.  Without one, the first worker that needs the
+cities compiles it (into the temp directory when static/ is read-only).
+"""
+
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+
+MAGIC = b'WXCITY01'
+FORMAT_VERSION = 2
+_HEADER = struct.Struct('<8sIBxxxI')
+_SECTION = struct.Struct('<24sc7xQQ')
+_ALIGN = 8
+
+
+def _population_rank(value):
+    """Numeric population used for ranking (missing/invalid values rank last)"""
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def rank_cities(cities):
+    """Validate, de-duplicate and rank raw city dicts.
+
+    Returns (name, country, admin1, lat, lon, population) tuples ordered by
+    population (descending), then name, then source position.  Of several
+    rows sharing (name, country, lat, lon) only the best-ranked one is kept.
+    """
+    best = {}
+    for position, city in enumerate(cities):
+        try:
+            # Handle both 'lng' and 'lon' for longitude
+            longitude = city.get('lng') or city.get('lon')
+            latitude = city.get('lat')
+            if not longitude or not latitude:
+                continue  # Skip cities without valid coordinates
+            name = city['name']
+            country = city['country']
+            if not isinstance(name, str) or not isinstance(country, str):
+                continue
+            lat = float(latitude)
+            lon = float(longitude)
+            admin1 = city.get('adminCode', '') or city.get('admin1', '') or ''
+            population = int(_population_rank(city.get('population', 0)))
+        except (KeyError, ValueError, TypeError, AttributeError, OverflowError):
+            continue
+
+        rank_key = (-population, name, position)
+        key = (name, country, lat, lon)
+        current = best.get(key)
+        if current is None or rank_key < current[0]:
+            best[key] = (rank_key, (name, country, str(admin1), lat, lon, population))
+
+    return [record for _, record in sorted(best.values(), key=lambda item: item[0])]
+
+
+def pack_strings(values):
+    """Pack strings into (offsets, blob) arrays for a StringTable"""
+    offsets = array('Q', [0])
+    blob = bytearray()
+    for value in values:
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+    return offsets, array('B', blob)
+
+
+class StringTable:
+    """Read-only sequence of strings stored as offsets into a UTF-8 blob.
+
+    ``blob`` is the backing buffer (bytes or mmap) and ``base`` the position
+    of the blob inside it; slicing the buffer directly yields bytes.
+    """
+
+    def __init__(self, offsets, blob, base=0):
+        self._offsets = offsets
+        self._blob = blob
+        self._base = base
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        base = self._base
+        return str(self._blob[base + self._offsets[index]:base + self._offsets[index + 1]], 'utf-8')
+
+
+def build_sections(cities):
+    """Compile raw city dicts into the named, typed sections of a store"""
+    from city_index import build_index_sections
+    from geo_index import build_spatial_sections
+
+    records = rank_cities(cities)
+    interned = {}
+    countries = array('I')
+    admins = array('I')
+    for record in records:
+        countries.append(interned.setdefault(record[1], len(interned)))
+        admins.append(interned.setdefault(record[2], len(interned)))
+
+    names = [record[0] for record in records]
+    lower_names = [name.lower() for name in names]
+    sections = {
+        'lat': array('d', (record[3] for record in records)),
+        'lon': array('d', (record[4] for record in records)),
+        'population': array('q', (record[5] for record in records)),
+        'country': countries,
+        'admin': admins,
+    }
+    for prefix, values in (('name', names), ('lower', lower_names), ('strings', list(interned))):
+        sections[f'{prefix}.offsets'], sections[f'{prefix}.blob'] = pack_strings(values)
+    sections.update(build_index_sections(lower_names))
+    sections.update(build_spatial_sections(sections['lat'], sections['lon']))
+    return sections
+
+
+def serialize_sections(sections):
+    """Lay out sections as bytes: header, section table, then aligned data"""
+    table_size = _HEADER.size + _SECTION.size * len(sections)
+    offset = -(-table_size // _ALIGN) * _ALIGN
+    entries = []
+    chunks = []
+    for name, values in sections.items():
+        data = values.tobytes()
+        entries.append(_SECTION.pack(name.encode('ascii'), values.typecode.encode('ascii'), offset, len(data)))
+        padding = -len(data) % _ALIGN
+        chunks.append(data + b'\0' * padding)
+        offset += len(data) + padding
+
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, sys.byteorder == 'little', len(sections))
+    head = header + b''.join(entries)
+    return head + b'\0' * (-len(head) % _ALIGN) + b''.join(chunks)
+
+
+class CityStore:
+    """Columnar, read-only view over a serialized cities database"""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        magic, version, little_endian, count = _HEADER.unpack_from(buffer, 0)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError('Unsupported cities store format')
+        if bool(little_endian) != (sys.byteorder == 'little'):
+            raise ValueError('Cities store was built on a machine with a different byte order')
+
+        view = memoryview(buffer)
+        self.sections = {}
+        self._positions = {}
+        for i in range(count):
+            name, typecode, offset, size = _SECTION.unpack_from(buffer, _HEADER.size + i * _SECTION.size)
+            name = name.rstrip(b'\0').decode('ascii')
+            section = view[offset:offset + size]
+            if typecode != b'B':
+                section = section.cast(typecode.decode('ascii'))
+            self.sections[name] = section
+            self._positions[name] = offset
+
+        self.lat = self.sections['lat']
+        self.lon = self.sections['lon']
+        self.population = self.sections['population']
+        self.names = self.string_table('name')
+        self.lower_names = self.string_table('lower')
+        self._strings = self.string_table('strings')
+        self._country = self.sections['country']
+        self._admin = self.sections['admin']
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a sidecar file so all workers share its pages"""
+        with open(path, 'rb') as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @classmethod
+    def from_cities(cls, cities):
+        """Build an in-memory store straight from raw city dicts"""
+        return cls(serialize_sections(build_sections(cities)))
+
+    def __len__(self):
+        return len(self.lat)
+
+    def string_table(self, prefix):
+        return StringTable(self.sections[f'{prefix}.offsets'], self._buffer, self._positions[f'{prefix}.blob'])
+
+    def country(self, city_id):
+        return self._strings[self._country[city_id]]
+
+    def admin(self, city_id):
+        return self._strings[self._admin[city_id]]
+
+
+def sidecar_path(json_path):
+    return os.path.splitext(json_path)[0] + '.bin'
+
+
+def write_sidecar(sections, path):
+    """Write compiled sections to a sidecar file, replacing any existing one
+    atomically: readers see the old file or the complete new one, even with
+    several workers (or instances sharing a temp directory) compiling at once"""
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(serialize_sections(sections))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def fallback_sidecar_path(json_path):
+    """Sidecar location in the temp directory, for deployments where the
+    directory of the JSON is read-only (e.g. serverless functions)"""
+    digest = hashlib.md5(os.path.abspath(json_path).encode()).hexdigest()[:12]
+    return os.path.join(tempfile.gettempdir(), f"cities-{digest}.bin")
+
+
+def load_city_store(json_path):
+    """Open the memory-mapped sidecar for json_path, (re)building it when it
+    is missing or older than the JSON.  The sidecar is looked for (and
+    written) next to the JSON, then in the temp directory; building it in
+    the release step (``python city_store.py``) avoids compiling it on a
+    cold start.  Falls back to an in-memory store when no sidecar can be
+    written.
+
+    Raises FileNotFoundError when neither the JSON nor a sidecar exists.
+    """
+    bin_paths = (sidecar_path(json_path), fallback_sidecar_path(json_path))
+    try:
+        json_mtime = os.path.getmtime(json_path)
+    except OSError:
+        json_mtime = None
+
+    for bin_path in bin_paths:
+        if os.path.exists(bin_path) and (json_mtime is None or os.path.getmtime(bin_path) >= json_mtime):
+            try:
+                return CityStore.open(bin_path)
+            except (OSError, ValueError, struct.error) as e:
+                print(f"Ignoring unreadable cities sidecar {bin_path}: {e}")
+
+    with open(json_path, 'r', encoding='utf-8') as f:
+        cities = json.load(f)
+    sections = build_sections(cities)
+    for bin_path in bin_paths:
+        try:
+            write_sidecar(sections, bin_path)
+            return CityStore.open(bin_path)
+        except OSError as e:
+            print(f"Could not write cities sidecar {bin_path}: {e}")
+    return CityStore(serialize_sections(sections))
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else os.path.join('static', 'cities.json')
+    with open(source, 'r', encoding='utf-8') as f:
+        write_sidecar(build_sections(json.load(f)), sidecar_path(source))
+    print(f"Wrote {sidecar_path(source)}")
@@ -0,0 +1,99 @@
+"""Pre-encoded JSON response bodies for cached weather data.
+
+A cache hit used to re-serialize the whole nested response on every
+request.  EncodedResponse holds the final JSON bytes of a cached entry once,
+along with a strong ETag and lazily compressed copies (gzip, and brotli
+when the optional brotli package is installed), so a hit is a lookup plus a
+write of ready-made bytes.  Each content-coding is a different
+representation with its own strong ETag (the body's, suffixed with the
+coding), so caches never match a 304 or a range to the wrong bytes.
+
+encode_json() builds a body from ordinary values and RawJSON fragments,
+which are spliced in without being decoded, so a multi-location response can
+reuse each location's cached bytes.
+"""
+
+import gzip
+import hashlib
+import json
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Bodies smaller than this are not worth compressing
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+class RawJSON:
+    """Already-encoded JSON (bytes or a memoryview of them) to splice into
+    encode_json() output as-is"""
+
+    __slots__ = ('encoded',)
+
+    def __init__(self, encoded):
+        self.encoded = encoded
+
+
+def encode_json(value, dumps=json.dumps):
+    """Encode a small envelope of dicts and lists as compact JSON bytes with
+    sorted keys, copying RawJSON fragments verbatim.  dumps encodes the other
+    leaves (pass the app's encoder so output matches jsonify); large payloads
+    should be RawJSON, since containers are walked in Python."""
+    if isinstance(value, RawJSON):
+        return value.encoded
+    if isinstance(value, dict):
+        return b'{' + b','.join(
+            dumps(str(key)).encode() + b':' + encode_json(item, dumps)
+            for key, item in sorted(value.items())
+        ) + b'}'
+    if isinstance(value, list):
+        return b'[' + b','.join(encode_json(item, dumps) for item in value) + b']'
+    return dumps(value).encode()
+
+
+class EncodedResponse:
+    """JSON body bytes with a strong ETag and memoized compressed variants"""
+
+    __slots__ = ('body', 'etag', '_compressed')
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._compressed = {}
+
+    def __len__(self):
+        return len(self.body)
+
+    def coding(self, accept_encodings):
+        """Content-coding to send a client accepting accept_encodings (a
+        collection of codings), or None to send the body uncompressed"""
+        if len(self.body) < MIN_COMPRESS_BYTES:
+            return None
+        if brotli is not None and 'br' in accept_encodings:
+            return 'br'
+        if 'gzip' in accept_encodings:
+            return 'gzip'
+        return None
+
+    def coded_etag(self, coding):
+        """Strong ETag of the body sent with content-coding (None: uncompressed)"""
+        return f"{self.etag}-{coding}" if coding else self.etag
+
+    def encoded_body(self, accept_encodings):
+        """(body, content_encoding) for a client accepting accept_encodings;
+        content_encoding is None when uncompressed"""
+        coding = self.coding(accept_encodings)
+        if coding is None:
+            return self.body, None
+        compressed = self._compressed.get(coding)
+        if compressed is None:
+            if coding == 'br':
+                compressed = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            else:
+                compressed = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            self._compressed[coding] = compressed
+        return compressed, coding
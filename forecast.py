@@ -0,0 +1,355 @@
+"""Normalized forecast model built from OpenWeatherMap payloads.
+
+Each upstream fetch is normalized exactly once, whichever path produced it
+(One Call 3.0, or the 2.5 current weather + 5 day / 3 hour fallback), into a
+Forecast of compact rows.  Its to_dict() form is what the weather cache
+stores and what /api/weather returns: the detail view is the whole entry
+(up to DETAIL_HOURS hourly and DETAIL_DAYS daily rows), and other views such
+as the favorites cards are forecast_view() slices of the same entry, so
+every endpoint shares one cache entry per location.
+
+Values are metric: temperatures in °C, wind speeds in km/h, visibility in km.
+
+The fallback's daily rows are aggregated from 3-hour entries in a single
+pass, grouped into days of the location's local time.
+"""
+
+from bisect import bisect_left
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+DETAIL_HOURS = 24
+DETAIL_DAYS = 7
+FAVORITE_HOURS = 6
+FAVORITE_DAYS = 3
+# Rows of the 3-hourly fallback forecast used as "hourly" rows (24 hours)
+FALLBACK_HOURLY_ROWS = 8
+
+# m/s from the API to km/h
+MS_TO_KMH = 3.6
+SECONDS_PER_DAY = 86400
+
+Current = namedtuple('Current', [
+    'city', 'country', 'temp', 'feels_like', 'humidity', 'pressure', 'wind_speed', 'description', 'icon',
+    'visibility', 'visibility_unit', 'sunrise', 'sunset', 'timezone', 'temp_unit', 'speed_unit', 'weather_main',
+    'is_day', 'uv_index', 'uv_info', 'local_time', 'lat', 'lon'
+])
+HourlyForecast = namedtuple('HourlyForecast', ['dt', 'temp', 'description', 'icon', 'pop', 'humidity', 'wind_speed'])
+DailyForecast = namedtuple('DailyForecast', [
+    'dt', 'temp_max', 'temp_min', 'description', 'icon', 'pop', 'humidity', 'wind_speed', 'uvi'
+])
+AirQuality = namedtuple('AirQuality', ['aqi', 'level', 'color', 'description', 'components'])
+Alert = namedtuple('Alert', ['event', 'description', 'start', 'end', 'severity'])
+
+
+class Forecast(namedtuple('Forecast', ['current', 'hourly', 'daily', 'air_quality', 'alerts'])):
+    """One location's normalized weather"""
+
+    __slots__ = ()
+
+    def to_dict(self):
+        """The response/cache form of the forecast"""
+        return {
+            'current': self.current._asdict(),
+            'hourly': [hour._asdict() for hour in self.hourly],
+            'daily': [day._asdict() for day in self.daily],
+            'air_quality': self.air_quality._asdict() if self.air_quality else None,
+            'alerts': [alert._asdict() for alert in self.alerts]
+        }
+
+
+def forecast_view(data, hours, days):
+    """A cached forecast dict trimmed to its first hours hourly and days
+    daily rows.  Shares everything with data, which is not modified."""
+    if len(data.get('hourly', ())) <= hours and len(data.get('daily', ())) <= days:
+        return data
+    return dict(data, hourly=data['hourly'][:hours], daily=data['daily'][:days])
+
+
+# Per-field conversions between the two unit systems responses are built in.
+# Converted temperatures are rounded to whole degrees, speeds to one decimal
+# and visibility to whole units; the functions also work on NumPy arrays.
+UNIT_CONVERSIONS = {
+    ('metric', 'imperial'): {
+        'temp': lambda value: (value * 9/5) + 32,  # Celsius to Fahrenheit
+        'speed': lambda value: value * 0.621371,  # km/h to mph
+        'visibility': lambda value: value * 0.621371,  # km to miles
+        'temp_unit': '°F', 'speed_unit': 'mph', 'visibility_unit': 'miles'
+    },
+    ('imperial', 'metric'): {
+        'temp': lambda value: (value - 32) * 5/9,  # Fahrenheit to Celsius
+        'speed': lambda value: value * 1.60934,  # mph to km/h
+        'visibility': lambda value: value / 0.621371,  # miles to km
+        'temp_unit': '°C', 'speed_unit': 'km/h', 'visibility_unit': 'km'
+    }
+}
+
+
+def convert_units(data, from_units, to_units):
+    """Convert weather data between metric and imperial units.
+
+    data is never modified: only the dicts holding converted fields are
+    rebuilt, and everything else is shared with the original.
+    """
+    conversion = UNIT_CONVERSIONS.get((from_units, to_units))
+    if conversion is None:
+        return data
+    temp = conversion['temp']
+    speed = conversion['speed']
+
+    current = data['current']
+    converted_current = dict(
+        current,
+        temp=round(temp(current['temp'])),
+        feels_like=round(temp(current['feels_like'])),
+        wind_speed=round(speed(current['wind_speed']), 1),
+        speed_unit=conversion['speed_unit'],
+        temp_unit=conversion['temp_unit'],
+        visibility_unit=conversion['visibility_unit']
+    )
+    if 'visibility' in current and current['visibility'] != 'N/A':
+        converted_current['visibility'] = round(conversion['visibility'](current['visibility']))
+
+    converted_data = dict(data, current=converted_current)
+    if 'hourly' in data:
+        converted_data['hourly'] = [
+            dict(hour, temp=round(temp(hour['temp'])), wind_speed=round(speed(hour['wind_speed']), 1))
+            for hour in data['hourly']
+        ]
+    if 'daily' in data:
+        converted_data['daily'] = [
+            dict(day, temp_max=round(temp(day['temp_max'])), temp_min=round(temp(day['temp_min'])),
+                 wind_speed=round(speed(day['wind_speed']), 1))
+            for day in data['daily']
+        ]
+    return converted_data
+
+
+# Inclusive upper bounds of the UV index categories below; the last is open-ended
+UV_THRESHOLDS = (2, 5, 7, 10)
+UV_CATEGORIES = (
+    {'level': 'Low', 'color': '#289500', 'recommendation': 'No protection needed'},
+    {'level': 'Moderate', 'color': '#F7D708', 'recommendation': 'Some protection required'},
+    {'level': 'High', 'color': '#F85900', 'recommendation': 'Protection essential'},
+    {'level': 'Very High', 'color': '#D8001C', 'recommendation': 'Extra protection needed'},
+    {'level': 'Extreme', 'color': '#6B49C8', 'recommendation': 'Avoid sun exposure'}
+)
+
+
+def get_uv_category(uv_index):
+    """Get UV index category and recommendations"""
+    return dict(UV_CATEGORIES[bisect_left(UV_THRESHOLDS, uv_index)])
+
+def get_aqi_category(aqi):
+    """Get AQI category and color"""
+    categories = {
+        1: {'level': 'Good', 'color': '#00E400', 'description': 'Air quality is satisfactory'},
+        2: {'level': 'Fair', 'color': '#FFFF00', 'description': 'Air quality is acceptable'},
+        3: {'level': 'Moderate', 'color': '#FF7E00', 'description': 'Members of sensitive groups may experience health effects'},
+        4: {'level': 'Poor', 'color': '#FF0000', 'description': 'Health effects may be experienced by everyone'},
+        5: {'level': 'Very Poor', 'color': '#8F3F97', 'description': 'Health effects will be experienced by everyone'}
+    }
+    return categories.get(aqi, categories[1])
+
+def get_local_time(timezone_offset):
+    """Get local time for the location"""
+    utc_time = datetime.utcnow()
+    local_time = utc_time + timedelta(seconds=timezone_offset)
+    return local_time
+
+def format_time_with_offset(unix_timestamp, offset_seconds):
+    """Converts a UTC timestamp to a formatted time string in the target timezone."""
+    if not unix_timestamp or not isinstance(offset_seconds, (int, float)):
+        return "N/A"
+    try:
+        tz = timezone(timedelta(seconds=offset_seconds))
+        local_time = datetime.fromtimestamp(unix_timestamp, tz)
+        return local_time.strftime('%I:%M %p')
+    except (ValueError, TypeError):
+        return "N/A"
+
+
+def _visibility_km(meters):
+    return round(meters / 1000) if meters is not None else 'N/A'
+
+
+def normalize_air_quality(air_quality_data):
+    """AirQuality from an air_pollution payload, or None if the call failed"""
+    if 'error' in air_quality_data:
+        return None
+    aqi = air_quality_data['list'][0]['main']['aqi']
+    aqi_info = get_aqi_category(aqi)
+    return AirQuality(aqi, aqi_info['level'], aqi_info['color'], aqi_info['description'],
+                      air_quality_data['list'][0]['components'])
+
+
+def from_one_call(one_call_data, air_quality_data, city, lat, lon):
+    """Forecast from a One Call 3.0 payload"""
+    hourly = [
+        HourlyForecast(
+            hour['dt'], round(hour['temp']), hour['weather'][0]['description'].title(), hour['weather'][0]['icon'],
+            round(hour.get('pop', 0) * 100), hour['humidity'], round(hour['wind_speed'] * MS_TO_KMH, 1)
+        )
+        for hour in one_call_data.get('hourly', [])[:DETAIL_HOURS]
+    ]
+    daily = [
+        DailyForecast(
+            day['dt'], round(day['temp']['max']), round(day['temp']['min']),
+            day['weather'][0]['description'].title(), day['weather'][0]['icon'], round(day.get('pop', 0) * 100),
+            day['humidity'], round(day['wind_speed'] * MS_TO_KMH, 1), day.get('uvi', 0)
+        )
+        for day in one_call_data.get('daily', [])[:DETAIL_DAYS]
+    ]
+    uv_info = get_uv_category(one_call_data['current'].get('uvi', 0))
+    return Forecast(one_call_current(one_call_data, city, lat, lon, uv_info), hourly, daily,
+                    normalize_air_quality(air_quality_data), one_call_alerts(one_call_data))
+
+
+def one_call_current(one_call_data, city, lat, lon, uv_info):
+    """Current row of a One Call 3.0 payload, given its UV category"""
+    current = one_call_data['current']
+    timezone_offset = one_call_data.get('timezone_offset', 0)
+    condition = current['weather'][0]
+    return Current(
+        city=city or 'Unknown Location',
+        country='',
+        temp=round(current['temp']),
+        feels_like=round(current['feels_like']),
+        humidity=current['humidity'],
+        pressure=current['pressure'],
+        wind_speed=round(current['wind_speed'] * MS_TO_KMH, 1),
+        description=condition['description'].title(),
+        icon=condition['icon'],
+        visibility=_visibility_km(current.get('visibility')),
+        visibility_unit='km',
+        sunrise=format_time_with_offset(current.get('sunrise'), timezone_offset),
+        sunset=format_time_with_offset(current.get('sunset'), timezone_offset),
+        timezone=timezone_offset,
+        temp_unit='°C',
+        speed_unit='km/h',
+        weather_main=condition['main'],
+        is_day=current.get('sunrise', 0) < current['dt'] < current.get('sunset', 0),
+        uv_index=current.get('uvi', 0),
+        uv_info=uv_info,
+        local_time=get_local_time(timezone_offset).strftime('%Y-%m-%d %H:%M:%S'),
+        lat=lat,
+        lon=lon
+    )
+
+
+def one_call_alerts(one_call_data):
+    return [
+        Alert(alert.get('event', 'Weather Alert'), alert.get('description', ''),
+              alert.get('start', 0), alert.get('end', 0), 'moderate')
+        for alert in one_call_data.get('alerts', [])
+    ]
+
+
+def from_current_and_forecast(weather_data, forecast_data, air_quality_data, lat, lon):
+    """Forecast from the 2.5 current weather and 5 day / 3 hour forecast payloads"""
+    timezone_offset = weather_data['timezone']
+    condition = weather_data['weather'][0]
+    current_row = Current(
+        city=weather_data['name'],
+        country=weather_data['sys']['country'],
+        temp=round(weather_data['main']['temp']),
+        feels_like=round(weather_data['main']['feels_like']),
+        humidity=weather_data['main']['humidity'],
+        pressure=weather_data['main']['pressure'],
+        wind_speed=round(weather_data['wind']['speed'] * MS_TO_KMH, 1),
+        description=condition['description'].title(),
+        icon=condition['icon'],
+        visibility=_visibility_km(weather_data.get('visibility')),
+        visibility_unit='km',
+        sunrise=format_time_with_offset(weather_data['sys'].get('sunrise'), timezone_offset),
+        sunset=format_time_with_offset(weather_data['sys'].get('sunset'), timezone_offset),
+        timezone=timezone_offset,
+        temp_unit='°C',
+        speed_unit='km/h',
+        weather_main=condition['main'],
+        is_day=weather_data['sys']['sunrise'] <= weather_data['dt'] <= weather_data['sys']['sunset'],
+        uv_index=0,
+        uv_info=get_uv_category(0),
+        local_time=get_local_time(timezone_offset).strftime('%Y-%m-%d %H:%M:%S'),
+        lat=lat,
+        lon=lon
+    )
+
+    entries = forecast_data.get('list', [])
+    hourly = [
+        HourlyForecast(
+            entry['dt'], round(entry['main']['temp']), entry['weather'][0]['description'].title(),
+            entry['weather'][0]['icon'], round(entry.get('pop', 0) * 100), entry['main']['humidity'],
+            round(entry['wind']['speed'] * MS_TO_KMH, 1)
+        )
+        for entry in entries[:FALLBACK_HOURLY_ROWS]
+    ]
+
+    # Group by the forecast's own location offset, falling back to the current weather's
+    offset = forecast_data.get('city', {}).get('timezone', timezone_offset)
+    daily = aggregate_daily(entries, offset)
+
+    return Forecast(current_row, hourly, daily, normalize_air_quality(air_quality_data), [])
+
+
+def _day_icon(icon):
+    """Daytime variant of an icon code ('10n' -> '10d'), as daily rows use"""
+    return icon[:-1] + 'd' if icon.endswith('n') else icon
+
+
+def _daily_row(dt, temp_max, temp_min, description, icon, pop, humidity_mean, wind_mean):
+    return DailyForecast(
+        dt, round(temp_max), round(temp_min), description, _day_icon(icon), round(pop * 100),
+        round(humidity_mean), round(wind_mean * MS_TO_KMH, 1), 0
+    )
+
+
+def aggregate_daily(entries, timezone_offset, days=DETAIL_DAYS):
+    """Daily rows from 5 day / 3 hour forecast entries, in one pass.
+
+    Entries are grouped into calendar days of the location (UTC shifted by
+    timezone_offset seconds), the first days of them in order of appearance.
+    Each row has the day's min/max temperature, mean humidity and wind speed,
+    highest precipitation probability, and its most frequent condition (the
+    earliest on ties) with that condition's first icon.
+    """
+    # day -> [first dt, min temp, max temp, wind total, humidity total,
+    #         entry count, max pop, {description: [count, icon]}]
+    accumulators = {}
+    for entry in entries:
+        day = (entry['dt'] + timezone_offset) // SECONDS_PER_DAY
+        main = entry['main']
+        temp = main['temp']
+        condition = entry['weather'][0]
+        description = condition['description'].title()
+        accumulator = accumulators.get(day)
+        if accumulator is None:
+            if len(accumulators) >= days:
+                continue
+            accumulator = accumulators[day] = [entry['dt'], temp, temp, 0.0, 0, 0, 0, {}]
+        if temp < accumulator[1]:
+            accumulator[1] = temp
+        if temp > accumulator[2]:
+            accumulator[2] = temp
+        accumulator[3] += entry['wind']['speed']
+        accumulator[4] += main['humidity']
+        accumulator[5] += 1
+        pop = entry.get('pop', 0)
+        if pop > accumulator[6]:
+            accumulator[6] = pop
+        seen = accumulator[7].get(description)
+        if seen is None:
+            accumulator[7][description] = [1, condition['icon']]
+        else:
+            seen[0] += 1
+
+    daily = []
+    for dt, temp_min, temp_max, wind_total, humidity_total, count, pop, conditions in accumulators.values():
+        description, icon, best = None, None, 0
+        for name, (seen, first_icon) in conditions.items():
+            if seen > best:
+                description, icon, best = name, first_icon, seen
+        daily.append(_daily_row(dt, temp_max, temp_min, description, icon, pop,
+                                humidity_total / count, wind_total / count))
+    return daily
+
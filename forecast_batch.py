@@ -0,0 +1,154 @@
+"""Batched normalization of many One Call 3.0 payloads at once.
+
+from_one_call() rounds and converts every hourly and daily row one value at
+a time, which is most of its CPU cost.  from_one_call_batch() stacks the
+numeric fields of all the payloads' rows into NumPy arrays and does the
+m/s -> km/h conversion, rounding, imperial conversion and UV category
+binning once per field for the whole batch.  Its output is identical to the
+scalar path, which it falls back to when NumPy is not installed or the
+batch is too small for the array setup to pay off.
+
+/api/weather/batch normalizes the locations it fetches with it (see
+app.fetch_batch_misses).
+"""
+
+from forecast import (
+    DETAIL_DAYS, DETAIL_HOURS, MS_TO_KMH, UNIT_CONVERSIONS, UV_CATEGORIES, UV_THRESHOLDS, convert_units,
+    from_one_call, normalize_air_quality, one_call_alerts, one_call_current
+)
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - numpy is optional
+    np = None
+
+# Below this many payloads the scalar path is faster
+MIN_BATCH_ITEMS = 4
+
+# A scaled value this close to .5 may round differently from round() on the
+# exact value, so those elements are re-rounded in Python
+HALF_TOLERANCE = 1e-6
+
+
+def round_values(values, ndigits=None):
+    """[round(value, ndigits) for value in values] for a float array, as a
+    list of ints (ndigits None) or floats"""
+    if ndigits is None:
+        return np.rint(values).astype(np.int64).tolist()
+    scaled = values * 10.0 ** ndigits
+    rounded = (np.rint(scaled) / 10.0 ** ndigits).tolist()
+    for i in np.flatnonzero(np.abs(scaled - np.floor(scaled) - 0.5) < HALF_TOLERANCE).tolist():
+        rounded[i] = round(float(values[i]), ndigits)
+    return rounded
+
+
+def uv_categories(uv_indexes):
+    """[get_uv_category(uv) for uv in uv_indexes], binned in one searchsorted"""
+    bins = np.searchsorted(UV_THRESHOLDS, np.asarray(uv_indexes, dtype=float), side='left')
+    return [dict(UV_CATEGORIES[i]) for i in bins.tolist()]
+
+
+def _column(rows, field, default=None):
+    if default is None:
+        return np.array([row[field] for row in rows], dtype=float)
+    return np.array([row.get(field, default) for row in rows], dtype=float)
+
+
+def _hourly_rows(hours):
+    temps = round_values(_column(hours, 'temp'))
+    pops = round_values(_column(hours, 'pop', 0) * 100)
+    winds = round_values(_column(hours, 'wind_speed') * MS_TO_KMH, 1)
+    return [
+        {'dt': hour['dt'], 'temp': temp, 'description': hour['weather'][0]['description'].title(),
+         'icon': hour['weather'][0]['icon'], 'pop': pop, 'humidity': hour['humidity'], 'wind_speed': wind}
+        for hour, temp, pop, wind in zip(hours, temps, pops, winds)
+    ]
+
+
+def _daily_rows(days):
+    temp_maxes = round_values(np.array([day['temp']['max'] for day in days], dtype=float))
+    temp_mins = round_values(np.array([day['temp']['min'] for day in days], dtype=float))
+    pops = round_values(_column(days, 'pop', 0) * 100)
+    winds = round_values(_column(days, 'wind_speed') * MS_TO_KMH, 1)
+    return [
+        {'dt': day['dt'], 'temp_max': temp_max, 'temp_min': temp_min,
+         'description': day['weather'][0]['description'].title(), 'icon': day['weather'][0]['icon'],
+         'pop': pop, 'humidity': day['humidity'], 'wind_speed': wind, 'uvi': day.get('uvi', 0)}
+        for day, temp_max, temp_min, pop, wind in zip(days, temp_maxes, temp_mins, pops, winds)
+    ]
+
+
+def _converted_column(rows, field, convert, ndigits=None):
+    return round_values(convert(np.array([row[field] for row in rows], dtype=float)), ndigits)
+
+
+def _convert_hourly(rows, conversion):
+    temps = _converted_column(rows, 'temp', conversion['temp'])
+    winds = _converted_column(rows, 'wind_speed', conversion['speed'], 1)
+    return [dict(row, temp=temp, wind_speed=wind) for row, temp, wind in zip(rows, temps, winds)]
+
+
+def _convert_daily(rows, conversion):
+    temp_maxes = _converted_column(rows, 'temp_max', conversion['temp'])
+    temp_mins = _converted_column(rows, 'temp_min', conversion['temp'])
+    winds = _converted_column(rows, 'wind_speed', conversion['speed'], 1)
+    return [
+        dict(row, temp_max=temp_max, temp_min=temp_min, wind_speed=wind)
+        for row, temp_max, temp_min, wind in zip(rows, temp_maxes, temp_mins, winds)
+    ]
+
+
+def _split(rows, counts):
+    start = 0
+    for count in counts:
+        yield rows[start:start + count]
+        start += count
+
+
+def from_one_call_batch(items, unit_systems=('metric', 'imperial')):
+    """Normalize many One Call 3.0 payloads together.
+
+    items are (one_call_data, air_quality_data, city, lat, lon) tuples.
+    Returns one {units: data} dict per item, where data equals
+    convert_units(from_one_call(*item).to_dict(), 'metric', units).
+    """
+    if np is None or len(items) < MIN_BATCH_ITEMS:
+        results = []
+        for item in items:
+            data = from_one_call(*item).to_dict()
+            results.append({units: convert_units(data, 'metric', units) for units in unit_systems})
+        return results
+
+    payload_hours = [one_call_data.get('hourly', [])[:DETAIL_HOURS] for one_call_data, *_ in items]
+    payload_days = [one_call_data.get('daily', [])[:DETAIL_DAYS] for one_call_data, *_ in items]
+    hour_counts = [len(hours) for hours in payload_hours]
+    day_counts = [len(days) for days in payload_days]
+    hourly = _hourly_rows([hour for hours in payload_hours for hour in hours])
+    daily = _daily_rows([day for days in payload_days for day in days])
+    uv_infos = uv_categories([one_call_data['current'].get('uvi', 0) for one_call_data, *_ in items])
+
+    metric = []
+    for (one_call_data, air_quality_data, city, lat, lon), uv_info, hours, days in zip(
+            items, uv_infos, _split(hourly, hour_counts), _split(daily, day_counts)):
+        air_quality = normalize_air_quality(air_quality_data)
+        metric.append({
+            'current': one_call_current(one_call_data, city, lat, lon, uv_info)._asdict(),
+            'hourly': hours,
+            'daily': days,
+            'air_quality': air_quality._asdict() if air_quality else None,
+            'alerts': [alert._asdict() for alert in one_call_alerts(one_call_data)]
+        })
+
+    results = [{} for _ in items]
+    for units in unit_systems:
+        conversion = UNIT_CONVERSIONS.get(('metric', units))
+        if conversion is None:
+            for result, data in zip(results, metric):
+                result[units] = data
+            continue
+        converted_hourly = _split(_convert_hourly(hourly, conversion), hour_counts)
+        converted_daily = _split(_convert_daily(daily, conversion), day_counts)
+        for result, data, hours, days in zip(results, metric, converted_hourly, converted_daily):
+            converted = convert_units({'current': data['current']}, 'metric', units)
+            result[units] = dict(data, current=converted['current'], hourly=hours, daily=days)
+    return results
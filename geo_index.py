@@ -0,0 +1,104 @@
+"""Nearest-city lookup over the local cities database.
+
+Coordinates are projected onto the unit sphere and arranged as an implicit
+k-d tree (the node of range [lo, hi) is the median at (lo + hi) // 2, split
+on axis depth % 3).  Straight-line distance between unit vectors grows
+monotonically with great-circle distance, so the Euclidean nearest neighbour
+is also the haversine nearest neighbour.  Both the vectors and the tree
+order are stored as sections of the city_store sidecar.
+"""
+
+import math
+from array import array
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def to_unit_vector(lat, lon):
+    lat_rad = math.radians(lat)
+    lon_rad = math.radians(lon)
+    cos_lat = math.cos(lat_rad)
+    return (cos_lat * math.cos(lon_rad), cos_lat * math.sin(lon_rad), math.sin(lat_rad))
+
+
+def chord_to_km(chord):
+    """Great-circle distance for a chord length between two unit vectors"""
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, chord / 2))
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def build_spatial_sections(lats, lons):
+    """Build the unit-vector column and implicit k-d tree order for a store"""
+    xyz = array('d')
+    for lat, lon in zip(lats, lons):
+        xyz.extend(to_unit_vector(lat, lon))
+
+    tree = array('i', bytes(4 * len(lats)))
+    stack = [(list(range(len(lats))), 0, 0)]
+    while stack:
+        ids, lo, depth = stack.pop()
+        if not ids:
+            continue
+        axis = depth % 3
+        ids.sort(key=lambda city_id: xyz[3 * city_id + axis])
+        mid = len(ids) // 2
+        tree[lo + mid] = ids[mid]
+        stack.append((ids[:mid], lo, depth + 1))
+        stack.append((ids[mid + 1:], lo + mid + 1, depth + 1))
+
+    return {'xyz': xyz, 'kdtree': tree}
+
+
+class NearestCity:
+    """Exact nearest-neighbour search over a CityStore's k-d tree"""
+
+    def __init__(self, store):
+        self._xyz = store.sections['xyz']
+        self._tree = store.sections['kdtree']
+
+    def __len__(self):
+        return len(self._tree)
+
+    def nearest(self, lat, lon):
+        """Return (city_id, distance_km) of the closest city, or None if empty"""
+        if not len(self._tree):
+            return None
+
+        point = to_unit_vector(lat, lon)
+        xyz = self._xyz
+        tree = self._tree
+        best_id = -1
+        best_d2 = float('inf')
+        # Depth-first search with pruning; pending entries carry the squared
+        # distance to their splitting plane so far subtrees can be skipped.
+        stack = [(0, len(tree), 0, 0.0)]
+        while stack:
+            lo, hi, depth, plane_d2 = stack.pop()
+            if lo >= hi or plane_d2 >= best_d2:
+                continue
+            mid = (lo + hi) // 2
+            city_id = tree[mid]
+            base = 3 * city_id
+            dx = point[0] - xyz[base]
+            dy = point[1] - xyz[base + 1]
+            dz = point[2] - xyz[base + 2]
+            d2 = dx * dx + dy * dy + dz * dz
+            if d2 < best_d2:
+                best_d2 = d2
+                best_id = city_id
+
+            axis = depth % 3
+            diff = point[axis] - xyz[base + axis]
+            if diff < 0:
+                near, far = (lo, mid), (mid + 1, hi)
+            else:
+                near, far = (mid + 1, hi), (lo, mid)
+            stack.append((far[0], far[1], depth + 1, diff * diff))
+            stack.append((near[0], near[1], depth + 1, 0.0))
+
+        return best_id, chord_to_km(math.sqrt(best_d2))
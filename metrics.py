@@ -0,0 +1,200 @@
+"""Per-request phase timing and Prometheus metrics.
+
+Phases of the current request (cache lookup, upstream calls, fetch,
+serialization) are collected in a context variable.  The upstream pools
+copy the caller's context into their tasks, so concurrent calls are
+attributed to the request that made them.  after_request turns them into a
+Server-Timing header; a phase seen several times (e.g. One Call for each
+favorite) is reported once with its summed duration and count.
+
+Counters and histograms accumulate per worker process and are rendered in
+the Prometheus text format, together with the values of registered
+collectors (gauges and counters read from the stats() of the caches,
+limiter and breakers at scrape time).  METRICS=0 turns both off.
+"""
+
+import os
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+ENABLED = os.getenv("METRICS", "1") != "0"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_timings = ContextVar('request_timings', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _sample(name, labels, value):
+    if labels:
+        label_text = ','.join(f'{key}="{_escape(label)}"' for key, label in labels)
+        return f"{name}{{{label_text}}} {value}"
+    return f"{name} {value}"
+
+
+class Counter:
+    """Monotonic count per combination of label values"""
+
+    kind = 'counter'
+
+    def __init__(self, name, description, labelnames=()):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield _sample(self.name, list(zip(self.labelnames, labels)), value)
+
+
+class Histogram:
+    """Bucketed observations (with their sum and count) per combination of
+    label values"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labelnames = labelnames
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        for labels, counts, total in series:
+            labels = list(zip(self.labelnames, labels))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield _sample(f"{self.name}_bucket", labels + [('le', bound)], cumulative)
+            yield _sample(f"{self.name}_sum", labels, round(total, 6))
+            yield _sample(f"{self.name}_count", labels, cumulative)
+
+
+class Registry:
+    """The metrics of a worker and the collectors read at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, description, labelnames=()):
+        metric = Counter(name, description, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, description, labelnames=(), buckets=LATENCY_BUCKETS):
+        metric = Histogram(name, description, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, fn):
+        """Register fn, returning (name, kind, description, [(labels dict, value)])
+        tuples when scraped.  Usable as a decorator."""
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        for collect in self._collectors:
+            for name, kind, description, samples in collect():
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} {kind}")
+                lines.extend(_sample(name, list(labels.items()), value) for labels, value in samples
+                             if value is not None)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def start_request():
+    """Start collecting phase timings in the current context. Returns a
+    token for end_request()."""
+    return _timings.set([]) if ENABLED else None
+
+
+def end_request(token):
+    if token is not None:
+        _timings.reset(token)
+
+
+def record(name, seconds, desc=None):
+    """Add a phase of seconds to the current request, if one is being timed"""
+    timings = _timings.get()
+    if timings is not None:
+        timings.append((name, seconds, desc))
+
+
+@contextmanager
+def phase(name, histogram=None, *labels):
+    """Time the block as a phase of the current request (and, if given, an
+    observation of histogram with labels)"""
+    start = perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - start
+        record(name, elapsed)
+        if histogram is not None:
+            histogram.observe(elapsed, *labels)
+
+
+def server_timing(total=None):
+    """Server-Timing header value for the phases of the current request"""
+    timings = _timings.get()
+    if not timings and total is None:
+        return None
+    phases = {}
+    for name, seconds, desc in timings or ():
+        entry = phases.get(name)
+        if entry is None:
+            phases[name] = [seconds, 1, desc]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+    if total is not None:
+        phases['total'] = [total, 1, None]
+
+    parts = []
+    for name, (seconds, count, desc) in phases.items():
+        if count > 1:
+            desc = f"{desc} x{count}" if desc else f"x{count}"
+        part = f"{name};dur={seconds * 1000:.1f}"
+        parts.append(f'{part};desc="{desc}"' if desc else part)
+    return ', '.join(parts)
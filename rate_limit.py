@@ -0,0 +1,168 @@
+"""Token-bucket budget for upstream API calls, shared by every worker.
+
+The OpenWeatherMap quota belongs to the API key, not to a worker process,
+so the bucket's state (tokens left and when it was last refilled) lives in a
+small file that workers update under an exclusive file lock.  Without a
+state file (or on platforms without fcntl) the bucket is per process.
+
+Calls have a priority class.  Lower classes may only spend tokens while the
+bucket stays above their reserve (a fraction of its capacity), so when the
+budget runs low bulk and background work stops first and what is left goes
+to interactive requests.  A call may wait up to a per-class limit for
+tokens to refill; after that it is refused and the caller degrades.
+"""
+
+import os
+import struct
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - file locks are POSIX-only
+    fcntl = None
+
+INTERACTIVE = 0
+BULK = 1
+BACKGROUND = 2
+PRIORITY_NAMES = ('interactive', 'bulk', 'background')
+
+# Fraction of the bucket each class must leave for the classes above it
+DEFAULT_RESERVES = (0.0, 0.25, 0.5)
+# Longest each class waits for tokens before being refused, in seconds
+DEFAULT_MAX_WAITS = (2.0, 0.5, 0.0)
+
+_STATE = struct.Struct('dd')  # tokens, time of last refill
+
+
+class TokenBucket:
+    """rate tokens per second, holding at most burst"""
+
+    def __init__(self, rate, burst, path=None, reserves=DEFAULT_RESERVES, max_waits=DEFAULT_MAX_WAITS,
+                 clock=time.time):
+        self.rate = rate
+        self.burst = burst
+        self.path = path if fcntl is not None else None
+        if self.path and self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self.reserves = reserves
+        self.max_waits = max_waits
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = clock()
+        self.granted = [0] * len(PRIORITY_NAMES)
+        self.refused = [0] * len(PRIORITY_NAMES)
+        self.waited_seconds = 0.0
+        self.exhausted = 0
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _update(self, change):
+        """Refill the bucket, apply change(tokens) -> (tokens, result) to it
+        atomically (across workers when there is a state file) and return
+        result"""
+        with self._lock:
+            if not self.path:
+                self._tokens, result = change(self._refill(self._tokens, self._updated))
+                self._updated = self.clock()
+                return result
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                raw = os.pread(fd, _STATE.size, 0)
+                tokens, updated = _STATE.unpack(raw) if len(raw) == _STATE.size else (float(self.burst), self.clock())
+                tokens, result = change(self._refill(tokens, updated))
+                os.pwrite(fd, _STATE.pack(tokens, self.clock()), 0)
+                return result
+            finally:
+                os.close(fd)
+
+    def _refill(self, tokens, updated):
+        return min(float(self.burst), tokens + max(0.0, self.clock() - updated) * self.rate)
+
+    def try_acquire(self, priority=INTERACTIVE, tokens=1):
+        """Take tokens if priority's reserve allows it. Returns 0 on success,
+        otherwise the seconds until enough tokens should have refilled."""
+        floor = self.reserves[priority] * self.burst
+
+        def take(available):
+            if available - tokens >= floor:
+                return available - tokens, 0.0
+            return available, (floor + tokens - available) / self.rate
+
+        return self._update(take)
+
+    def acquire(self, priority=INTERACTIVE, tokens=1, timeout=None):
+        """Take tokens, waiting up to priority's max wait (and at most
+        timeout seconds) for them. Returns whether they were taken."""
+        if not self.enabled:
+            return True
+        max_wait = self._max_wait(priority, timeout)
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire(priority, tokens)
+            waited = time.monotonic() - start
+            if not wait or waited + wait > max_wait:
+                return self._settle(priority, not wait, waited)
+            time.sleep(wait)
+
+    async def acquire_async(self, priority=INTERACTIVE, tokens=1, timeout=None):
+        """acquire() for coroutines: waits without blocking the event loop"""
+        import asyncio
+
+        if not self.enabled:
+            return True
+        max_wait = self._max_wait(priority, timeout)
+        start = time.monotonic()
+        while True:
+            wait = self.try_acquire(priority, tokens)
+            waited = time.monotonic() - start
+            if not wait or waited + wait > max_wait:
+                return self._settle(priority, not wait, waited)
+            await asyncio.sleep(wait)
+
+    def _max_wait(self, priority, timeout):
+        max_wait = self.max_waits[priority]
+        return max_wait if timeout is None else min(max_wait, timeout)
+
+    def _settle(self, priority, granted, waited):
+        with self._lock:
+            if granted:
+                self.granted[priority] += 1
+                self.waited_seconds += waited
+            else:
+                self.refused[priority] += 1
+        return granted
+
+    def exhaust(self):
+        """Empty the bucket, e.g. after the API answered 429, so every worker
+        backs off until it refills"""
+        if self.enabled:
+            self._update(lambda available: (0.0, None))
+            with self._lock:
+                self.exhausted += 1
+
+    def retry_after(self, priority=INTERACTIVE):
+        """Seconds until a call of priority could be granted"""
+        if not self.enabled:
+            return 0.0
+        available = self._update(lambda available: (available, available))
+        return max(0.0, (self.reserves[priority] * self.burst + 1 - available) / self.rate)
+
+    def stats(self):
+        tokens = self._update(lambda available: (available, available)) if self.enabled else None
+        with self._lock:
+            return {
+                'enabled': self.enabled,
+                'mode': 'shared-file' if self.path else 'process',
+                'rate_per_minute': round(self.rate * 60, 2),
+                'burst': self.burst,
+                'tokens': round(tokens, 2) if tokens is not None else None,
+                'granted': dict(zip(PRIORITY_NAMES, self.granted)),
+                'refused': dict(zip(PRIORITY_NAMES, self.refused)),
+                'waited_seconds': round(self.waited_seconds, 3),
+                'exhausted_by_429': self.exhausted
+            }
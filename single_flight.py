@@ -0,0 +1,220 @@
+"""Request coalescing ("single flight") for cache misses.
+
+When many requests miss the cache for the same key at once, only the first
+(the leader) runs the fetch; the others wait for its result instead of each
+calling the upstream API.  With a lock directory configured, leaders in
+different worker processes also serialize on a file lock for the key and
+re-check the shared cache before fetching, so one worker's fetch serves the
+whole host.  Keys share a fixed set of lock files (stripes), so the lock
+directory stays the same size however many locations are fetched.
+
+Callers that fetch many keys together can claim() the flights they lead
+and settle() them once their results are in, instead of one do() per key.
+
+AsyncSingleFlight does the same for coroutines on one event loop (the ASGI
+mode), without the cross-worker lock.
+"""
+
+import os
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - file locks are POSIX-only
+    fcntl = None
+
+LOCK_POLL_INTERVAL = 0.01
+LOCK_STRIPES = 64
+
+
+class _Flight:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key.
+
+    do(key, fn, recheck) returns recheck() if it finds a value, otherwise the
+    result of a single fn() call shared by every caller waiting on key.  A
+    waiter that outlives timeout seconds stops waiting and calls fn itself.
+    """
+
+    def __init__(self, timeout=15.0, lock_dir=None, enabled=True, lock_stripes=LOCK_STRIPES):
+        self.timeout = timeout
+        self.lock_dir = lock_dir if fcntl is not None else None
+        self.lock_stripes = lock_stripes
+        self.enabled = enabled
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+        if self.lock_dir:
+            os.makedirs(self.lock_dir, exist_ok=True)
+
+    def do(self, key, fn, recheck=None):
+        if not self.enabled:
+            return fn()
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(self.timeout):
+                with self._lock:
+                    self.timeouts += 1
+                return fn()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._lead(key, fn, recheck)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def claim(self, key):
+        """Lead key's flight without running anything: returns True if the
+        caller now leads it and must settle() it, False if key is already in
+        flight (or coalescing is off; use do() then).  The cross-worker file
+        lock is not taken, so with a lock directory nothing is claimed."""
+        if not self.enabled or self.lock_dir:
+            return False
+        with self._lock:
+            if key in self._flights:
+                return False
+            self._flights[key] = _Flight()
+            self.leaders += 1
+            return True
+
+    def settle(self, key, result=None, error=None):
+        """Hand the result of a claimed flight (or the error it failed with)
+        to every caller waiting on key"""
+        with self._lock:
+            flight = self._flights.pop(key)
+        flight.result = result
+        flight.error = error
+        flight.done.set()
+
+    def _lead(self, key, fn, recheck):
+        # Another flight may have filled the cache between our miss and now
+        if recheck is not None:
+            value = recheck()
+            if value is not None:
+                return value
+        if not self.lock_dir:
+            return fn()
+
+        with open(self._lock_path(key), 'a') as lock_file:
+            deadline = time.monotonic() + self.timeout
+            locked = False
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    locked = True
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        with self._lock:
+                            self.timeouts += 1
+                        break
+                    time.sleep(LOCK_POLL_INTERVAL)
+            try:
+                # A leader in another worker may have just fetched it
+                if locked and recheck is not None:
+                    value = recheck()
+                    if value is not None:
+                        return value
+                return fn()
+            finally:
+                if locked:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _lock_path(self, key):
+        # crc32, not hash(): every worker must pick the same stripe for a key
+        stripe = zlib.crc32(key.encode()) % self.lock_stripes
+        return os.path.join(self.lock_dir, f"{stripe}.lock")
+
+    def stats(self):
+        with self._lock:
+            return {
+                'mode': 'file-lock' if self.lock_dir else 'thread',
+                'in_flight': len(self._flights),
+                'leaders': self.leaders,
+                'coalesced': self.coalesced,
+                'timeouts': self.timeouts
+            }
+
+
+class AsyncSingleFlight:
+    """SingleFlight for coroutines: await do(key, fn, recheck) runs fn() (a
+    coroutine function) once for every caller waiting on key.  recheck is a
+    coroutine function too."""
+
+    def __init__(self, timeout=15.0, enabled=True):
+        self.timeout = timeout
+        self.enabled = enabled
+        self._flights = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def do(self, key, fn, recheck=None):
+        import asyncio
+
+        if not self.enabled:
+            return await fn()
+
+        flight = self._flights.get(key)
+        if flight is not None:
+            self.coalesced += 1
+            try:
+                return await asyncio.wait_for(asyncio.shield(flight), self.timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                return await fn()
+
+        flight = self._flights[key] = asyncio.get_running_loop().create_future()
+        self.leaders += 1
+        try:
+            # Another flight may have filled the cache between our miss and now
+            value = await recheck() if recheck is not None else None
+            if value is None:
+                value = await fn()
+            flight.set_result(value)
+            return value
+        except BaseException as e:
+            flight.set_exception(e if isinstance(e, Exception) else RuntimeError('Flight leader was cancelled'))
+            # Waiters get the error; don't warn when there were none
+            flight.exception()
+            raise
+        finally:
+            del self._flights[key]
+
+    def stats(self):
+        return {
+            'mode': 'asyncio',
+            'in_flight': len(self._flights),
+            'leaders': self.leaders,
+            'coalesced': self.coalesced,
+            'timeouts': self.timeouts
+        }
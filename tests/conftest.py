@@ -0,0 +1,56 @@
+"""Shared fixtures: one StubUpstream (benchmarks/stub_upstream.py) for the
+session, and the app configured against it.
+
+app.py and upstream.py read their settings at import, so the environment
+is set here, before any test module imports them: an in-memory cache, no
+refresh-ahead thread and no upstream budget (the rate limiter has its own
+tests).
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'benchmarks')]
+
+from stub_upstream import StubUpstream  # noqa: E402
+
+_stub = StubUpstream().__enter__()
+os.environ.update(
+    OPENWEATHER_BASE_URL=_stub.url, OPENWEATHER_API_KEY='test', WEATHER_CACHE_BACKEND='memory',
+    HOT_REFRESH_TOP_N='0', UPSTREAM_RATE_PER_MINUTE='0', UPSTREAM_RETRIES='0'
+)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    _stub.__exit__(None, None, None)
+
+
+@pytest.fixture
+def stub():
+    """The session's StubUpstream, with no latency or injected errors and
+    its call counts reset"""
+    _stub.latency = 0.0
+    _stub.error_rate = 0.0
+    with _stub._lock:
+        _stub.calls.clear()
+    return _stub
+
+
+@pytest.fixture
+def weather_app(stub, monkeypatch):
+    """app.py with empty caches, closed circuit breakers and no local cities
+    database (searches go to the stub's geocoder)"""
+    import app
+    import upstream
+
+    monkeypatch.setattr(app, 'CITIES_PATH', os.path.join(tempfile.mkdtemp(), 'cities.json'))
+    monkeypatch.setattr(app, '_city_data', None)
+    app.weather_cache.clear()
+    app.encoded_responses.clear()
+    for breaker in upstream.breakers.values():
+        breaker.record_success()
+    return app
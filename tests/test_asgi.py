@@ -0,0 +1,39 @@
+"""The ASGI mode keeps serving while a request waits on blocking work"""
+
+import asyncio
+import time
+
+import pytest
+
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('asgiref')
+
+from stub_upstream import latency_distribution  # noqa: E402
+
+SLOW_GEOCODER = 1.0
+
+
+async def timed(client, method, path, started, **kwargs):
+    response = await client.request(method, path, **kwargs)
+    return response.status_code, time.perf_counter() - started
+
+
+def test_slow_geocoder_does_not_stall_other_requests(weather_app, stub):
+    import asgi
+
+    # No local cities database: the search goes to the (slow) geocoding API
+    stub.latency = latency_distribution(f"/geo/1.0/direct={SLOW_GEOCODER};0.01")
+
+    async def run():
+        transport = httpx.ASGITransport(app=asgi.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://test') as client:
+            started = time.perf_counter()
+            return await asyncio.gather(
+                timed(client, 'GET', '/api/search?q=paris', started),
+                timed(client, 'POST', '/api/weather', started, json={'lat': 48.85, 'lon': 2.35, 'city': 'Paris'})
+            )
+
+    (search_status, search_seconds), (weather_status, weather_seconds) = asyncio.run(run())
+    assert search_status == 200 and search_seconds >= SLOW_GEOCODER
+    assert weather_status == 200
+    assert weather_seconds < SLOW_GEOCODER / 2
@@ -0,0 +1,166 @@
+"""Stale-while-revalidate and refresh-ahead (cache_refresh.Revalidator)"""
+
+import time
+
+from cache_refresh import RefreshFailed, Revalidator
+from weather_cache import SQLiteCache, TieredCache, WeatherCache
+
+PARIS = {'lat': 48.85, 'lon': 2.35, 'city': 'Paris', 'units': 'metric'}
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def wait_for_refreshes(revalidator, timeout=5):
+    deadline = time.monotonic() + timeout
+    while revalidator.stats()['refreshing'] and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def expire(app, lat, lon):
+    """Age a location's cached entries past their TTL (but inside the stale window)"""
+    for units in app.UNIT_SYSTEMS:
+        key = app.get_cache_key(lat, lon, units)
+        data, _ = app.weather_cache.get_entry(key)
+        app.weather_cache.put(key, data, timestamp=time.time() - app.CACHE_DURATION - 1)
+
+
+def test_failed_background_refresh_counts_as_failure(weather_app, stub):
+    client = weather_app.app.test_client()
+    assert client.post('/api/weather', json=PARIS).status_code == 200
+    expire(weather_app, PARIS['lat'], PARIS['lon'])
+    key = weather_app.get_cache_key(PARIS['lat'], PARIS['lon'], 'metric')
+    before = weather_app.weather_revalidator.stats()
+
+    # Every upstream call fails: the stale entry is still served
+    stub.error_rate = 1.0
+    assert client.post('/api/weather', json=PARIS).status_code == 200
+    wait_for_refreshes(weather_app.weather_revalidator)
+
+    after = weather_app.weather_revalidator.stats()
+    assert after['failures'] == before['failures'] + 1
+    # Not recorded as refreshed, so the next stale hit tries again
+    assert weather_app.weather_revalidator._timestamps[key] < time.time() - weather_app.CACHE_DURATION
+    assert weather_app.weather_revalidator.revalidate(key)
+    wait_for_refreshes(weather_app.weather_revalidator)
+
+
+def test_refresh_raising_is_counted():
+    cache = WeatherCache(60, stale_window=60, clock=Clock())
+    revalidator = Revalidator(cache, top_n=0, clock=cache.clock)
+
+    def refresh(seen):
+        raise RefreshFailed('upstream down')
+
+    cache.put('k', {'v': 1})
+    cache.clock.now += 61
+    assert revalidator.get('k', refresh) == {'v': 1}
+    assert revalidator.stats()['failures'] == 1
+    assert revalidator.stats()['refreshing'] == 0
+
+
+def test_stale_l1_entry_defers_to_newer_l2_entry(tmp_path):
+    clock = Clock()
+    shared = SQLiteCache(str(tmp_path / 'cache.sqlite3'), 60, clock=clock, stale_window=60)
+    worker_a = TieredCache(WeatherCache(60, clock=clock, stale_window=60), shared)
+    worker_b = TieredCache(WeatherCache(60, clock=clock, stale_window=60), shared)
+
+    worker_a.put('k', {'v': 1})
+    clock.now += 61
+    # Worker B refreshes the key; worker A's L1 copy is now stale
+    worker_b.put('k', {'v': 2})
+    assert worker_a.get_entry('k', allow_stale=True) == ({'v': 2}, clock.now)
+    assert worker_a.l1.get_entry('k') == ({'v': 2}, clock.now)
+
+
+def test_refresh_skips_fetch_when_another_worker_refreshed(weather_app, stub, tmp_path, monkeypatch):
+    shared = SQLiteCache(str(tmp_path / 'cache.sqlite3'), weather_app.CACHE_DURATION,
+                         stale_window=weather_app.CACHE_STALE_WINDOW)
+    tiered = TieredCache(WeatherCache(weather_app.CACHE_DURATION, stale_window=weather_app.CACHE_STALE_WINDOW), shared)
+    monkeypatch.setattr(weather_app, 'weather_cache', tiered)
+    monkeypatch.setattr(weather_app.weather_revalidator, 'cache', tiered)
+    client = weather_app.app.test_client()
+    assert client.post('/api/weather', json=PARIS).status_code == 200
+    key = weather_app.get_cache_key(PARIS['lat'], PARIS['lon'], 'metric')
+    data, _ = tiered.get_entry(key)
+    due = time.time() - weather_app.CACHE_DURATION - 1
+    tiered.put(key, data, timestamp=due)
+
+    # Another worker refreshed the location in the shared cache after this
+    # worker saw it stale: the refresh is answered by the re-check
+    shared.put(key, data, timestamp=due + 2)
+    calls = stub.total_calls()
+    weather_app.weather_revalidator._refreshers[key](due)
+    assert stub.total_calls() == calls
+
+    # Nothing newer than the due entry: the refresh fetches
+    weather_app.weather_revalidator._refreshers[key](due + 2)
+    assert stub.total_calls() > calls
+
+
+def test_stale_entry_served_while_refreshed_in_background(weather_app, stub):
+    client = weather_app.app.test_client()
+    assert client.post('/api/weather', json=PARIS).status_code == 200
+    expire(weather_app, PARIS['lat'], PARIS['lon'])
+    key = weather_app.get_cache_key(PARIS['lat'], PARIS['lon'], 'metric')
+    _, stale_timestamp = weather_app.weather_cache.get_entry(key, allow_stale=True)
+
+    # The upstream is slow, but the stale entry is answered straight away
+    stub.latency = 0.5
+    calls = stub.calls.get('/data/3.0/onecall', 0)
+    start = time.perf_counter()
+    response = client.post('/api/weather', json=PARIS)
+    assert response.status_code == 200 and response.get_json()['current']['city'] == 'Paris'
+    assert time.perf_counter() - start < 0.25
+
+    wait_for_refreshes(weather_app.weather_revalidator)
+    assert stub.calls['/data/3.0/onecall'] == calls + 1
+    _, timestamp = weather_app.weather_cache.get_entry(key)
+    assert timestamp > stale_timestamp
+
+
+def test_refresh_ahead_refreshes_hot_keys_near_expiry():
+    clock = Clock()
+    cache = WeatherCache(600, stale_window=600, clock=clock)
+    revalidator = Revalidator(cache, top_n=2, refresh_ahead=60, decay=0.5, clock=clock)
+    refreshed = []
+
+    def refresher(key):
+        def refresh(seen):
+            refreshed.append((key, seen))
+            cache.put(key, {'key': key})
+        return refresh
+
+    for key, requests in (('hot', 5), ('warm', 3), ('cold', 1)):
+        cache.put(key, {'key': key})
+        for _ in range(requests):
+            revalidator.get(key, refresher(key))
+
+    # Nothing expires within refresh_ahead yet
+    clock.now += 500
+    assert revalidator.refresh_hot() == []
+
+    # The two hottest keys are refreshed ahead of expiry, the cold one is not
+    clock.now += 50
+    assert sorted(revalidator.refresh_hot()) == ['hot', 'warm']
+    assert sorted(refreshed) == [('hot', 1000.0), ('warm', 1000.0)]
+    assert cache.get_entry('hot')[1] == clock.now
+    assert revalidator.stats()['hot_refreshes'] == 2
+
+    # Just refreshed: not due again
+    assert revalidator.refresh_hot() == []
+
+
+def test_request_counts_decay_until_forgotten():
+    clock = Clock()
+    revalidator = Revalidator(WeatherCache(600, clock=clock), top_n=5, decay=0.5, clock=clock)
+    revalidator.get('k', lambda seen: None)
+    assert revalidator.stats()['tracked_keys'] == 1
+    revalidator.refresh_hot()  # 1 -> 0.5
+    revalidator.refresh_hot()  # 0.5 -> 0.25: forgotten
+    assert revalidator.stats()['tracked_keys'] == 0
@@ -0,0 +1,122 @@
+"""Circuit breaker state transitions, alone and guarding One Call 3.0"""
+
+import pytest
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from stub_upstream import ROUTES
+
+ONE_CALL = 'data/3.0/onecall'
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=3, probe_interval=60, clock=Clock())
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED and breaker.allow()
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.rejected == 1
+
+
+def test_half_open_lets_one_probe_through():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=60, clock=clock)
+    breaker.record_failure()
+    clock.now = 59
+    assert breaker.state == OPEN
+    clock.now = 60
+    assert breaker.state == HALF_OPEN
+
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED and breaker.allow()
+
+
+def test_failed_probe_reopens_for_another_interval():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=60, clock=clock)
+    breaker.record_failure()
+    clock.now = 60
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    clock.now = 119
+    assert not breaker.allow()
+    clock.now = 120
+    assert breaker.state == HALF_OPEN
+
+
+def test_released_probe_can_be_retried():
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=60, clock=clock)
+    breaker.record_failure()
+    clock.now = 60
+    assert breaker.allow()
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_disabled_breaker_never_opens():
+    breaker = CircuitBreaker(failure_threshold=0)
+    for _ in range(10):
+        breaker.record_failure()
+    assert breaker.allow() and breaker.state == CLOSED
+
+
+@pytest.fixture
+def one_call_breaker(weather_app, stub, monkeypatch):
+    """A fake-clocked breaker on One Call 3.0, which the stub answers with
+    401 until one_call_up is set"""
+    import upstream
+
+    clock = Clock()
+    breaker = CircuitBreaker(failure_threshold=3, probe_interval=60, clock=clock)
+    monkeypatch.setitem(upstream.breakers, ONE_CALL, breaker)
+    state = {'up': False}
+    monkeypatch.setitem(stub.routes, f"/{ONE_CALL}", lambda params: (
+        ROUTES[f"/{ONE_CALL}"](params) if state['up'] else (401, {'cod': 401, 'message': 'Invalid API key'})))
+    return breaker, clock, state
+
+
+def cold_weather(client, lat):
+    response = client.post('/api/weather', json={'lat': lat, 'lon': 20, 'city': 'Test', 'units': 'metric'})
+    assert response.status_code == 200
+    return response.get_json()
+
+
+def test_breaker_skips_one_call_while_it_is_down_and_recovers(weather_app, stub, one_call_breaker):
+    breaker, clock, state = one_call_breaker
+    client = weather_app.app.test_client()
+    one_call_calls = lambda: stub.calls.get(f"/{ONE_CALL}", 0)
+
+    # Three failures open the breaker; later misses go straight to the
+    # 2.5 fallback (whose responses carry a country)
+    for i in range(3):
+        assert cold_weather(client, 10 + i)['current']['country']
+    assert breaker.state == OPEN
+    before = one_call_calls()
+    assert cold_weather(client, 20)['current']['country']
+    assert one_call_calls() == before
+
+    # After the probe interval one probe reaches One Call, which is back
+    clock.now = 60
+    assert breaker.state == HALF_OPEN
+    state['up'] = True
+    data = cold_weather(client, 30)
+    assert one_call_calls() == before + 1
+    assert breaker.state == CLOSED
+    assert data['current']['country'] == ''
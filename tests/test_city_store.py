@@ -0,0 +1,70 @@
+"""Compiling the cities sidecar"""
+
+import json
+import os
+import threading
+
+import pytest
+
+import city_store
+from city_store import CityStore, build_sections, load_city_store, sidecar_path, write_sidecar
+
+CITIES = [
+    {'name': 'Paris', 'country': 'FR', 'lat': 48.85, 'lon': 2.35, 'population': 2100000},
+    {'name': 'Lyon', 'country': 'FR', 'lat': 45.76, 'lon': 4.83, 'population': 500000},
+]
+
+
+def test_concurrent_writers_leave_one_complete_sidecar(tmp_path):
+    path = str(tmp_path / 'cities.bin')
+    sections = build_sections(CITIES)
+    errors = []
+
+    def write():
+        try:
+            write_sidecar(sections, path)
+        except Exception as e:
+            errors.append(e)
+
+    writers = [threading.Thread(target=write) for _ in range(8)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+    assert not errors
+    assert len(CityStore.open(path)) == 2
+    assert os.listdir(tmp_path) == ['cities.bin']
+
+
+def test_failed_write_keeps_the_old_sidecar(tmp_path, monkeypatch):
+    path = str(tmp_path / 'cities.bin')
+    write_sidecar(build_sections(CITIES), path)
+
+    def fail(sections):
+        raise OSError('disk full')
+    monkeypatch.setattr(city_store, 'serialize_sections', fail)
+    with pytest.raises(OSError):
+        write_sidecar(build_sections(CITIES[:1]), path)
+    assert os.listdir(tmp_path) == ['cities.bin']
+    assert len(CityStore.open(path)) == 2
+
+
+def test_read_only_static_dir_falls_back_to_temp_dir(tmp_path, monkeypatch):
+    static = tmp_path / 'static'
+    static.mkdir()
+    json_path = static / 'cities.json'
+    json_path.write_text(json.dumps(CITIES))
+    fallback = tmp_path / 'tmp'
+    fallback.mkdir()
+    monkeypatch.setattr(city_store, 'fallback_sidecar_path', lambda path: str(fallback / 'cities.bin'))
+    mkstemp = city_store.tempfile.mkstemp
+
+    def read_only_static(dir, **kwargs):
+        if dir == str(static):
+            raise PermissionError(13, 'Read-only file system', dir)
+        return mkstemp(dir=dir, **kwargs)
+    monkeypatch.setattr(city_store.tempfile, 'mkstemp', read_only_static)
+
+    assert len(load_city_store(str(json_path))) == 2
+    assert sorted(os.listdir(static)) == ['cities.json']
+    assert os.listdir(fallback) == ['cities.bin']
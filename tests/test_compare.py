@@ -0,0 +1,56 @@
+"""/api/compare: typed city names resolve locally only on an exact match"""
+
+import json
+
+import pytest
+
+from city_index import CityIndex
+from city_store import CityStore
+
+CITIES = [
+    {'name': 'London', 'country': 'GB', 'lat': 51.51, 'lon': -0.13, 'population': 8900000},
+    {'name': 'London', 'country': 'CA', 'lat': 42.98, 'lon': -81.25, 'population': 400000},
+    {'name': 'Paris', 'country': 'FR', 'lat': 48.85, 'lon': 2.35, 'population': 2100000},
+    {'name': 'Paris', 'country': 'US', 'lat': 33.66, 'lon': -95.56, 'population': 25000},
+]
+
+
+@pytest.fixture
+def index():
+    return CityIndex(CityStore.from_cities(CITIES))
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('London', ('London', 'GB')),
+    ('  london ', ('London', 'GB')),
+    ('London, CA', ('London', 'CA')),
+    ('paris, us', ('Paris', 'US')),
+])
+def test_exact_names_resolve(index, name, expected):
+    place = index.resolve(name)
+    assert (place['name'], place['country']) == expected
+
+
+@pytest.mark.parametrize('name', ['London, US', 'Paris, TX', 'a', 'ondo', 'Lond', 'Springfield', ', GB'])
+def test_partial_unknown_or_mismatched_names_do_not_resolve(index, name):
+    assert index.resolve(name) is None
+
+
+@pytest.fixture
+def compare_app(weather_app, tmp_path, monkeypatch):
+    path = tmp_path / 'cities.json'
+    path.write_text(json.dumps(CITIES))
+    monkeypatch.setattr(weather_app, 'CITIES_PATH', str(path))
+    monkeypatch.setattr(weather_app, '_city_places', {})
+    return weather_app
+
+
+def test_compare_rows_are_the_typed_cities(compare_app, stub):
+    client = compare_app.app.test_client()
+    response = client.post('/api/compare', json={'cities': ['London, CA', 'Paris, TX', 'ondo']})
+    assert response.status_code == 200
+    rows = response.get_json()
+    assert [(row['city'], row['country']) for row in rows[:1]] == [('London', 'CA')]
+    # Names the local database doesn't have go to the current weather API as typed
+    assert [row['city'] for row in rows[1:]] == ['Paris, TX', 'ondo']
+    assert stub.calls['/data/2.5/weather'] == 2
@@ -0,0 +1,44 @@
+"""Cached /api/weather bodies: one strong ETag per content-coding"""
+
+from encoded_response import EncodedResponse
+
+PARIS = {'lat': 48.85, 'lon': 2.35, 'city': 'Paris', 'units': 'metric'}
+
+
+def test_each_coding_has_its_own_etag():
+    encoded = EncodedResponse(b'{"a":1}' * 500)
+    assert encoded.coded_etag(None) == encoded.etag
+    assert encoded.coded_etag('gzip') == f"{encoded.etag}-gzip"
+    assert encoded.coding({'gzip'}) == 'gzip'
+    assert encoded.coding(()) is None
+    # Too small to be worth compressing
+    assert EncodedResponse(b'{}').coding({'gzip'}) is None
+
+
+def test_304_only_for_the_representation_the_client_has(weather_app, stub, monkeypatch):
+    monkeypatch.setattr('encoded_response.brotli', None)
+    client = weather_app.app.test_client()
+    client.post('/api/weather', json=PARIS)
+
+    identity = client.post('/api/weather', json=PARIS, headers={'Accept-Encoding': 'identity'})
+    gzipped = client.post('/api/weather', json=PARIS, headers={'Accept-Encoding': 'gzip'})
+    assert identity.status_code == gzipped.status_code == 200
+    assert gzipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Content-Encoding' not in identity.headers
+    assert identity.headers['ETag'] != gzipped.headers['ETag']
+    assert gzipped.headers['ETag'] == identity.headers['ETag'][:-1] + '-gzip"'
+    for response in (identity, gzipped):
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    # The identity ETag does not validate the gzip body, nor the reverse
+    revalidated = client.post('/api/weather', json=PARIS, headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': identity.headers['ETag']})
+    assert revalidated.status_code == 200 and revalidated.headers['ETag'] == gzipped.headers['ETag']
+    revalidated = client.post('/api/weather', json=PARIS, headers={
+        'Accept-Encoding': 'identity', 'If-None-Match': gzipped.headers['ETag']})
+    assert revalidated.status_code == 200
+
+    not_modified = client.post('/api/weather', json=PARIS, headers={
+        'Accept-Encoding': 'gzip', 'If-None-Match': gzipped.headers['ETag']})
+    assert not_modified.status_code == 304
+    assert not_modified.headers['ETag'] == gzipped.headers['ETag']
@@ -0,0 +1,76 @@
+"""/api/weather's concurrent upstream calls under one request budget"""
+
+import time
+
+import pytest
+
+from stub_upstream import latency_distribution
+
+BUDGET = 0.5
+SLOW = 2.0
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    import upstream
+
+    monkeypatch.setattr(upstream, 'REQUEST_BUDGET', BUDGET)
+    return BUDGET
+
+
+def timed_weather(client, body):
+    start = time.perf_counter()
+    response = client.post('/api/weather', json=dict(body, units='metric'))
+    return response, time.perf_counter() - start
+
+
+def test_calls_run_concurrently(weather_app, stub):
+    stub.latency = 0.2
+    response, elapsed = timed_weather(weather_app.app.test_client(), {'lat': 40, 'lon': 10})
+    assert response.status_code == 200
+    # One Call, air quality and reverse geocoding in parallel, not in series
+    assert {'/data/3.0/onecall', '/data/2.5/air_pollution', '/geo/1.0/reverse'} <= set(stub.calls)
+    assert elapsed < 0.5
+
+
+def test_slow_air_quality_is_dropped_at_the_deadline(weather_app, stub, budget):
+    stub.latency = latency_distribution(f"/data/2.5/air_pollution={SLOW};0.01")
+    response, elapsed = timed_weather(weather_app.app.test_client(), {'lat': 41, 'lon': 11, 'city': 'Test'})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['air_quality'] is None
+    assert data['current']['city'] == 'Test' and data['hourly']
+    assert elapsed < budget + 0.3
+
+
+def test_slow_reverse_geocoding_leaves_the_city_unknown(weather_app, stub, budget):
+    stub.latency = latency_distribution(f"/geo/1.0/reverse={SLOW};0.01")
+    response, elapsed = timed_weather(weather_app.app.test_client(), {'lat': 42, 'lon': 12})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['current']['city'] == 'Unknown Location'
+    assert data['air_quality'] is not None
+    assert elapsed < budget + 0.3
+
+
+def test_failed_air_quality_call_does_not_fail_the_request(weather_app, stub, monkeypatch):
+    monkeypatch.setitem(stub.routes, '/data/2.5/air_pollution', lambda params: (500, {'cod': 500}))
+    response, _ = timed_weather(weather_app.app.test_client(), {'lat': 43, 'lon': 13, 'city': 'Test'})
+    assert response.status_code == 200
+    assert response.get_json()['air_quality'] is None
+
+
+def test_one_call_failure_falls_back_to_2_5(weather_app, stub, monkeypatch):
+    monkeypatch.setitem(stub.routes, '/data/3.0/onecall', lambda params: (500, {'cod': 500}))
+    response, _ = timed_weather(weather_app.app.test_client(), {'lat': 44, 'lon': 14, 'city': 'Test'})
+    assert response.status_code == 200
+    # Only the 2.5 current weather payload carries a country
+    assert response.get_json()['current']['country']
+    assert stub.calls['/data/2.5/weather'] == 1 and stub.calls['/data/2.5/forecast'] == 1
+
+
+def test_everything_failing_is_an_error(weather_app, stub):
+    stub.error_rate = 1.0
+    response, _ = timed_weather(weather_app.app.test_client(), {'lat': 45, 'lon': 15, 'city': 'Test'})
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
@@ -0,0 +1,58 @@
+"""Batched One Call normalization, alone and behind /api/weather/batch"""
+
+import json
+import random
+
+import pytest
+
+import forecast_batch
+from bench_batch_normalize import canonical, make_item, scalar
+
+BATCH = [{'lat': 10.5 + i, 'lon': 20.5 + i, 'name': f"City {i}"} for i in range(6)]
+
+
+def test_batch_matches_scalar_path():
+    pytest.importorskip('numpy')
+    items = [make_item(random.Random(seed)) for seed in range(100)]
+    assert canonical(forecast_batch.from_one_call_batch(items)) == canonical(scalar(items))
+
+
+def test_small_batches_use_the_scalar_path():
+    items = [make_item(random.Random(seed)) for seed in range(forecast_batch.MIN_BATCH_ITEMS - 1)]
+    assert canonical(forecast_batch.from_one_call_batch(items)) == canonical(scalar(items))
+
+
+def without_local_time(data):
+    return json.dumps(dict(data, current=dict(data['current'], local_time=None)), sort_keys=True)
+
+
+def test_batch_misses_are_normalized_together(weather_app, stub, monkeypatch):
+    batches = []
+
+    def spy(items, *args):
+        batches.append(len(items))
+        return forecast_batch.from_one_call_batch(items, *args)
+    monkeypatch.setattr(weather_app, 'from_one_call_batch', spy)
+    client = weather_app.app.test_client()
+    body = client.post('/api/weather/batch', json={'locations': BATCH, 'units': 'imperial'}).get_json()
+    assert batches == [len(BATCH)]
+    assert body['fetched'] == len(BATCH) and body['failed'] == 0
+
+    # Identical to what /api/weather serves for each location
+    calls = stub.total_calls()
+    for location, result in zip(BATCH, body['results']):
+        single = client.post('/api/weather', json=dict(location, city=location['name'], units='imperial'))
+        assert without_local_time(single.get_json()) == without_local_time(result['data'])
+    assert stub.total_calls() == calls
+
+
+def test_batch_settles_claimed_flights(weather_app, stub, monkeypatch):
+    # One Call failing for one location falls back to 2.5 for it alone
+    one_call = stub.routes['/data/3.0/onecall']
+    monkeypatch.setitem(stub.routes, '/data/3.0/onecall', lambda params: (
+        (500, {'cod': 500}) if float(params['lat']) == 10.5 else one_call(params)))
+    client = weather_app.app.test_client()
+    body = client.post('/api/weather/batch', json={'locations': BATCH}).get_json()
+    assert [result['status'] for result in body['results']] == ['ok'] * len(BATCH)
+    assert body['results'][0]['data']['current']['country']
+    assert weather_app.weather_flights.stats()['in_flight'] == 0
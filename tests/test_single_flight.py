@@ -0,0 +1,32 @@
+"""SingleFlight coalescing, including flights claimed by a batch"""
+
+import threading
+
+from single_flight import SingleFlight
+
+
+def test_claimed_flight_is_shared_when_settled():
+    flights = SingleFlight(timeout=5)
+    assert flights.claim('k')
+    assert not flights.claim('k')
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(flights.do('k', lambda: 'fetched again')))
+    waiter.start()
+    while not flights.stats()['coalesced']:
+        pass
+    flights.settle('k', 'batched')
+    waiter.join()
+    assert results == ['batched']
+    assert flights.stats()['in_flight'] == 0
+
+
+def test_nothing_is_claimed_with_file_locks(tmp_path):
+    assert not SingleFlight(lock_dir=str(tmp_path)).claim('k')
+    assert not SingleFlight(enabled=False).claim('k')
+
+
+def test_lock_files_are_striped(tmp_path):
+    flights = SingleFlight(lock_dir=str(tmp_path), lock_stripes=4)
+    keys = [f"weather:{i}" for i in range(50)]
+    assert [flights.do(key, lambda key=key: key) for key in keys] == keys
+    assert 0 < len(list(tmp_path.iterdir())) <= 4
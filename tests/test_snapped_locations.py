@@ -0,0 +1,58 @@
+"""Requests snapped to one cache entry each get their own location back"""
+
+# Both inside one 0.01 degree grid cell
+FIRST = {'lat': 40.001, 'lon': 10.001}
+SECOND = {'lat': 40.003, 'lon': 10.004}
+
+
+def current(response):
+    assert response.status_code == 200
+    return response.get_json()['current']
+
+
+def test_cache_hit_carries_the_requesters_location(weather_app, stub):
+    client = weather_app.app.test_client()
+    assert weather_app.get_cache_key(FIRST['lat'], FIRST['lon'], 'metric') == \
+        weather_app.get_cache_key(SECOND['lat'], SECOND['lon'], 'metric')
+
+    first = current(client.post('/api/weather', json=dict(FIRST, city='My Home')))
+    calls = stub.total_calls()
+    second = current(client.post('/api/weather', json=dict(SECOND, city='Office', units='imperial')))
+    assert stub.total_calls() == calls
+    assert (first['city'], first['lat'], first['lon']) == ('My Home', 40.001, 10.001)
+    assert (second['city'], second['lat'], second['lon']) == ('Office', 40.003, 10.004)
+
+    # A request without a name gets the place at the coordinates, not a
+    # name another requester typed
+    unnamed = current(client.post('/api/weather', json=SECOND))
+    assert unnamed['city'] != 'My Home'
+    assert (unnamed['lat'], unnamed['lon']) == (40.003, 10.004)
+    # Encoded hits are not shared across locations either
+    again = current(client.post('/api/weather', json=dict(FIRST, city='My Home')))
+    assert (again['city'], again['lat']) == ('My Home', 40.001)
+
+
+def test_batch_and_favorites_overlay_each_location(weather_app, stub):
+    client = weather_app.app.test_client()
+    response = client.post('/api/weather/batch', json={'locations': [
+        dict(FIRST, name='A'), dict(SECOND, name='B'), dict(SECOND, name='B')
+    ]})
+    results = response.get_json()['results']
+    assert response.get_json()['unique_locations'] == 1
+    assert [(r['data']['current']['city'], r['data']['current']['lat']) for r in results] == \
+        [('A', 40.001), ('B', 40.003), ('B', 40.003)]
+
+    response = client.post('/api/favorites/bulk', json={'favorites': [dict(FIRST, name='A'), dict(SECOND, name='B')]})
+    results = response.get_json()['results']
+    assert response.get_json()['cached_count'] == 2
+    assert [(r['data']['current']['city'], r['data']['current']['lon']) for r in results] == \
+        [('A', 10.001), ('B', 10.004)]
+
+
+def test_named_fill_still_names_the_entry_for_later_unnamed_requests(weather_app, stub):
+    # No local cities database: the name comes from reverse geocoding
+    client = weather_app.app.test_client()
+    assert current(client.post('/api/weather', json=dict(FIRST, city='Rome')))['city'] == 'Rome'
+    assert stub.calls['/geo/1.0/reverse'] == 1
+    unnamed = current(client.post('/api/weather', json=SECOND))
+    assert unnamed['city'] not in ('Rome', 'Unknown Location')
@@ -0,0 +1,145 @@
+"""upstream.get()/get_async(): retries, and the budget they spend"""
+
+import asyncio
+import time
+
+import pytest
+import requests
+
+from circuit_breaker import OPEN, CircuitBreaker
+from rate_limit import INTERACTIVE, TokenBucket
+
+PATH = 'data/2.5/weather'
+PARAMS = {'lat': 1, 'lon': 2}
+
+
+@pytest.fixture
+def upstream(stub, monkeypatch):
+    """upstream with two retries, no backoff and a 60-token budget that
+    does not refill during the test"""
+    import upstream
+
+    monkeypatch.setattr(upstream, 'RETRIES', 2)
+    monkeypatch.setattr(upstream, 'RETRY_BACKOFF', 0.0)
+    monkeypatch.setattr(upstream, 'limiter', TokenBucket(0.001, 60))
+    return upstream
+
+
+def fail_with(stub, monkeypatch, status, times):
+    """Answer PATH with status for the first `times` calls"""
+    route = stub.routes[f"/{PATH}"]
+    calls = []
+
+    def flaky(params):
+        calls.append(params)
+        return (status, {'cod': status}) if len(calls) <= times else route(params)
+    monkeypatch.setitem(stub.routes, f"/{PATH}", flaky)
+    return calls
+
+
+def wait_out_abandoned_attempt(stub):
+    """Let the stub finish answering an attempt the client gave up on, so it
+    is not routed to the next test's handler"""
+    time.sleep(stub.latency)
+    stub.latency = 0.0
+
+
+def test_rate_limit_is_off_by_default():
+    import upstream
+
+    assert upstream.RATE_PER_MINUTE == 0 and not upstream.limiter.enabled
+
+
+def test_retries_take_tokens(upstream, stub, monkeypatch):
+    calls = fail_with(stub, monkeypatch, 503, times=2)
+    assert upstream.get(PATH, PARAMS).status_code == 200
+    assert len(calls) == 3
+    assert upstream.limiter.granted[INTERACTIVE] == 3
+
+
+def test_client_errors_are_not_retried(upstream, stub, monkeypatch):
+    calls = fail_with(stub, monkeypatch, 429, times=1)
+    assert upstream.get(PATH, PARAMS).status_code == 429
+    assert len(calls) == 1
+
+
+def test_last_retry_answer_is_returned(upstream, stub, monkeypatch):
+    calls = fail_with(stub, monkeypatch, 502, times=5)
+    assert upstream.get(PATH, PARAMS).status_code == 502
+    assert len(calls) == 3
+
+
+def test_retry_refused_when_budget_runs_out(upstream, stub, monkeypatch):
+    monkeypatch.setattr(upstream, 'limiter', TokenBucket(0.001, 2, max_waits=(0.0, 0.0, 0.0)))
+    breaker = CircuitBreaker(failure_threshold=1, probe_interval=60)
+    monkeypatch.setitem(upstream.breakers, PATH, breaker)
+    calls = fail_with(stub, monkeypatch, 503, times=5)
+    with pytest.raises(upstream.RateLimited):
+        upstream.get(PATH, PARAMS)
+    assert len(calls) == 2
+    # The attempts that were made failed, so the breaker counts the failure
+    assert breaker.state == OPEN
+
+
+def test_connection_errors_are_retried(upstream, monkeypatch):
+    monkeypatch.setattr(upstream, 'BASE_URL', 'http://127.0.0.1:9')
+    with pytest.raises(requests.exceptions.ConnectionError):
+        upstream.get(PATH, PARAMS, timeout=1)
+    assert upstream.limiter.granted[INTERACTIVE] == 3
+
+
+def test_attempts_are_capped_by_the_deadline(upstream, stub, monkeypatch):
+    monkeypatch.setattr(upstream, 'RETRIES', 5)
+    fail_with(stub, monkeypatch, 503, times=10)
+    stub.latency = 0.3
+    start = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        upstream.get(PATH, PARAMS, timeout=10, deadline=upstream.Deadline(0.5))
+    assert time.perf_counter() - start < 0.8
+    # The second attempt got what was left of the budget, and no third was made
+    assert upstream.limiter.granted[INTERACTIVE] == 2
+    wait_out_abandoned_attempt(stub)
+
+
+def test_no_retry_backs_off_past_the_deadline(upstream, stub, monkeypatch):
+    monkeypatch.setattr(upstream, 'RETRY_BACKOFF', 1.0)
+    calls = fail_with(stub, monkeypatch, 503, times=5)
+    start = time.perf_counter()
+    assert upstream.get(PATH, PARAMS, deadline=upstream.Deadline(0.5)).status_code == 503
+    assert time.perf_counter() - start < 0.5
+    assert len(calls) == 1
+
+
+def test_async_retries_take_tokens(upstream, stub, monkeypatch):
+    pytest.importorskip('httpx')
+    calls = fail_with(stub, monkeypatch, 503, times=2)
+
+    async def run():
+        try:
+            return (await upstream.get_async(PATH, PARAMS)).status_code
+        finally:
+            await upstream.close_async_client()
+
+    assert asyncio.run(run()) == 200
+    assert len(calls) == 3
+    assert upstream.limiter.granted[INTERACTIVE] == 3
+
+
+def test_async_attempts_are_capped_by_the_deadline(upstream, stub, monkeypatch):
+    pytest.importorskip('httpx')
+    monkeypatch.setattr(upstream, 'RETRIES', 5)
+    fail_with(stub, monkeypatch, 503, times=10)
+    stub.latency = 0.3
+
+    async def run():
+        try:
+            await upstream.get_async(PATH, PARAMS, timeout=10, deadline=upstream.Deadline(0.5))
+        finally:
+            await upstream.close_async_client()
+
+    start = time.perf_counter()
+    with pytest.raises(requests.exceptions.Timeout):
+        asyncio.run(run())
+    assert time.perf_counter() - start < 0.8
+    assert upstream.limiter.granted[INTERACTIVE] == 2
+    wait_out_abandoned_attempt(stub)
@@ -0,0 +1,30 @@
+"""/api/weather/batch rejects bad views and units item by item"""
+
+import pytest
+
+BAD = [['x'], {'a': 1}, 1]
+
+
+@pytest.mark.parametrize('value', BAD)
+@pytest.mark.parametrize('field', ['view', 'units'])
+def test_bad_item_value_is_invalid(weather_app, stub, field, value):
+    client = weather_app.app.test_client()
+    response = client.post('/api/weather/batch', json={'locations': [
+        {'lat': 1, 'lon': 2, field: value}, {'lat': 3, 'lon': 4}
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == ['invalid', 'ok']
+
+
+@pytest.mark.parametrize('value', BAD)
+@pytest.mark.parametrize('field', ['view', 'units'])
+def test_bad_top_level_value_invalidates_every_item(weather_app, stub, field, value):
+    client = weather_app.app.test_client()
+    response = client.post('/api/weather/batch', json={field: value, 'locations': [
+        {'lat': 1, 'lon': 2}, {'lat': 3, 'lon': 4, field: 'summary' if field == 'view' else 'imperial'}
+    ]})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [r['status'] for r in results] == ['invalid', 'ok']
+    assert stub.total_calls() > 0
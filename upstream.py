@@ -0,0 +1,442 @@
+"""Shared plumbing for calls to the OpenWeatherMap API.
+
+Independent upstream requests (One Call, air quality, reverse geocoding,
+the 2.5 fallbacks) are submitted to one per-process thread pool so a cold
+/api/weather costs roughly the slowest call instead of the sum of all of
+them.  Each request gets a Deadline; neither the waits nor the calls and
+retries made under it outlast its budget.
+
+Multi-location endpoints use batch(), which runs one task per location on a
+separate pool (so tasks can themselves fan out on the upstream pool without
+deadlocking it) with a bounded number in flight.
+
+Every HTTP call goes through get(): a keep-alive Session per worker process
+with tunable pool sizes and retries with backoff for transient failures,
+recording per-endpoint latency and connection reuse for stats() (and the
+latency in metrics: a histogram per endpoint and a Server-Timing phase of
+the request that made the call).  When UPSTREAM_RATE_PER_MINUTE is set,
+every attempt (retries included) also spends a token from a rate limiter
+shared by all workers (see rate_limit.py), at the priority of the request
+that made it: set with priority(), and carried into submit() and batch()
+tasks.  The limiter is off by default.  Endpoints with a circuit breaker
+(One Call 3.0) are not called at all while it is open.
+
+The ASGI mode (asgi.py) calls get_async() instead, which applies the same
+retries, budget, breakers and stats around a pooled httpx.AsyncClient.
+"""
+
+import contextvars
+import os
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures import wait as wait_futures
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+from circuit_breaker import CircuitBreaker
+from rate_limit import BACKGROUND, BULK, INTERACTIVE, PRIORITY_NAMES, TokenBucket
+
+BASE_URL = os.getenv("OPENWEATHER_BASE_URL", "https://api.openweathermap.org").rstrip('/')
+
+# Per-call timeout for a single upstream request, in seconds
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "10"))
+# Overall budget for all upstream work done while serving one request
+REQUEST_BUDGET = float(os.getenv("UPSTREAM_REQUEST_BUDGET", "15"))
+UPSTREAM_WORKERS = int(os.getenv("UPSTREAM_WORKERS", "16"))
+# Locations fetched at once by a single batch() call, and threads shared by all batches
+BATCH_CONCURRENCY = int(os.getenv("UPSTREAM_BATCH_CONCURRENCY", "8"))
+BATCH_WORKERS = int(os.getenv("UPSTREAM_BATCH_WORKERS", "32"))
+# Hosts with a kept-alive pool, and connections kept per host (defaults to
+# enough for every thread that may call upstream at once)
+POOL_CONNECTIONS = int(os.getenv("UPSTREAM_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("UPSTREAM_POOL_MAXSIZE", str(UPSTREAM_WORKERS + BATCH_WORKERS)))
+# Retries for connection errors, timeouts and 502/503/504, with exponential
+# backoff.  429s are not retried: waiting out the quota is the caller's decision.
+RETRIES = int(os.getenv("UPSTREAM_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.2"))
+RETRY_STATUSES = frozenset([502, 503, 504])
+# Upstream calls allowed per minute across all workers, and how many may be
+# made in a burst.  Off by default (0 = unlimited): set it to the API key's
+# quota.  The bucket is shared through UPSTREAM_RATE_STATE, by default a file
+# in the app's instance folder; set it empty to give each worker its own budget.
+RATE_PER_MINUTE = float(os.getenv("UPSTREAM_RATE_PER_MINUTE", "0"))
+RATE_BURST = float(os.getenv("UPSTREAM_RATE_BURST", str(RATE_PER_MINUTE)))
+RATE_STATE = os.getenv("UPSTREAM_RATE_STATE", os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'upstream-budget'))
+# Connections the ASGI mode's async client keeps open per worker
+ASYNC_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_ASYNC_MAX_CONNECTIONS", "200"))
+# One Call 3.0 is skipped after this many consecutive failures (0 = never),
+# with one probe call every ONE_CALL_PROBE_INTERVAL seconds until it recovers
+ONE_CALL_FAILURE_THRESHOLD = int(os.getenv("ONE_CALL_FAILURE_THRESHOLD", "3"))
+ONE_CALL_PROBE_INTERVAL = float(os.getenv("ONE_CALL_PROBE_INTERVAL", "60"))
+# Responses counted as the endpoint being unavailable (besides network
+# errors): no subscription for the API key, and server errors
+BREAKER_FAILURE_STATUSES = frozenset([401, 403])
+
+executor = ThreadPoolExecutor(max_workers=UPSTREAM_WORKERS, thread_name_prefix='upstream')
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='upstream-batch')
+
+_session_lock = threading.Lock()
+_async_client = None
+_async_client_loop = None
+_session = None
+_session_pid = None
+_adapter = None
+
+_stats_lock = threading.Lock()
+_endpoint_stats = {}
+call_seconds = metrics.REGISTRY.histogram(
+    'weather_upstream_request_seconds', 'Latency of OpenWeatherMap calls by endpoint', ('endpoint', 'outcome')
+)
+
+limiter = TokenBucket(RATE_PER_MINUTE / 60, RATE_BURST, path=RATE_STATE or None)
+_priority = contextvars.ContextVar('upstream_priority', default=INTERACTIVE)
+breakers = {
+    'data/3.0/onecall': CircuitBreaker(ONE_CALL_FAILURE_THRESHOLD, ONE_CALL_PROBE_INTERVAL)
+}
+
+BatchResult = namedtuple('BatchResult', ['value', 'error', 'elapsed'])
+
+
+class RateLimited(requests.exceptions.RequestException):
+    """The call was refused because the upstream budget ran out"""
+
+
+class CircuitOpen(requests.exceptions.RequestException):
+    """The call was not made because the endpoint's circuit breaker is open"""
+
+
+@contextmanager
+def priority(level):
+    """Make upstream calls in this block (and tasks it submits) at level:
+    INTERACTIVE, BULK or BACKGROUND"""
+    token = _priority.set(level)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def url(path):
+    """Absolute URL for an API path such as 'data/2.5/weather'"""
+    return f"{BASE_URL}/{path}"
+
+
+def _new_session():
+    # No retries in the adapter: get() retries, so each attempt takes a token
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session, adapter
+
+
+def get_session():
+    """The keep-alive Session of this worker process (recreated after a fork,
+    so workers never share sockets inherited from a preloading master)"""
+    global _session, _session_pid, _adapter
+    pid = os.getpid()
+    if _session_pid != pid:
+        with _session_lock:
+            if _session_pid != pid:
+                _session, _adapter = _new_session()
+                _session_pid = pid
+    return _session
+
+
+def _record(endpoint, elapsed, failed):
+    with _stats_lock:
+        stats = _endpoint_stats.get(endpoint)
+        if stats is None:
+            stats = _endpoint_stats[endpoint] = {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0}
+        stats['calls'] += 1
+        stats['errors'] += failed
+        stats['total_seconds'] += elapsed
+        stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+    call_seconds.observe(elapsed, endpoint, 'error' if failed else 'ok')
+    # Server-Timing phase of the request that made the call, e.g. upstream-onecall
+    metrics.record(f"upstream-{endpoint.rsplit('/', 1)[-1]}", elapsed, endpoint)
+
+
+def _admit(path, optional):
+    """(breaker or None, priority class) for a call to path about to be made.
+    Raises CircuitOpen if its breaker is open."""
+    breaker = breakers.get(path)
+    if breaker is not None and not breaker.allow():
+        raise CircuitOpen(f"{path} is unavailable (circuit open)")
+    level = _priority.get()
+    if optional:
+        level = min(level + 1, BACKGROUND)
+    return breaker, level
+
+
+def _refused(level):
+    return RateLimited(f"Upstream call budget exhausted ({PRIORITY_NAMES[level]} priority)")
+
+
+def _retry_delay(attempts, status_code=None, error=None, deadline=None):
+    """Seconds to back off before retrying a call whose attempts-th attempt
+    answered status_code or raised error; None if it is not retried, or if
+    the backoff would use up what is left of the deadline"""
+    if attempts > RETRIES:
+        return None
+    if error is not None:
+        retryable = isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+    else:
+        retryable = status_code in RETRY_STATUSES
+    if not retryable:
+        return None
+    delay = RETRY_BACKOFF * 2 ** (attempts - 1)
+    if deadline is not None and delay >= deadline.remaining():
+        return None
+    return delay
+
+
+def _attempt_timeout(timeout, deadline):
+    """Timeout for the next attempt: the per-call limit, capped by the
+    request's deadline if it has one"""
+    return timeout if deadline is None else deadline.timeout(timeout)
+
+
+def _attempted(path, elapsed, status_code):
+    """Record one attempt (status_code None: it raised)"""
+    _record(path, elapsed, status_code is None or status_code >= 400)
+    if status_code == 429:
+        limiter.exhaust()
+
+
+def _finish(breaker, attempts, status_code):
+    """Settle the breaker with the outcome of a call's last attempt (status_code
+    None: it raised), or release it if no attempt was made"""
+    if breaker is None:
+        return
+    if not attempts:
+        breaker.release()
+    elif status_code is None or status_code >= 500 or status_code in BREAKER_FAILURE_STATUSES:
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def get(path, params=None, timeout=None, optional=False, deadline=None):
+    """GET an API path through the pooled session, recording its latency.
+    Returns the requests Response; network errors raise RequestException,
+    and RateLimited when the call budget is exhausted (each retry takes a
+    token too).  Optional calls are made one priority class lower, so they
+    are the first to be dropped.  CircuitOpen is raised without calling an
+    endpoint whose breaker is open.  With a Deadline, no attempt outlasts
+    the request's budget and no retry starts after it has run out: the
+    last answer (or error) is returned as is."""
+    breaker, level = _admit(path, optional)
+    timeout = timeout or UPSTREAM_TIMEOUT
+    attempts = 0
+    status_code = None
+    try:
+        while True:
+            if not limiter.acquire(level, timeout=_attempt_timeout(timeout, deadline)):
+                raise _refused(level)
+            attempts += 1
+            status_code = None
+            start = time.perf_counter()
+            try:
+                response = get_session().get(url(path), params=params, timeout=_attempt_timeout(timeout, deadline))
+            except requests.exceptions.RequestException as e:
+                _attempted(path, time.perf_counter() - start, None)
+                delay = _retry_delay(attempts, error=e, deadline=deadline)
+                if delay is None:
+                    raise
+            else:
+                status_code = response.status_code
+                _attempted(path, time.perf_counter() - start, status_code)
+                delay = _retry_delay(attempts, status_code, deadline=deadline)
+                if delay is None:
+                    return response
+            time.sleep(delay)
+    finally:
+        _finish(breaker, attempts, status_code)
+
+
+def get_async_client():
+    """The httpx.AsyncClient of this worker's event loop (the ASGI mode)"""
+    # Imported here so the WSGI app doesn't pay for them at startup
+    import asyncio
+    import httpx
+
+    global _async_client, _async_client_loop
+    loop = asyncio.get_running_loop()
+    if _async_client_loop is not loop:
+        limits = httpx.Limits(max_connections=ASYNC_MAX_CONNECTIONS,
+                              max_keepalive_connections=ASYNC_MAX_CONNECTIONS)
+        # No transport retries: get_async() retries, so each attempt takes a token
+        _async_client = httpx.AsyncClient(transport=httpx.AsyncHTTPTransport(limits=limits))
+        _async_client_loop = loop
+    return _async_client
+
+
+async def close_async_client():
+    global _async_client, _async_client_loop
+    if _async_client is not None:
+        await _async_client.aclose()
+    _async_client = _async_client_loop = None
+
+
+async def get_async(path, params=None, timeout=None, optional=False, deadline=None):
+    """get() for coroutines, through this worker's httpx.AsyncClient.  The
+    response has the same status_code and json(), and network errors are
+    raised as requests exceptions, so callers handle both modes alike."""
+    import asyncio
+
+    breaker, level = _admit(path, optional)
+    timeout = timeout or UPSTREAM_TIMEOUT
+    # requests leaves out None parameters (e.g. a missing API key)
+    params = {key: value for key, value in (params or {}).items() if value is not None}
+    attempts = 0
+    status_code = None
+    try:
+        while True:
+            if not await limiter.acquire_async(level, timeout=_attempt_timeout(timeout, deadline)):
+                raise _refused(level)
+            attempts += 1
+            status_code = None
+            start = time.perf_counter()
+            try:
+                response = await _async_attempt(path, params, _attempt_timeout(timeout, deadline))
+            except requests.exceptions.RequestException as e:
+                _attempted(path, time.perf_counter() - start, None)
+                delay = _retry_delay(attempts, error=e, deadline=deadline)
+                if delay is None:
+                    raise
+            else:
+                status_code = response.status_code
+                _attempted(path, time.perf_counter() - start, status_code)
+                delay = _retry_delay(attempts, status_code, deadline=deadline)
+                if delay is None:
+                    return response
+            await asyncio.sleep(delay)
+    finally:
+        _finish(breaker, attempts, status_code)
+
+
+async def _async_attempt(path, params, timeout):
+    """One httpx GET, with its errors raised as requests exceptions"""
+    import httpx
+
+    try:
+        return await get_async_client().get(url(path), params=params, timeout=timeout)
+    except httpx.TimeoutException as e:
+        raise requests.exceptions.Timeout(str(e)) from e
+    except httpx.HTTPError as e:
+        raise requests.exceptions.ConnectionError(str(e)) from e
+
+
+def stats():
+    """Per-endpoint call counts and latency, plus connection reuse for this worker"""
+    with _stats_lock:
+        endpoints = {
+            endpoint: {
+                'calls': s['calls'],
+                'errors': s['errors'],
+                'avg_ms': round(s['total_seconds'] / s['calls'] * 1000, 1),
+                'max_ms': round(s['max_seconds'] * 1000, 1)
+            } for endpoint, s in _endpoint_stats.items()
+        }
+
+    new_connections = requests_sent = 0
+    if _adapter is not None:
+        pools = _adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            new_connections += pool.num_connections
+            requests_sent += pool.num_requests
+    return {
+        'endpoints': endpoints,
+        'budget': limiter.stats(),
+        'circuit_breakers': {path: breaker.stats() for path, breaker in breakers.items()},
+        'connections': {
+            'opened': new_connections,
+            'requests': requests_sent,
+            'reuse_rate': round(1 - new_connections / requests_sent, 3) if requests_sent else None
+        }
+    }
+
+
+class Deadline:
+    """Time budget shared by the upstream calls made for one request"""
+
+    def __init__(self, budget=None):
+        self.expires_at = time.monotonic() + (REQUEST_BUDGET if budget is None else budget)
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, per_call=None):
+        """Timeout for a call started now: the per-call limit capped by the budget"""
+        return max(0.001, min(UPSTREAM_TIMEOUT if per_call is None else per_call, self.remaining()))
+
+
+def submit(fn, *args, **kwargs):
+    """Run fn(*args, **kwargs) on the shared upstream pool, at the caller's priority"""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+def wait(future, deadline, default=None):
+    """Result of future, or default if the request budget runs out first.
+    Exceptions raised by the call propagate."""
+    try:
+        return future.result(timeout=deadline.remaining())
+    except FutureTimeoutError:
+        return default
+
+
+def _timed_call(fn, item):
+    start = time.perf_counter()
+    try:
+        return BatchResult(fn(item), None, time.perf_counter() - start)
+    except Exception as e:
+        return BatchResult(None, e, time.perf_counter() - start)
+
+
+def batch_iter(fn, items, max_concurrency=None):
+    """Call fn(item) for every item like batch(), yielding (index,
+    BatchResult) pairs in completion order, each as soon as its call
+    finishes"""
+    items = list(items)
+    limit = max(1, max_concurrency or BATCH_CONCURRENCY)
+    pending = {}
+    queued = iter(enumerate(items))
+
+    def fill():
+        for index, item in queued:
+            pending[batch_executor.submit(contextvars.copy_context().run, _timed_call, fn, item)] = index
+            if len(pending) >= limit:
+                return
+
+    fill()
+    while pending:
+        done, _ = wait_futures(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield pending.pop(future), future.result()
+        fill()
+
+
+def batch(fn, items, max_concurrency=None):
+    """Call fn(item) for every item with at most max_concurrency calls in
+    flight. Returns a BatchResult (value, error, elapsed seconds) per item, in
+    input order; an exception raised by fn is returned as its error.  Calls
+    run at the caller's priority."""
+    items = list(items)
+    results = [None] * len(items)
+    for index, result in batch_iter(fn, items, max_concurrency):
+        results[index] = result
+    return results
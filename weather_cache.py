@@ -0,0 +1,364 @@
+"""Cache backends for normalized weather responses.
+
+Every backend offers get/get_entry/put/delete/clear/stats, and app.py picks
+one with create_cache().  Entries are fresh for ttl seconds and then kept for
+a further stale_window, during which get_entry(key, allow_stale=True) still
+returns them so callers can serve stale data while they revalidate:
+
+- WeatherCache: bounded in-process LRU (the default, and the optional L1)
+- SQLiteCache: an on-disk store in WAL mode that every worker on the host
+  shares and that survives restarts
+- TieredCache: an in-process L1 in front of a shared L2
+
+WeatherCache entries live in an OrderedDict kept in least-recently-used order, so get and
+put are O(1).  Expiry is lazy: an entry past its TTL is dropped when it is
+next looked up (or when it reaches the LRU end), never by sweeping the whole
+cache.  Size is capped by entry count and optionally by approximate bytes
+(the entry's JSON length).
+
+location_key() snaps coordinates before they are hashed into cache keys, so
+nearby requests (browser geolocation jitter, the same city reached through
+search and through favorites) share one entry and one upstream fetch.
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+KEY_MODES = ('exact', 'grid', 'geohash', 'city')
+
+
+def geohash(lat, lon, precision):
+    """Standard base32 geohash of a point"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True
+    while len(chars) < precision:
+        bounds, coord = (lon_range, lon) if even else (lat_range, lat)
+        mid = (bounds[0] + bounds[1]) / 2
+        value <<= 1
+        if coord >= mid:
+            value |= 1
+            bounds[0] = mid
+        else:
+            bounds[1] = mid
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits = value = 0
+    return ''.join(chars)
+
+
+def location_key(lat, lon, mode='grid', grid_degrees=0.01, geohash_precision=6,
+                 nearest_city=None, city_max_km=10.0):
+    """Snap a coordinate pair to the location part of a cache key.
+
+    mode is one of KEY_MODES: 'exact' keeps the raw values, 'grid' rounds to
+    a grid_degrees lattice, 'geohash' uses a geohash_precision prefix, and
+    'city' maps the point to the nearest_city(lat, lon) -> (label, km) within
+    city_max_km, falling back to the grid.
+    """
+    if mode == 'exact':
+        return f"{lat}_{lon}"
+    try:
+        lat = float(lat)
+        lon = float(lon)
+    except (TypeError, ValueError):
+        return f"{lat}_{lon}"
+
+    if mode == 'city' and nearest_city is not None:
+        match = nearest_city(lat, lon)
+        if match and match[1] <= city_max_km:
+            return f"city:{match[0]}"
+    if mode == 'geohash':
+        return f"gh:{geohash(lat, lon, geohash_precision)}"
+    return f"grid{grid_degrees}:{round(lat / grid_degrees)}_{round(lon / grid_degrees)}"
+
+
+class WeatherCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss/eviction counters"""
+
+    def __init__(self, ttl, max_entries=5000, max_bytes=None, clock=time.time, stale_window=0):
+        self.ttl = ttl
+        self.stale_window = stale_window
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self._entries = OrderedDict()  # key -> (data, timestamp, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def get_entry(self, key, allow_stale=False):
+        """Return (data, timestamp) for key, or None if missing or expired.
+        With allow_stale, entries inside the stale window are returned too."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            age = self.clock() - entry[1]
+            if age >= self.ttl + self.stale_window:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if age >= self.ttl:
+                if not allow_stale:
+                    self.misses += 1
+                    return None
+                self.stale_hits += 1
+            else:
+                self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0], entry[1]
+
+    def get(self, key):
+        """Return the cached data for key, or None if missing or expired"""
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def put(self, key, data, timestamp=None):
+        """Store data under key, evicting least-recently-used entries over the caps.
+        timestamp defaults to now; tiers pass the L2 entry's age through."""
+        size = len(json.dumps(data, separators=(',', ':'))) if self.max_bytes else 0
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (data, self.clock() if timestamp is None else timestamp, size)
+            self._bytes += size
+            now = self.clock()
+            while self._entries and (
+                    (self.max_entries and len(self._entries) > self.max_entries)
+                    or (self.max_bytes and self._bytes > self.max_bytes)):
+                oldest_key, (_, timestamp, _) = next(iter(self._entries.items()))
+                self._remove(oldest_key)
+                if now - timestamp >= self.ttl + self.stale_window:
+                    self.expirations += 1
+                else:
+                    self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'bytes': self._bytes if self.max_bytes else None,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+
+class SQLiteCache:
+    """Weather cache in a SQLite database shared by all workers on a host.
+
+    WAL mode lets readers proceed while another worker writes.  Each thread
+    (and each forked process) opens its own connection.  Expired rows are
+    skipped on read and removed, along with the oldest rows beyond
+    max_entries, by an indexed delete every prune_interval writes.
+    """
+
+    def __init__(self, path, ttl, max_entries=50000, clock=time.time, prune_interval=100, stale_window=0):
+        self.path = path
+        self.ttl = ttl
+        self.stale_window = stale_window
+        self.max_entries = max_entries
+        self.clock = clock
+        self.prune_interval = prune_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS weather_cache '
+            '(key TEXT PRIMARY KEY, data TEXT NOT NULL, timestamp REAL NOT NULL)'
+        )
+        self._connection().execute(
+            'CREATE INDEX IF NOT EXISTS weather_cache_timestamp ON weather_cache (timestamp)'
+        )
+
+    def _connection(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            local.connection = connection
+            local.pid = os.getpid()
+        return local.connection
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM weather_cache').fetchone()[0]
+
+    def get_entry(self, key, allow_stale=False):
+        """Return (data, timestamp) for key, or None if missing or expired.
+        With allow_stale, entries inside the stale window are returned too."""
+        row = self._connection().execute(
+            'SELECT data, timestamp FROM weather_cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None:
+            self._count('misses')
+            return None
+        age = self.clock() - row[1]
+        if age >= self.ttl + (self.stale_window if allow_stale else 0):
+            self._count('misses')
+            return None
+        self._count('hits' if age < self.ttl else 'stale_hits')
+        return json.loads(row[0]), row[1]
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def put(self, key, data, timestamp=None):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO weather_cache (key, data, timestamp) VALUES (?, ?, ?)',
+            (key, json.dumps(data, separators=(',', ':')), self.clock() if timestamp is None else timestamp)
+        )
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_interval == 0
+        if prune:
+            self.prune()
+
+    def prune(self):
+        """Delete expired rows and the oldest rows beyond max_entries"""
+        connection = self._connection()
+        expired = connection.execute(
+            'DELETE FROM weather_cache WHERE timestamp <= ?', (self.clock() - self.ttl - self.stale_window,)
+        ).rowcount
+        self._count('expirations', expired)
+        if self.max_entries:
+            excess = len(self) - self.max_entries
+            if excess > 0:
+                evicted = connection.execute(
+                    'DELETE FROM weather_cache WHERE key IN '
+                    '(SELECT key FROM weather_cache ORDER BY timestamp LIMIT ?)', (excess,)
+                ).rowcount
+                self._count('evictions', evicted)
+
+    def delete(self, key):
+        self._connection().execute('DELETE FROM weather_cache WHERE key = ?', (key,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM weather_cache')
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            counters = {
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+        return dict({'backend': 'sqlite', 'path': self.path, 'entries': len(self),
+                     'max_entries': self.max_entries}, **counters)
+
+
+class TieredCache:
+    """In-process L1 in front of a shared L2; L2 hits are copied into L1 with
+    their original timestamp so they expire at the same time in both tiers.
+    A stale L1 entry is only returned if L2 has nothing newer (another
+    worker may have refreshed it)."""
+
+    def __init__(self, l1, l2):
+        self.l1 = l1
+        self.l2 = l2
+        self.ttl = l2.ttl
+        self.stale_window = l2.stale_window
+
+    def __len__(self):
+        return len(self.l2)
+
+    def get_entry(self, key, allow_stale=False):
+        entry = self.l1.get_entry(key, allow_stale)
+        if entry is None or self.l1.clock() - entry[1] >= self.ttl:
+            shared = self.l2.get_entry(key, allow_stale)
+            if shared is not None and (entry is None or shared[1] > entry[1]):
+                self.l1.put(key, shared[0], timestamp=shared[1])
+                return shared
+        return entry
+
+    def get(self, key):
+        entry = self.get_entry(key)
+        return entry[0] if entry else None
+
+    def put(self, key, data, timestamp=None):
+        timestamp = self.l2.clock() if timestamp is None else timestamp
+        self.l2.put(key, data, timestamp=timestamp)
+        self.l1.put(key, data, timestamp=timestamp)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def clear(self):
+        self.l1.clear()
+        self.l2.clear()
+
+    def stats(self):
+        return {'backend': 'tiered', 'l1': self.l1.stats(), 'l2': self.l2.stats()}
+
+
+def create_cache(backend, ttl, max_entries=5000, max_bytes=None, path=None, l1_entries=0, stale_window=0):
+    """Build the configured cache: 'memory', or 'sqlite' (at path, defaulting
+    to the temp directory) optionally fronted by an l1_entries-sized L1.
+    Entries are kept stale_window seconds past ttl for stale-while-revalidate."""
+    if backend == 'memory':
+        return WeatherCache(ttl, max_entries=max_entries, max_bytes=max_bytes, stale_window=stale_window)
+    if backend == 'sqlite':
+        shared = SQLiteCache(path or os.path.join(tempfile.gettempdir(), 'weatherapp-cache.sqlite3'),
+                             ttl, max_entries=max_entries, stale_window=stale_window)
+        if l1_entries:
+            l1 = WeatherCache(ttl, max_entries=l1_entries, max_bytes=max_bytes, stale_window=stale_window)
+            return TieredCache(l1, shared)
+        return shared
+    raise ValueError(f"Unknown weather cache backend: {backend}")